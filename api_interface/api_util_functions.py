@@ -1,6 +1,16 @@
 import berserk
+import os
 from requests_oauthlib import OAuth2Session
+import queue
+import sys
 import threading
+import time
+
+from legal_moves import LegalMoveTracker
+
+# the instrumentation layer is shared with the voice pipeline
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'audio_processing'))
+import metrics
 
 # reads Lichess account token from file account_token.txt
 API_TOKEN = ''
@@ -16,6 +26,17 @@ CHALLENGE_ENDPOINT = 'https://lichess.org/api/challenge/'
 
 GAME_OVER_CODES = ['mate', 'resign', 'timeout', 'outoftime', 'cheat']
 
+# seconds between game stream events, which wait on the opponent's moves and
+# so run from seconds to many minutes
+STREAM_EVENT_INTERVAL_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800)
+
+# legal moves of the game being played, kept current by integrated_game_manager
+legal_move_tracker = LegalMoveTracker()
+
+# moves recognized by the voice pipeline in algebraic notation, or None to
+# read moves from the command line
+voice_moves: queue.Queue or None = None
+
 
 def integrated_game_manager(game_id: str):
     """
@@ -24,11 +45,17 @@ def integrated_game_manager(game_id: str):
 
     am_white = False
     play_move_thread = None
+    last_event_time = time.monotonic()
 
     for event in client.board.stream_game_state(game_id):
+        metrics.count('stream_events_' + event['type'])
+        metrics.observe('stream_event_interval_seconds', time.monotonic() - last_event_time,
+                        STREAM_EVENT_INTERVAL_BUCKETS)
 
         # check for starting position
         if event['type'] == 'gameFull':
+            legal_move_tracker.reset(event.get('initialFen', 'startpos'))
+            legal_move_tracker.update(event['state']['moves'])
             if event['white']['id'] == client.account.get()['id']:
                 play_move_thread = threading.Thread(target=play_move, args=(game_id,))
                 play_move_thread.start()
@@ -42,6 +69,8 @@ def integrated_game_manager(game_id: str):
                 print('Game over by '+event['status'] +
                       '. Winner is '+event['winner']+'.')
             else:
+                with metrics.timer('legal_move_update'):
+                    legal_move_tracker.update(event['moves'])
 
                 # determine who made the last move
                 if (am_white and len(event['moves'].split()) % 2 == 0) or (not am_white and len(event['moves'].split()) % 2 != 0):
@@ -52,10 +81,30 @@ def integrated_game_manager(game_id: str):
         # chat message
         elif event['type'] == 'chatLine':
             print(event['username'] + ' says \''+event['text']+'\'')
+        last_event_time = time.monotonic()
+
+
+def set_voice_moves(moves: queue.Queue or None):
+    """
+    Makes play_move take the user's moves from the provided queue, which the
+    voice pipeline fills with every move it recognizes.
+
+    Parameters
+        moves (queue.Queue): recognized moves in algebraic notation, or None
+            to read moves from the command line
+    """
+
+    global voice_moves
+
+    voice_moves = moves
 
 
 def play_move(game_id: str):
 
+    if voice_moves is not None:
+        play_spoken_move(game_id)
+        return
+
     move_successful = False
     while not move_successful:
         move = str(input('Enter move: '))
@@ -65,6 +114,28 @@ def play_move(game_id: str):
             print('Invalid move. Try again.')
 
 
+def play_spoken_move(game_id: str):
+    """
+    Waits for the voice pipeline to recognize a legal move and makes it in
+    the game, asking again until a move is accepted.
+
+    Parameters:
+        game_id (str): the id of the ongoing game in which to make the move
+    """
+
+    # moves heard while waiting for the opponent were not meant for this turn
+    while not voice_moves.empty():
+        voice_moves.get_nowait()
+
+    print('Say your move...')
+    while True:
+        spoken_move = voice_moves.get()
+        move = legal_move_tracker.to_uci(spoken_move)
+        if move is not None and make_move(game_id, move):
+            return
+        print('Could not play \'' + spoken_move + '\'. Try again.')
+
+
 def await_game_move(game_id: str, prev_move: str or None):
     """
     Awaits opponent's move in the provided game and returns the move
@@ -157,10 +228,13 @@ def make_move(game_id: str, move: str):
         True if the move was made successfully, False otherwise
     """
     try:
-        client.board.make_move(game_id, move)
+        with metrics.timer('make_move'):
+            client.board.make_move(game_id, move)
+        metrics.count('make_move_accepted')
         return True
     # TODO how to identify what went wrong (invalid move, lost connection, etc.)?
     except berserk.exceptions.ResponseError:
+        metrics.count('make_move_rejected')
         return False
 
 
@@ -0,0 +1,94 @@
+from typing import Callable, FrozenSet, List, Optional
+
+import chess
+
+
+class LegalMoveTracker:
+    """
+    Follows the position of an ongoing game from the move lists sent in
+    Lichess game state events and keeps the set of legal moves, in standard
+    algebraic notation, up to date. Listeners are notified with the new set
+    every time the position changes.
+    """
+
+    def __init__(self):
+        self.initial_fen = chess.STARTING_FEN
+        self.board = chess.Board()
+        self.applied_moves: List[str] = []
+        self.legal_moves: FrozenSet[str] = self._list_legal_moves()
+        self.listeners: List[Callable[[FrozenSet[str]], None]] = []
+
+    def add_listener(self, listener: Callable[[FrozenSet[str]], None]):
+        """
+        Registers a function to be called with the legal move set whenever it
+        changes. The listener is called immediately with the current set.
+
+        Parameters
+            listener (function): called with a frozenset of SAN strings
+        """
+
+        self.listeners.append(listener)
+        listener(self.legal_moves)
+
+    def reset(self, initial_fen: str = 'startpos'):
+        """
+        Starts tracking a new game.
+
+        Parameters
+            initial_fen (str): the starting position as sent by Lichess, either
+                'startpos' or a FEN string
+        """
+
+        self.initial_fen = chess.STARTING_FEN if initial_fen in ('', 'startpos') else initial_fen
+        self.board = chess.Board(self.initial_fen)
+        self.applied_moves = []
+        self._publish()
+
+    def update(self, moves: str):
+        """
+        Brings the tracked position up to date with the move list of a game
+        state event. Only moves which have not been seen before are played;
+        if the list does not extend the known moves (e.g. after a takeback)
+        the game is replayed from the start.
+
+        Parameters
+            moves (str): the space separated UCI moves played so far
+        """
+
+        move_list = moves.split()
+        if move_list == self.applied_moves:
+            return
+
+        if move_list[:len(self.applied_moves)] != self.applied_moves:
+            self.board = chess.Board(self.initial_fen)
+            self.applied_moves = []
+
+        for move in move_list[len(self.applied_moves):]:
+            self.board.push_uci(move)
+            self.applied_moves.append(move)
+        self._publish()
+
+    def to_uci(self, move: str) -> Optional[str]:
+        """
+        Converts a move of the current position from standard algebraic
+        notation to the UCI notation expected by the Lichess board API.
+
+        Parameters
+            move (str): the move in SAN, e.g. 'Nf3'
+
+        Returns
+            str: the move in UCI, e.g. 'g1f3', or None if it is not legal
+        """
+
+        try:
+            return self.board.parse_san(move).uci()
+        except ValueError:
+            return None
+
+    def _list_legal_moves(self) -> FrozenSet[str]:
+        return frozenset(self.board.san(move) for move in self.board.legal_moves)
+
+    def _publish(self):
+        self.legal_moves = self._list_legal_moves()
+        for listener in self.listeners:
+            listener(self.legal_moves)
@@ -1,5 +1,27 @@
+import os
+import queue
+import sys
+import threading
+
 from api_util_functions import *
 
+def connect_voice_recognition():
+    """
+    Starts listening to the microphone for the rest of the session and plays
+    the user's moves as they are spoken. The speech recognizer only considers
+    the legal moves of the current position, updated every turn.
+    """
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'audio_processing'))
+    import audio_handler
+
+    legal_move_tracker.add_listener(audio_handler.set_candidate_moves)
+
+    spoken_moves = queue.Queue()
+    set_voice_moves(spoken_moves)
+    threading.Thread(target=audio_handler.start_speech_to_text, kwargs={'move_handler': spoken_moves.put},
+                     daemon=True).start()
+
 def make_challenge_game():
     """
     Prompts the user for a Lichess username, and then challenges
@@ -30,5 +52,12 @@ def accept_challenge_game():
 
 if __name__ == "__main__":
 
+    if '--voice' in sys.argv:
+        connect_voice_recognition()
+    # --metrics serves timings of the game and voice pipeline on localhost
+    if '--metrics' in sys.argv:
+        metrics.enable()
+        metrics.serve()
+
     make_challenge_game()
 
@@ -1,23 +1,74 @@
+import os
 import wave
-import struct
-import math
 import matplotlib.pyplot as plt
+import numpy as np
 import speech_recognition as sr
 import sys
 from pydub import AudioSegment
 import pyaudio
 
+# the offline recognizer is trained and stored alongside the dataset generator
+network_training_directory: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'network_training')
+sys.path.append(network_training_directory)
+
+import frame_energy
+import metrics
+import move_recognizer
+from move_index import get_move_index
+from endpoint_detector import SILENT, EndpointDetector
+from capture_process import CaptureProcess, SharedRingBuffer
+from utterance_buffer import frames_to_audio_data
+from recognition_coordinator import RecognitionCoordinator
+from partial_recognizer import PartialRecognizer
+
 CHUNK = 1024
 FORMAT = pyaudio.paInt16
 CHANNELS = 1 if sys.platform == 'darwin' else 2
 RATE = 44100
 RECORD_SECONDS = 5
 
+# captured audio is downmixed to mono and resampled to TARGET_RATE before any
+# further processing; set TARGET_RATE to None to work at the capture format
+TARGET_RATE = 16000
+TARGET_CHUNK = 384
+STREAM_RATE = RATE if TARGET_RATE is None else TARGET_RATE
+STREAM_CHANNELS = CHANNELS if TARGET_RATE is None else 1
+STREAM_CHUNK = CHUNK if TARGET_RATE is None else TARGET_CHUNK
+
 ambient_noise_level: float = 0.0
 recording_file_path: str = 'command_recording_file.wav'
-end_partition: int = 7
+# when set, every isolated utterance is also written to recording_file_path
+debug_save_recording: bool = False
 r = sr.Recognizer()
 
+# 'google' sends utterances to the Google Web Speech API, 'local' uses the
+# offline move recognizer trained by network_training/move_recognizer.py and
+# 'race' sends them to every backend in racing_backends at once, taking the
+# first valid move returned within recognition_deadline seconds
+recognition_backend: str = 'google'
+local_model_path: str = os.path.join(network_training_directory, move_recognizer.model_file_path)
+local_recognizer = None
+# 'sphinx' may be added once pocketsphinx is installed, which requirements.txt
+# does not list
+racing_backends = ['google', 'local']
+recognition_deadline: float = 3.0
+recognition_coordinator = None
+
+# when set, the local recognizer runs while the user is still speaking and a
+# move is accepted as soon as it is unambiguous, before trailing silence
+streaming_recognition: bool = False
+
+# legal moves of the current position, or None to consider every move
+candidate_moves = None
+
+# the Google API only reports a confidence for its top transcript, so each
+# following alternative is assumed this much less likely than the one before
+ALTERNATIVE_RANK_DECAY: float = 0.8
+
+# how many chunks the listener trails the capture process, when metrics are
+# enabled with --metrics
+CAPTURE_LAG_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
 def trim_audio_file(file_path: str, sound_start_index: float, sound_end_index: float):
     """
     Trims portions of an audio file from the start and end as indicated by the provided
@@ -37,7 +88,7 @@ def trim_audio_file(file_path: str, sound_start_index: float, sound_end_index: f
     total_duration = len(audio)
 
     # trim audio file and export
-    audio = audio[(int)(sound_start_index * total_duration):-(int)(total_duration * (1 - sound_end_index))]
+    audio = audio[(int)(sound_start_index * total_duration):(int)(sound_end_index * total_duration)]
     audio.export(file_path, format='wav')
 
 def rms(data: bytes) -> float:
@@ -51,14 +102,8 @@ def rms(data: bytes) -> float:
         float: a numerical representation of the volume of the provided audio data
     """
 
-    count = len(data)/2
-    format = '%dh'%(count)
-    shorts = struct.unpack( format, data )
-    sum_squares = 0.0
-    for sample in shorts:
-        n = sample * (1.0/32768)
-        sum_squares += n*n
-    return math.sqrt( sum_squares / count )
+    with metrics.timer('rms'):
+        return frame_energy.rms(data)
 
 def convert_audio_file_to_text(file_path: str) -> str:
     """
@@ -73,14 +118,265 @@ def convert_audio_file_to_text(file_path: str) -> str:
             if the interpretation was unsuccessful
     """
 
-    move_file=sr.AudioFile(recording_file_path)
+    move_file=sr.AudioFile(file_path)
     with move_file as source:
         audio = r.record(source)
+    return convert_audio_data_to_text(audio)
+
+def convert_audio_data_to_text(audio: sr.AudioData) -> str:
+    """
+    Uses a voice recognition engine to generate a text representation of the
+    speech in the provided audio.
+
+    Parameters
+        audio (sr.AudioData): the captured speech
+
+    Returns
+        str: a text representation of the provided audio, or an error message
+            if the interpretation was unsuccessful
+    """
+
+    try:
+        return  r.recognize_google(audio)
+    except Exception as e:
+        return 'Error identifying speech. Please try again.'
+
+def request_alternatives(audio: sr.AudioData) -> list:
+    """
+    Asks the voice recognition engine for every transcript it considers
+    plausible for the provided audio.
+
+    Parameters
+        audio (sr.AudioData): the captured speech
+
+    Returns
+        [(str, float)]: (transcript, confidence) pairs, most likely first, or an
+            empty list if the interpretation was unsuccessful
+    """
+
+    try:
+        response = r.recognize_google(audio, show_all=True)
+    except Exception as e:
+        return []
+    if not isinstance(response, dict):
+        return []
+
+    alternatives = []
+    confidence = 1.0
+    for rank, alternative in enumerate(response.get('alternative', [])):
+        if 'confidence' in alternative:
+            confidence = alternative['confidence']
+        elif rank > 0:
+            confidence *= ALTERNATIVE_RANK_DECAY
+        alternatives.append((alternative['transcript'], confidence))
+    return alternatives
+
+def match_valid_move(move: str, valid_moves) -> str:
+    """
+    Finds the valid move a normalized transcript refers to, tolerating a
+    missing or extra check or mate suffix.
+
+    Parameters
+        move (str): a move produced by process_move_text
+        valid_moves ({str}): the moves which may be played
+
+    Returns
+        str: the matching valid move, or None if there is none
+    """
+
+    base_move = move.rstrip('+#')
+    for variant in (move, base_move, base_move + '+', base_move + '#'):
+        if variant in valid_moves:
+            return variant
+    return None
+
+def rescore_alternatives(alternatives: list) -> str:
+    """
+    Converts every alternative transcript to a move and picks the most likely
+    one which is a valid move. Transcripts which normalize to the same move
+    pool their confidence.
+
+    Parameters
+        alternatives ([(str, float)]): (transcript, confidence) pairs, most
+            likely first
+
+    Returns
+        str: the best valid move, or the normalized top transcript if none of
+            the alternatives is a valid move
+    """
+
+    valid_moves = get_move_index().moves if candidate_moves is None else candidate_moves
+    processed_moves = [process_move_text(transcript) for transcript, _ in alternatives]
+
+    move_scores = {}
+    for move, (_, confidence) in zip(processed_moves, alternatives):
+        valid_move = match_valid_move(move, valid_moves)
+        if valid_move is not None:
+            move_scores[valid_move] = move_scores.get(valid_move, 0.0) + confidence
+
+    if len(move_scores) == 0:
+        return processed_moves[0]
+    return max(move_scores, key=move_scores.get)
+
+def set_candidate_moves(moves):
+    """
+    Restricts recognition to the provided moves, typically the legal moves of
+    the position in which the user is about to move.
+
+    Parameters
+        moves ({str}): the candidate moves in algebraic notation, or None to
+            consider every move
+    """
+
+    global candidate_moves
+
+    candidate_moves = None if moves is None else frozenset(moves)
+
+def get_local_recognizer() -> move_recognizer.MoveRecognizer:
+    """
+    Returns the offline move recognizer, loading it from local_model_path
+    the first time it is needed.
+    """
+
+    global local_recognizer
+
+    if local_recognizer is None:
+        local_recognizer = move_recognizer.MoveRecognizer.load(local_model_path)
+    return local_recognizer
+
+def recognize_move_locally(audio: sr.AudioData) -> str:
+    """
+    Uses the offline move recognizer to identify the chess move spoken in the
+    provided audio.
+
+    Parameters
+        audio (sr.AudioData): the captured speech
+
+    Returns
+        str: the recognized move in algebraic notation, or None if no move
+            was recognized
+    """
+
+    with metrics.timer('recognize_move_locally'):
+        raw_data = audio.get_raw_data(convert_rate=move_recognizer.FEATURE_RATE, convert_width=2)
+        move, _ = get_local_recognizer().recognize(np.frombuffer(raw_data, dtype=np.int16), candidate_moves)
+        return move
+
+def recognize_move_google(audio: sr.AudioData) -> str:
+    """
+    Uses the Google Web Speech API to identify the chess move spoken in the
+    provided audio.
+
+    Parameters
+        audio (sr.AudioData): the captured speech
+
+    Returns
+        str: the move in algebraic notation, or None if no speech was recognized
+    """
+
+    with metrics.timer('recognize_move_google'):
+        alternatives = request_alternatives(audio)
+        if len(alternatives) == 0:
+            return None
+        print('Raw text', [transcript for transcript, _ in alternatives])
+        return rescore_alternatives(alternatives)
+
+def recognize_move_sphinx(audio: sr.AudioData) -> str:
+    """
+    Uses the offline CMU Sphinx engine to identify the chess move spoken in
+    the provided audio.
+
+    Parameters
+        audio (sr.AudioData): the captured speech
+
+    Returns
+        str: the move in algebraic notation, or None if no speech was recognized
+    """
+
+    with metrics.timer('recognize_move_sphinx'):
         try:
-            return  r.recognize_google(audio)
-        except Exception as e:
+            return process_move_text(r.recognize_sphinx(audio))
+        except sr.UnknownValueError:
+            return None
+
+def accept_move(move: str) -> str:
+    """
+    Returns the valid move the provided recognition result refers to, or None
+    if it is not a valid move in the current position.
+    """
+
+    return match_valid_move(move, get_move_index().moves if candidate_moves is None else candidate_moves)
+
+def get_recognition_coordinator() -> RecognitionCoordinator:
+    """
+    Returns the coordinator which races the backends in racing_backends,
+    creating it the first time it is needed.
+    """
+
+    global recognition_coordinator
+
+    if recognition_coordinator is None:
+        backend_functions = {'google': recognize_move_google, 'sphinx': recognize_move_sphinx,
+                             'local': recognize_move_locally}
+        recognition_coordinator = RecognitionCoordinator({name: backend_functions[name] for name in racing_backends},
+                                                         accept_move, recognition_deadline)
+    return recognition_coordinator
+
+def create_partial_recognizer() -> PartialRecognizer:
+    """
+    Returns a partial recognizer which scores the candidate moves with the
+    local recognizer as audio arrives.
+    """
+
+    recognizer = get_local_recognizer()
+    return PartialRecognizer(lambda samples: recognizer.score(samples, candidate_moves),
+                             STREAM_RATE, STREAM_CHANNELS, move_recognizer.FEATURE_RATE,
+                             interval_samples=STREAM_RATE // 10)
+
+def recognize_move(audio: sr.AudioData) -> str:
+    """
+    Identifies the chess move spoken in the provided audio with the configured
+    recognition backend.
+
+    Parameters
+        audio (sr.AudioData): the captured speech
+
+    Returns
+        str: the move in algebraic notation
+    """
+
+    with metrics.timer('recognize_move'):
+        return _recognize_move(audio)
+
+def _recognize_move(audio: sr.AudioData) -> str:
+    if recognition_backend == 'race':
+        result = get_recognition_coordinator().recognize(audio)
+        if result is None:
             return 'Error identifying speech. Please try again.'
-        
+        print('Recognized by', result.backend, 'in', round(result.latency, 3), 's')
+        return result.move
+
+    move = recognize_move_locally(audio) if recognition_backend == 'local' else recognize_move_google(audio)
+    if move is None:
+        return 'Error identifying speech. Please try again.'
+    return move
+
+def save_recording(file_path: str, frames: memoryview, sample_width: int):
+    """
+    Writes captured audio frames to a wav file for debugging.
+
+    Parameters
+        file_path (str): the path of the file to write
+        frames (memoryview): interleaved audio data
+        sample_width (int): the number of bytes in each sample
+    """
+
+    with wave.open(file_path, 'w') as wf:
+        wf.setnchannels(STREAM_CHANNELS)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(STREAM_RATE)
+        wf.writeframes(frames)
+
 
 def process_move_text(move_cmd: str) -> str:
     """
@@ -95,6 +391,15 @@ def process_move_text(move_cmd: str) -> str:
         str: the provided string modified to be a valid chess move
     """
 
+    metrics.count('process_move_text_calls')
+    # look the transcript up in the phonetic move index first, so homophones
+    # and small recognition errors still resolve to the closest valid move
+    with metrics.timer('process_move_text'):
+        move = get_move_index().resolve(move_cmd, candidate_moves)
+    if move is not None:
+        return move
+    metrics.count('process_move_text_fallbacks')
+
     return_string = ''
     for word in move_cmd.split(' '):
         word = word.lower()
@@ -117,140 +422,186 @@ def process_move_text(move_cmd: str) -> str:
     return return_string
     
 
-def start_speech_to_text():
+def measure_ambient_noise(ring: SharedRingBuffer) -> float:
     """
-    Begins the routine which listens for voice commands and prints
-    the interpreted value to the command line.
+    Listens for RECORD_SECONDS of audio and returns the loudest chunk volume,
+    to be used as a benchmark when identifying speech.
+
+    Parameters
+        ring (SharedRingBuffer): the buffer the microphone is captured into
+
+    Returns
+        float: the ambient noise level
     """
-    
-    num_outer_iter = 0
-    while True:
-        convert_audio = False
-        with wave.open(recording_file_path, 'w') as wf:
-            p = pyaudio.PyAudio()
-            wf.setnchannels(CHANNELS)
-            wf.setsampwidth(p.get_sample_size(FORMAT))
-            wf.setframerate(RATE)
-
-            stream = p.open(format=FORMAT, channels=CHANNELS, rate=RATE, input=True)
-
-            vol_list = []
-            num_samples = RATE // CHUNK * RECORD_SECONDS
-
-            num_inner_iter = 0
-            actual_samples = 0
-            while True:
-
-                # the first time this method is called, dedicate the recording to determining the
-                # level of ambient noise to use as a benchmark when actually identifying speech
-                if num_outer_iter == 0:
-                    print('Detecting ambient noise level. Please remain silent...')
-                else:
-                    print('Recording...')
-
-                # save a number of samples of microphone data to file
-                for _ in range(0, (int)(num_samples / (num_inner_iter + 1))):
-                    sound_data = stream.read(CHUNK, exception_on_overflow = False)
-                    vol_list.append(rms(sound_data))
-                    wf.writeframes(sound_data)
-                    actual_samples += 1
-
-                # restart outer loop after updating ambient noise var on first iteration only
-                if num_outer_iter == 0:
-                    # ambient_noise_level = sum(vol_list) / len(vol_list)
-                    ambient_noise_level = max(vol_list)
-                    print('Ambient noise level: ', ambient_noise_level)
-                    break
 
-                # experimentally determined sound thresholds; threshold for identifying the start of
-                # an utterance needs to be higher than that denoting the end of one
-                start_speech_threshold = 1.25 * ambient_noise_level
-                end_speech_threshold = 1.05 * ambient_noise_level
-                silence_threshold = 1.5 * ambient_noise_level
-
-                max_val = max(vol_list)
-                min_val = min(vol_list)
-                # case 1: audio looks to contain sound
-                if max_val >= silence_threshold:
-
-                    print('Detected sound in file, silence threshold is ', silence_threshold, ' for min: ', min_val, ', max: ', max_val)
-
-                    # check whether sound in file is isolated (extends to to end of file or not)
-                    is_sound_isolated = True
-                    end_check_index = round((actual_samples * (1.0 - (1.0 / end_partition))))
-                    num_matches = 0
-                    for i in range(end_check_index, actual_samples):
-                        if vol_list[i] > start_speech_threshold:
-                            num_matches += 1
-
-                            # if we find a certain number of samples above a certain threshold
-                            # in the last 1/end_partition samples, consider the sound to be not
-                            # isolated
-                            if num_matches > 3:
-                                is_sound_isolated = False
-                                break
-
-                    # case 2: sound within sample is isolated -> convert to text
-                    if is_sound_isolated:      
-                        print('--> Sound is isolated')
-                        convert_audio = True
-
-                        # could we parallelize the two checks below with threads?
-
-                        start_silence_index = 0
-                        end_silence_index = num_samples
-                        sound_start_threshold = 5
-                        # find starting index of sound from the start
-                        count = 0
-                        for i in range(0, num_samples):
-                            if vol_list[i] >= start_speech_threshold:
-                                count += 1
-                                if count == sound_start_threshold:
-                                    start_silence_index = max(0, i - 2 * count)
-                                    break
-                        # find starting index of sound from the end
-                        count = 0
-                        for i in reversed(range(0, num_samples)):
-                            if vol_list[i] >= end_speech_threshold:
-                                count += 1
-                                if count == sound_start_threshold:
-                                    end_silence_index = min(i + 6 * count, actual_samples)
-                                    break
-
-                        # remove silence at beginning and end of file
-                        trim_audio_file(recording_file_path, start_silence_index / actual_samples, end_silence_index / actual_samples)
-
-                        break
-
-                    # case 3: sound within sample is not isolated -> record for additional time to capture entire command
-                    else:
-                        num_inner_iter += 1
-                        print('--> Sound is not isolated, recording for additional ', RECORD_SECONDS / (num_inner_iter + 1), 'seconds.')
-                        continue
-                
-                # case 4: audio contains no sound -> overwrite file
+    print('Detecting ambient noise level. Please remain silent...')
+    first_chunk = ring.chunks_written()
+    num_chunks = STREAM_RATE // STREAM_CHUNK * RECORD_SECONDS
+    ring.read(first_chunk + num_chunks - 1).release()
+    frames = ring.frames(first_chunk, first_chunk + num_chunks)
+    noise_level = float(frame_energy.buffer_energies(frames, STREAM_CHUNK, STREAM_CHANNELS).rms.max())
+    if isinstance(frames, memoryview):
+        frames.release()
+    return noise_level
+
+def listen_for_utterance(ring: SharedRingBuffer, partial_recognizer: PartialRecognizer = None,
+                         wait_for_silence: bool = False) -> sr.AudioData:
+    """
+    Follows the microphone capture until a complete utterance has been
+    spoken and returns it with the surrounding silence removed.
+
+    Parameters
+        ring (SharedRingBuffer): the buffer the microphone is captured into
+        partial_recognizer (PartialRecognizer): if given, the utterance is fed
+            to it while it is spoken and listening stops early once it commits
+            to a move
+        wait_for_silence (bool): ignore sound until the room is quiet, such as
+            the rest of an utterance which was committed early
+
+    Returns
+        sr.AudioData: the isolated utterance
+    """
+
+    detector = EndpointDetector(ambient_noise_level, chunk_size=STREAM_CHUNK,
+                                max_utterance_chunks=STREAM_RATE // STREAM_CHUNK * RECORD_SECONDS)
+    if wait_for_silence:
+        detector.wait_for_silence()
+    if partial_recognizer is not None:
+        partial_recognizer.reset()
+
+    # detector chunk indices count from first_chunk in the ring buffer
+    first_chunk = ring.chunks_written()
+    chunk_index = first_chunk
+    utterance = None
+    print('Recording...')
+    while utterance is None:
+        try:
+            sound_data = ring.read(chunk_index)
+        except IndexError:
+            # fell too far behind the capture process, start again from the present
+            metrics.count('capture_overruns')
+            detector.reset()
+            if partial_recognizer is not None:
+                partial_recognizer.reset()
+            first_chunk = chunk_index = ring.chunks_written()
+            continue
+        metrics.count('capture_chunks')
+        metrics.observe('capture_lag_chunks', ring.chunks_written() - chunk_index, CAPTURE_LAG_BUCKETS)
+        volume = rms(sound_data)
+        with metrics.timer('endpoint_decision'):
+            utterance = detector.process(volume)
+        chunk_index += 1
+
+        if partial_recognizer is not None and utterance is None:
+            if detector.state == SILENT:
+                if partial_recognizer.input_samples > 0:
+                    partial_recognizer.reset()
+            else:
+                # the first fed audio includes the chunks before the onset
+                if partial_recognizer.input_samples == 0:
+                    new_frames = ring.frames(first_chunk + detector.earliest_needed_chunk(), chunk_index)
                 else:
-                    print('Detected no sound in file')
+                    new_frames = sound_data
+                hypothesis = partial_recognizer.feed(new_frames)
+                if isinstance(new_frames, memoryview) and new_frames is not sound_data:
+                    new_frames.release()
+                if hypothesis is not None:
+                    print('Partial: ', hypothesis.move, ', margin ', round(hypothesis.margin, 3))
+                if partial_recognizer.committed_move is not None:
+                    sound_data.release()
                     break
+        sound_data.release()
+
+    metrics.count('utterances')
+    if utterance is None:
+        metrics.count('utterances_committed_early')
+        print('--> Committed to move before the end of speech')
+        start_chunk, end_chunk = detector.earliest_needed_chunk(), detector.chunk_index
+    else:
+        print('--> Sound is isolated, peak volume ', utterance.peak_volume)
+        start_chunk, end_chunk = utterance.start_chunk, min(utterance.end_chunk, detector.chunk_index)
+
+    # silence at the beginning and end is removed by slicing the ring buffer
+    sample_width = pyaudio.get_sample_size(FORMAT)
+    frames = ring.frames(first_chunk + start_chunk, first_chunk + end_chunk)
+    if debug_save_recording:
+        save_recording(recording_file_path, frames, sample_width)
+    with metrics.timer('frames_to_audio_data'):
+        audio = frames_to_audio_data(frames, STREAM_CHANNELS, STREAM_RATE, sample_width)
+    if isinstance(frames, memoryview):
+        frames.release()
+    return audio
+
+def start_speech_to_text(capture=None, move_handler=None, max_utterances: int = None):
+    """
+    Begins the routine which listens for voice commands and prints
+    the interpreted value to the command line.
+
+    Parameters
+        capture: a context manager providing the SharedRingBuffer audio is
+            read from, by default a CaptureProcess recording the microphone
+        move_handler: if given, called with every processed move, such as a
+            function submitting it to the game
+        max_utterances (int): the number of utterances after which to stop,
+            or None to listen indefinitely
+    """
+
+    global ambient_noise_level
+
+    # the microphone stays open in a separate process for the whole session
+    if capture is None:
+        capture = CaptureProcess(CHUNK, FORMAT, CHANNELS, RATE, output_rate=TARGET_RATE, output_chunk=TARGET_CHUNK)
+    with capture as ring:
+
+        # dedicate the first recording to determining the level of ambient noise
+        # to use as a benchmark when actually identifying speech
+        ambient_noise_level = measure_ambient_noise(ring)
+        print('Ambient noise level: ', ambient_noise_level)
+
+        # build the transcript index before the first move is spoken
+        get_move_index()
 
-            # close file being written to once we have isolated sound
-            stream.close()
-            p.terminate()
+        partial_recognizer = None
+        if streaming_recognition and recognition_backend == 'local':
+            partial_recognizer = create_partial_recognizer()
 
-            if convert_audio:
-                convert_audio = False
-                move_text = convert_audio_file_to_text(recording_file_path)
-                print('Raw text', move_text)
-                processed_move_text = process_move_text(move_text)
-                print('Processed text: ', processed_move_text)
+        committed_early = False
+        utterances = 0
+        while max_utterances is None or utterances < max_utterances:
+            audio = listen_for_utterance(ring, partial_recognizer, wait_for_silence=committed_early)
 
-            num_outer_iter += 1
+            committed_early = partial_recognizer is not None and partial_recognizer.committed_move is not None
+            if committed_early:
+                processed_move_text = partial_recognizer.committed_move
+            else:
+                processed_move_text = recognize_move(audio)
+            print('Processed text: ', processed_move_text)
+            if move_handler is not None:
+                move_handler(processed_move_text)
+            utterances += 1
 
 
 if __name__ == "__main__":
     """
-    Main method for testing
+    Main method for testing. Pass --debug to keep a copy of every recording,
+    --local to recognize moves with the offline recognizer, --stream to also
+    recognize them while they are spoken and --race to race every recognition
+    backend. Pass --metrics to serve latency metrics on localhost or
+    --metrics-dump <file> to write them to a file every few seconds.
     """
 
+    debug_save_recording = '--debug' in sys.argv
+    # --metrics serves timings on localhost, --metrics-dump <file> writes them periodically
+    if '--metrics' in sys.argv:
+        metrics.enable()
+        metrics.serve()
+    if '--metrics-dump' in sys.argv:
+        metrics.enable()
+        metrics.start_dumping(sys.argv[sys.argv.index('--metrics-dump') + 1])
+    if '--local' in sys.argv:
+        recognition_backend = 'local'
+        streaming_recognition = '--stream' in sys.argv
+    elif '--race' in sys.argv:
+        recognition_backend = 'race'
     start_speech_to_text()
 
@@ -0,0 +1,266 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import time
+from typing import Optional, Union
+
+import numpy as np
+import pyaudio
+
+from resampler import CaptureConverter
+
+# the header holds a single counter with the total number of chunks written
+HEADER_BYTES = 8
+
+
+class SharedRingBuffer:
+    """
+    Fixed size ring of audio chunks in a multiprocessing.shared_memory block.
+    A single writer (the capture process) appends chunks and any number of
+    readers in other processes or threads read them back without copying.
+
+    Chunks are numbered from 0 in the order they were written. Chunk n lives in
+    slot n % capacity_chunks until it is overwritten capacity_chunks chunks
+    later, so readers must stay less than capacity_chunks behind the writer.
+
+    Parameters
+        capacity_chunks (int): the number of chunks held before wrapping
+        chunk_bytes (int): the size of each chunk in bytes
+        name (str): the name of an existing block to attach to, or None to
+            create a new one
+    """
+
+    def __init__(self, capacity_chunks: int, chunk_bytes: int, name: Optional[str] = None):
+        self.capacity_chunks = capacity_chunks
+        self.chunk_bytes = chunk_bytes
+        self.owner = name is None
+        size = HEADER_BYTES + capacity_chunks * chunk_bytes
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.counter = np.ndarray((1,), dtype=np.uint64, buffer=self.shm.buf[:HEADER_BYTES])
+        self.data = self.shm.buf[HEADER_BYTES:size]
+        if self.owner:
+            self.counter[0] = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, chunk: bytes):
+        """
+        Appends a chunk, overwriting the oldest one if the ring is full. Only
+        the capture process may call this.
+
+        Parameters
+            chunk (bytes): the captured chunk of audio data
+        """
+
+        index = int(self.counter[0])
+        offset = (index % self.capacity_chunks) * self.chunk_bytes
+        self.data[offset:offset + len(chunk)] = chunk
+        # publish the chunk only once its data is in place
+        self.counter[0] = index + 1
+
+    def chunks_written(self) -> int:
+        """
+        Returns the total number of chunks written so far, which is also the
+        index of the next chunk to arrive.
+        """
+
+        return int(self.counter[0])
+
+    def oldest_available(self) -> int:
+        """
+        Returns the index of the oldest chunk which has not been overwritten.
+        """
+
+        return max(0, self.chunks_written() - self.capacity_chunks + 1)
+
+    def read(self, chunk_index: int, timeout: Optional[float] = None, poll_interval: float = 0.005) -> memoryview:
+        """
+        Returns a zero-copy view of the chunk with the provided index, waiting
+        for it to be captured if necessary.
+
+        Parameters
+            chunk_index (int): index of the chunk to read
+            timeout (float): the longest time to wait in seconds, or None to
+                wait indefinitely
+            poll_interval (float): seconds between checks for new chunks
+
+        Returns
+            memoryview: the chunk's audio data
+
+        Raises
+            IndexError: if the chunk has already been overwritten
+            TimeoutError: if the chunk did not arrive within the timeout
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.chunks_written() <= chunk_index:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError('Chunk ' + str(chunk_index) + ' was not captured in time.')
+            time.sleep(poll_interval)
+
+        if chunk_index < self.oldest_available():
+            raise IndexError('Chunk ' + str(chunk_index) + ' has been overwritten.')
+
+        offset = (chunk_index % self.capacity_chunks) * self.chunk_bytes
+        return self.data[offset:offset + self.chunk_bytes]
+
+    def frames(self, start_chunk: int, end_chunk: int) -> Union[memoryview, bytes]:
+        """
+        Returns the audio between the provided chunk indices. The result is a
+        zero-copy view unless the range wraps around the end of the ring, in
+        which case the two halves are joined.
+
+        Parameters
+            start_chunk (int): index of the first chunk to include
+            end_chunk (int): index one past the last chunk to include
+
+        Returns
+            memoryview or bytes: the interleaved audio data of the requested chunks
+
+        Raises
+            IndexError: if part of the range has been overwritten or not yet captured
+        """
+
+        if start_chunk < self.oldest_available() or end_chunk > self.chunks_written():
+            raise IndexError('Chunks ' + str(start_chunk) + ' to ' + str(end_chunk) + ' are not available.')
+
+        start_slot = start_chunk % self.capacity_chunks
+        num_chunks = end_chunk - start_chunk
+        if start_slot + num_chunks <= self.capacity_chunks:
+            return self.data[start_slot * self.chunk_bytes:(start_slot + num_chunks) * self.chunk_bytes]
+
+        head = self.data[start_slot * self.chunk_bytes:]
+        tail = self.data[:(start_slot + num_chunks - self.capacity_chunks) * self.chunk_bytes]
+        return bytes(head) + bytes(tail)
+
+    def close(self):
+        """
+        Detaches from the shared memory block, destroying it if this instance
+        created it. Views returned by read or frames must be released first.
+        """
+
+        self.counter = None
+        self.data.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _capture_worker(ring_name: str, capacity_chunks: int, ring_chunk_bytes: int, chunk_size: int,
+                    sample_format: int, channels: int, rate: int, output_rate: Optional[int],
+                    output_chunk: int, ready_event, stop_event):
+    """
+    Entry point of the capture process. Keeps a single callback-mode input
+    stream open and copies every chunk it delivers into the shared ring
+    until asked to stop. When an output rate is given, chunks pass through
+    the conversion stage before they are stored.
+    """
+
+    p = pyaudio.PyAudio()
+    ring = SharedRingBuffer(capacity_chunks, ring_chunk_bytes, ring_name)
+    converter = None if output_rate is None else CaptureConverter(rate, channels, output_rate, output_chunk)
+
+    def on_chunk(in_data, frame_count, time_info, status):
+        if converter is None:
+            ring.write(in_data)
+        else:
+            for chunk in converter.process(in_data):
+                ring.write(chunk)
+        return (None, pyaudio.paContinue)
+
+    stream = p.open(format=sample_format, channels=channels, rate=rate, input=True,
+                    frames_per_buffer=chunk_size, stream_callback=on_chunk)
+    stream.start_stream()
+    ready_event.set()
+
+    try:
+        while not stop_event.wait(0.1) and stream.is_active():
+            pass
+    finally:
+        stream.stop_stream()
+        stream.close()
+        p.terminate()
+        ring.close()
+
+
+class CaptureProcess:
+    """
+    Long-lived microphone capture running in its own process. The device is
+    opened once and stays open, so no audio is dropped between utterances and
+    stream reads never block the endpointing or recognition work.
+
+    Parameters
+        chunk_size (int): the number of frames delivered per callback
+        sample_format (int): a pyaudio sample format constant
+        channels (int): the number of channels to capture
+        rate (int): the sample rate to capture at
+        buffer_seconds (float): how much audio the ring buffer retains
+        output_rate (int): if given, captured 16 bit audio is downmixed to mono
+            and resampled to this rate before it is written to the ring buffer
+        output_chunk (int): the number of frames in each converted chunk
+    """
+
+    def __init__(self, chunk_size: int, sample_format: int, channels: int, rate: int, buffer_seconds: float = 30.0,
+                 output_rate: Optional[int] = None, output_chunk: Optional[int] = None):
+        self.chunk_size = chunk_size
+        self.sample_format = sample_format
+        self.channels = channels
+        self.rate = rate
+        self.sample_width = pyaudio.get_sample_size(sample_format)
+        self.output_rate = output_rate
+
+        # format of the chunks stored in the ring buffer
+        if output_rate is None:
+            self.stream_rate, self.stream_channels, self.stream_chunk = rate, channels, chunk_size
+        else:
+            self.stream_rate, self.stream_channels, self.stream_chunk = output_rate, 1, output_chunk or chunk_size
+        self.capacity_chunks = max(2, int(buffer_seconds * self.stream_rate / self.stream_chunk))
+        self.ring = None
+        self.process = None
+        self.stop_event = None
+
+    def start(self, timeout: float = 10.0) -> SharedRingBuffer:
+        """
+        Creates the ring buffer and starts the capture process.
+
+        Parameters
+            timeout (float): seconds to wait for the input stream to open
+
+        Returns
+            SharedRingBuffer: the buffer the captured chunks are written to
+        """
+
+        self.ring = SharedRingBuffer(self.capacity_chunks, self.stream_chunk * self.stream_channels * self.sample_width)
+        ready_event = multiprocessing.Event()
+        self.stop_event = multiprocessing.Event()
+        self.process = multiprocessing.Process(target=_capture_worker, daemon=True,
+                                               args=(self.ring.name, self.capacity_chunks, self.ring.chunk_bytes,
+                                                     self.chunk_size, self.sample_format, self.channels, self.rate,
+                                                     self.output_rate, self.stream_chunk, ready_event, self.stop_event))
+        self.process.start()
+        if not ready_event.wait(timeout):
+            self.stop()
+            raise RuntimeError('Microphone capture process failed to start.')
+        return self.ring
+
+    def stop(self):
+        """
+        Stops the capture process and releases the ring buffer.
+        """
+
+        if self.process is not None:
+            self.stop_event.set()
+            self.process.join(5.0)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def __enter__(self) -> SharedRingBuffer:
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,165 @@
+from typing import NamedTuple, Optional
+
+# experimentally determined sound thresholds, as multiples of the ambient noise
+# level; the threshold for identifying the start of an utterance needs to be
+# higher than that denoting the end of one
+START_SPEECH_FACTOR: float = 1.25
+END_SPEECH_FACTOR: float = 1.05
+SILENCE_FACTOR: float = 1.5
+
+SILENT = 'silent'
+ONSET = 'onset'
+SPEECH = 'speech'
+SUPPRESSED = 'suppressed'
+
+
+class Utterance(NamedTuple):
+    """
+    The boundaries of a completed utterance. Chunk indices count every chunk
+    passed to the detector since it was created or reset, the end index is
+    exclusive.
+
+    Fields
+        start_chunk (int): index of the first chunk of the utterance
+        end_chunk (int): index one past the last chunk of the utterance
+        start_sample (int): frame offset of the start of the utterance
+        end_sample (int): frame offset of the end of the utterance
+        peak_volume (float): the loudest chunk volume seen during the utterance
+    """
+
+    start_chunk: int
+    end_chunk: int
+    start_sample: int
+    end_sample: int
+    peak_volume: float
+
+
+class EndpointDetector:
+    """
+    Frame-by-frame endpointing state machine. Chunk volumes are fed in as they
+    are captured and an Utterance is returned as soon as enough trailing silence
+    has followed a spoken command. Every call does a constant amount of work.
+
+    Parameters
+        ambient_noise_level (float): the volume of the room when nobody speaks
+        chunk_size (int): the number of frames in each chunk
+        onset_chunks (int): loud chunks required before speech is considered started
+        pre_roll_chunks (int): chunks kept before the detected onset
+        hangover_chunks (int): consecutive quiet chunks which end an utterance
+        post_roll_chunks (int): quiet chunks kept after the last voiced chunk
+        max_utterance_chunks (int): length at which an utterance is closed even
+            though speech has not stopped, or 0 for no limit
+    """
+
+    def __init__(self, ambient_noise_level: float, chunk_size: int = 1024,
+                 onset_chunks: int = 5, pre_roll_chunks: int = 10,
+                 hangover_chunks: int = 15, post_roll_chunks: int = 10,
+                 max_utterance_chunks: int = 0):
+        self.start_speech_threshold = START_SPEECH_FACTOR * ambient_noise_level
+        self.end_speech_threshold = END_SPEECH_FACTOR * ambient_noise_level
+        self.silence_threshold = SILENCE_FACTOR * ambient_noise_level
+        self.chunk_size = chunk_size
+        self.onset_chunks = onset_chunks
+        self.pre_roll_chunks = pre_roll_chunks
+        self.hangover_chunks = hangover_chunks
+        self.post_roll_chunks = min(post_roll_chunks, hangover_chunks)
+        self.max_utterance_chunks = max_utterance_chunks
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets any utterance in progress and restarts chunk numbering at 0.
+        """
+
+        self.chunk_index = 0
+        self._begin_listening()
+
+    def _begin_listening(self):
+        self.state = SILENT
+        self.onset_count = 0
+        self.quiet_count = 0
+        self.first_loud_chunk = 0
+        self.last_voiced_chunk = 0
+        self.peak_volume = 0.0
+
+    def wait_for_silence(self):
+        """
+        Ignores any sound until hangover_chunks quiet chunks have been seen,
+        for instance the rest of an utterance which has already been handled.
+        """
+
+        self._begin_listening()
+        self.state = SUPPRESSED
+
+    def earliest_needed_chunk(self) -> int:
+        """
+        Returns the index of the oldest chunk which could still become part of
+        an utterance. Callers buffering audio may discard anything older.
+        """
+
+        if self.state in (SILENT, SUPPRESSED):
+            return max(0, self.chunk_index - self.pre_roll_chunks)
+        return max(0, self.first_loud_chunk - self.pre_roll_chunks)
+
+    def process(self, volume: float) -> Optional[Utterance]:
+        """
+        Advances the state machine by one chunk.
+
+        Parameters
+            volume (float): the rms volume of the next captured chunk
+
+        Returns
+            Utterance: the boundaries of the utterance if this chunk completed
+                one, otherwise None
+        """
+
+        index = self.chunk_index
+        self.chunk_index += 1
+
+        if self.state == SUPPRESSED:
+            self.quiet_count = 0 if volume >= self.end_speech_threshold else self.quiet_count + 1
+            if self.quiet_count >= self.hangover_chunks:
+                self._begin_listening()
+            return None
+
+        if self.state == SILENT:
+            if volume >= self.start_speech_threshold:
+                self.state = ONSET
+                self.onset_count = 1
+                self.quiet_count = 0
+                self.first_loud_chunk = index
+                self.last_voiced_chunk = index
+                self.peak_volume = volume
+            return None
+
+        if volume >= self.end_speech_threshold:
+            self.quiet_count = 0
+            self.last_voiced_chunk = index
+            self.peak_volume = max(self.peak_volume, volume)
+            if self.state == ONSET and volume >= self.start_speech_threshold:
+                self.onset_count += 1
+                if self.onset_count >= self.onset_chunks:
+                    self.state = SPEECH
+        else:
+            self.quiet_count += 1
+
+        if self.quiet_count >= self.hangover_chunks:
+            # an onset that never got loud enough was a click or a bump
+            # rather than a command, so start listening again
+            if self.state == ONSET or self.peak_volume < self.silence_threshold:
+                self._begin_listening()
+                return None
+            return self._complete(self.last_voiced_chunk + 1 + self.post_roll_chunks)
+
+        if self.state == SPEECH and self.max_utterance_chunks > 0 and \
+                index + 1 - self.first_loud_chunk >= self.max_utterance_chunks:
+            return self._complete(index + 1)
+
+        return None
+
+    def _complete(self, end_chunk: int) -> Utterance:
+        start_chunk = max(0, self.first_loud_chunk - self.pre_roll_chunks)
+        utterance = Utterance(start_chunk, end_chunk, start_chunk * self.chunk_size,
+                              end_chunk * self.chunk_size, self.peak_volume)
+        self._begin_listening()
+        return utterance
@@ -0,0 +1,190 @@
+from typing import List, NamedTuple
+
+import numpy as np
+
+# microphone data is captured as signed 16 bit little endian PCM
+SAMPLE_DTYPE = np.dtype('<i2')
+SAMPLE_SCALE: float = 1.0 / 32768
+
+
+class ChunkEnergies(NamedTuple):
+    """
+    Per chunk volume measurements for a list of audio chunks. Each field
+    holds one value per chunk, in the order the chunks were provided.
+
+    Fields
+        rms (np.ndarray): root mean square amplitude in [0.0, 1.0]
+        peak (np.ndarray): largest absolute amplitude in [0.0, 1.0]
+        zero_crossing_rate (np.ndarray): fraction of consecutive frames which
+            change sign, averaged over channels
+    """
+
+    rms: np.ndarray
+    peak: np.ndarray
+    zero_crossing_rate: np.ndarray
+
+
+def frame_view(data: bytes, channels: int = 1) -> np.ndarray:
+    """
+    Returns a zero-copy view of the provided audio data as a two dimensional
+    array of shape (frames, channels). Interleaved samples are split so that
+    each column holds a single channel. Trailing samples which do not make up
+    a complete frame are dropped.
+
+    Parameters
+        data (bytes): a byte representation of 16 bit audio data
+        channels (int): the number of interleaved channels in the data
+
+    Returns
+        np.ndarray: a read-only int16 view of the audio data
+    """
+
+    samples = np.frombuffer(data, dtype=SAMPLE_DTYPE, count=len(data) // SAMPLE_DTYPE.itemsize)
+    num_frames = len(samples) // channels
+    return samples[:num_frames * channels].reshape(num_frames, channels)
+
+
+def chunk_energies(chunks: List[bytes], channels: int = 1) -> ChunkEnergies:
+    """
+    Computes the rms, peak and zero crossing rate of every chunk in the
+    provided list with vectorized operations.
+
+    Parameters
+        chunks ([bytes]): a list of byte representations of audio data, such as
+            those returned by consecutive stream reads
+        channels (int): the number of interleaved channels in each chunk
+
+    Returns
+        ChunkEnergies: the volume measurements of each chunk
+    """
+
+    if len(chunks) == 0:
+        empty = np.zeros(0)
+        return ChunkEnergies(empty, empty, empty)
+
+    # stream reads return equal sized chunks, which are joined into one buffer
+    # and processed in a single pass; a ragged list falls back to one pass per chunk
+    chunk_length = len(chunks[0])
+    if any(len(chunk) != chunk_length for chunk in chunks):
+        measurements = [chunk_energies([chunk], channels) for chunk in chunks]
+        return ChunkEnergies(*(np.concatenate(field) for field in zip(*measurements)))
+
+    num_frames = len(frame_view(chunks[0], channels))
+    if num_frames == 0:
+        empty = np.zeros(len(chunks))
+        return ChunkEnergies(empty, empty, empty)
+    return buffer_energies(b''.join(chunks), num_frames, channels)
+
+
+def buffer_energies(data: bytes, chunk_frames: int, channels: int = 1) -> ChunkEnergies:
+    """
+    Computes the rms, peak and zero crossing rate of every chunk in a
+    contiguous buffer of audio data without copying it first.
+
+    Parameters
+        data (bytes): a byte representation of audio data, or a memoryview of it
+        chunk_frames (int): the number of frames in each chunk; trailing frames
+            which do not make up a complete chunk are ignored
+        channels (int): the number of interleaved channels in the data
+
+    Returns
+        ChunkEnergies: the volume measurements of each chunk
+    """
+
+    samples = frame_view(data, channels)
+    num_chunks = len(samples) // chunk_frames if chunk_frames > 0 else 0
+    frames = samples[:num_chunks * chunk_frames].reshape(num_chunks, chunk_frames, channels)
+    num_samples = chunk_frames * channels
+    if num_samples == 0:
+        empty = np.zeros(num_chunks)
+        return ChunkEnergies(empty, empty, empty)
+
+    # square in int64 so a full scale chunk cannot overflow the accumulator
+    wide = frames.astype(np.int64)
+    sum_squares = np.einsum('ijk,ijk->i', wide, wide)
+    rms_values = np.sqrt(sum_squares / num_samples) * SAMPLE_SCALE
+
+    peak_values = np.abs(wide).max(axis=(1, 2), initial=0) * SAMPLE_SCALE
+
+    # sign changes are counted within each channel, never across the
+    # interleaved boundary between left and right samples
+    signs = np.signbit(frames)
+    if chunk_frames > 1:
+        crossings = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=(1, 2))
+        zcr_values = crossings / ((chunk_frames - 1) * channels)
+    else:
+        zcr_values = np.zeros(num_chunks)
+
+    return ChunkEnergies(rms_values, peak_values, zcr_values)
+
+
+def chunk_rms(chunks: List[bytes], channels: int = 1) -> List[float]:
+    """
+    Returns the rms volume of every chunk in the provided list.
+
+    Parameters
+        chunks ([bytes]): a list of byte representations of audio data
+        channels (int): the number of interleaved channels in each chunk
+
+    Returns
+        [float]: the rms volume of each chunk
+    """
+
+    return chunk_energies(chunks, channels).rms.tolist()
+
+
+def _single_chunk_energies(data: bytes, channels: int) -> ChunkEnergies:
+    """
+    Measures the provided audio data as one chunk, reading it in place.
+    """
+
+    num_frames = len(data) // (SAMPLE_DTYPE.itemsize * channels)
+    if num_frames == 0:
+        return ChunkEnergies(np.zeros(1), np.zeros(1), np.zeros(1))
+    return buffer_energies(data, num_frames, channels)
+
+
+def rms(data: bytes, channels: int = 1) -> float:
+    """
+    Returns a numerical representation of the volume of the provided sound data.
+
+    Parameters
+        data (bytes): a byte representation of audio data
+        channels (int): the number of interleaved channels in the data
+
+    Returns
+        float: the rms volume of the provided audio data
+    """
+
+    return float(_single_chunk_energies(data, channels).rms[0])
+
+
+def peak(data: bytes, channels: int = 1) -> float:
+    """
+    Returns the largest absolute amplitude of the provided sound data.
+
+    Parameters
+        data (bytes): a byte representation of audio data
+        channels (int): the number of interleaved channels in the data
+
+    Returns
+        float: the peak amplitude in [0.0, 1.0]
+    """
+
+    return float(_single_chunk_energies(data, channels).peak[0])
+
+
+def zero_crossing_rate(data: bytes, channels: int = 1) -> float:
+    """
+    Returns the fraction of consecutive frames in the provided sound data
+    which change sign.
+
+    Parameters
+        data (bytes): a byte representation of audio data
+        channels (int): the number of interleaved channels in the data
+
+    Returns
+        float: the zero crossing rate in [0.0, 1.0]
+    """
+
+    return float(_single_chunk_energies(data, channels).zero_crossing_rate[0])
@@ -0,0 +1,292 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pydub import AudioSegment
+
+import audio_handler
+from capture_process import SharedRingBuffer
+from move_recognizer import list_dataset
+from text_move_enumerator import get_move_vocabulary
+
+# the stages of a move, from the end of speech to the move being accepted
+STAGES: List[str] = ['endpointing', 'trimming', 'recognition', 'normalization', 'submission', 'total']
+PERCENTILES: List[float] = [50.0, 95.0, 99.0]
+results_file_path: str = 'latency_benchmark.json'
+
+
+class ReplayCapture:
+    """
+    Stands in for CaptureProcess, writing recorded clips into the ring buffer
+    at the pace a microphone would, with room noise before, between and after
+    them. The times at which the speech of each clip starts and ends being
+    written are recorded, so latencies can be measured from the end of speech.
+
+    Parameters
+        clips ([np.ndarray]): int16 audio at the stream format
+        gap_seconds (float): the noise between the end of a clip and the next
+        noise_level (float): the rms of the room noise, as a fraction of full scale
+        ambient_seconds (float): the noise before the first clip, which must
+            cover the ambient noise measurement
+        seed (int): seeds the room noise
+    """
+
+    def __init__(self, clips: List[np.ndarray], gap_seconds: float = 1.5, noise_level: float = 0.002,
+                 ambient_seconds: float = audio_handler.RECORD_SECONDS + 1.0, seed: int = 0):
+        self.clips = clips
+        self.gap_seconds = gap_seconds
+        self.noise_level = noise_level
+        self.ambient_seconds = ambient_seconds
+        self.rng = np.random.default_rng(seed)
+        self.chunk_samples = audio_handler.STREAM_CHUNK * audio_handler.STREAM_CHANNELS
+        self.chunk_seconds = audio_handler.STREAM_CHUNK / audio_handler.STREAM_RATE
+        # wall clock times at which each clip's speech started and ended
+        self.speech_times: List[List[Optional[float]]] = [[None, None] for _ in clips]
+        self.ring = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def _noise(self, num_samples: int) -> np.ndarray:
+        return self.rng.normal(0.0, self.noise_level * 32768, num_samples)
+
+    def _stream(self) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+        """
+        Lays out the whole replay, returning the samples and the sample range
+        of the speech in every clip.
+        """
+
+        rate = audio_handler.STREAM_RATE * audio_handler.STREAM_CHANNELS
+        parts = [self._noise(int(self.ambient_seconds * rate))]
+        speech = []
+        position = len(parts[0])
+        for clip in self.clips:
+            voiced = np.flatnonzero(np.abs(clip) > 0.02 * max(1, np.abs(clip).max()))
+            start, end = (voiced[0], voiced[-1] + 1) if len(voiced) else (0, len(clip))
+            speech.append((position + int(start), position + int(end)))
+            parts.append(clip + self._noise(len(clip)))
+            parts.append(self._noise(int(self.gap_seconds * rate)))
+            position += len(clip) + len(parts[-1])
+        samples = np.clip(np.concatenate(parts), -32768, 32767).astype('<i2')
+        return samples, speech
+
+    def _replay(self):
+        samples, speech = self._stream()
+        start_time = time.monotonic()
+        chunk = 0
+        while not self.stop_event.is_set():
+            begin = chunk * self.chunk_samples
+            data = samples[begin:begin + self.chunk_samples]
+            if len(data) < self.chunk_samples:
+                data = np.concatenate([data, self._noise(self.chunk_samples - len(data)).astype('<i2')])
+            delay = start_time + chunk * self.chunk_seconds - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.ring.write(data.tobytes())
+            written = time.monotonic()
+            for index, (speech_start, speech_end) in enumerate(speech):
+                if begin <= speech_start < begin + self.chunk_samples:
+                    self.speech_times[index][0] = written
+                if begin < speech_end <= begin + self.chunk_samples:
+                    self.speech_times[index][1] = written
+            chunk += 1
+
+    def __enter__(self) -> SharedRingBuffer:
+        capacity = max(2, int(30.0 / self.chunk_seconds))
+        self.ring = SharedRingBuffer(capacity, self.chunk_samples * 2)
+        self.thread = threading.Thread(target=self._replay, daemon=True)
+        self.thread.start()
+        return self.ring
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        self.ring.close()
+
+
+class StubBoard:
+    """
+    Stands in for the Lichess board API, accepting a move after a fixed
+    latency if it is the move expected.
+
+    Parameters
+        latency (float): seconds each move submission takes
+    """
+
+    def __init__(self, latency: float = 0.15):
+        self.latency = latency
+        self.expected_move: Optional[str] = None
+
+    def make_move(self, game_id: str, move: str) -> bool:
+        time.sleep(self.latency)
+        return self.expected_move is None or move == self.expected_move
+
+
+def load_corpus(corpus_dir: str, count: int, seed: int = 0) -> List[Tuple[Optional[str], np.ndarray]]:
+    """
+    Reads a fixed random sample of clips, converted to the stream format.
+    Clips in a move_files tree are labelled with their move; loose wav files
+    are unlabelled.
+
+    Returns
+        [(str, np.ndarray)]: (move or None, int16 samples) pairs
+    """
+
+    files = list_dataset(corpus_dir)
+    if not files:
+        files = [(None, os.path.join(corpus_dir, name)) for name in sorted(os.listdir(corpus_dir))
+                 if name.lower().endswith('.wav')]
+    files = sorted(random.Random(seed).sample(files, min(count, len(files))), key=lambda file: file[1])
+    corpus = []
+    for move, file_path in files:
+        audio = AudioSegment.from_file(file_path).set_channels(audio_handler.STREAM_CHANNELS) \
+            .set_frame_rate(audio_handler.STREAM_RATE).set_sample_width(2)
+        corpus.append((move, np.frombuffer(audio.raw_data, dtype='<i2').astype(np.float64)))
+    return corpus
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    return {'p%d' % percentile: float(np.percentile(values, percentile)) for percentile in PERCENTILES}
+
+
+def run_replay(corpus: List[Tuple[Optional[str], np.ndarray]], recognizer_latency: float = 0.3,
+               board_latency: float = 0.15, backend: str = 'stub', gap_seconds: float = 1.5) -> Dict:
+    """
+    Replays a corpus through start_speech_to_text in place of the microphone
+    and measures every stage of each move. The recognizer answers with the
+    spoken form of the clip's move after recognizer_latency, or the local
+    recognizer is used with backend 'local'; processed moves are submitted to
+    a StubBoard.
+
+    Parameters
+        corpus ([(str, np.ndarray)]): (move or None, samples) pairs from load_corpus
+        recognizer_latency (float): seconds the stub recognizer takes
+        board_latency (float): seconds a move submission takes
+        backend (str): 'stub' or 'local'
+        gap_seconds (float): the noise between clips
+
+    Returns
+        dict: the per stage latencies in seconds of every utterance, their
+            percentiles and the number of moves accepted
+    """
+
+    vocabulary = get_move_vocabulary()
+    capture = ReplayCapture([samples for _, samples in corpus], gap_seconds)
+    board = StubBoard(board_latency)
+    records: List[Dict[str, float]] = []
+    current: Dict = {}
+    lock = threading.Lock()
+
+    def timed(stage: str, function):
+        def wrapper(*args, **kwargs):
+            start = time.monotonic()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                with lock:
+                    current[stage] = current.get(stage, 0.0) + time.monotonic() - start
+        return wrapper
+
+    def listen(*args, **kwargs):
+        current.clear()
+        audio = original['listen_for_utterance'](*args, **kwargs)
+        current['heard'] = time.monotonic()
+        # the utterance belongs to the latest clip whose speech has started
+        started = [index for index, (start, _) in enumerate(capture.speech_times) if start is not None]
+        current['clip'] = started[-1] if started else -1
+        board.expected_move = corpus[current['clip']][0] if started else None
+        return audio
+
+    def stub_alternatives(audio):
+        time.sleep(recognizer_latency)
+        move = corpus[current['clip']][0] if current.get('clip', -1) >= 0 else None
+        return [(vocabulary.to_voice(move) if move else '', 0.9)]
+
+    def submit(move: str):
+        start = time.monotonic()
+        accepted = board.make_move('replay', move)
+        end = time.monotonic()
+        speech_end = capture.speech_times[current['clip']][1] if current['clip'] >= 0 else None
+        if speech_end is None:
+            return
+        trimming = current.get('trimming', 0.0)
+        normalization = current.get('normalization', 0.0)
+        records.append({
+            'clip': current['clip'],
+            'accepted': bool(accepted),
+            'endpointing': current['heard'] - trimming - speech_end,
+            'trimming': trimming,
+            'recognition': current.get('recognition', 0.0) - normalization,
+            'normalization': normalization,
+            'submission': end - start,
+            'total': end - speech_end,
+        })
+
+    original = {name: getattr(audio_handler, name) for name in
+                ('listen_for_utterance', 'frames_to_audio_data', 'recognize_move', 'rescore_alternatives',
+                 'request_alternatives', 'recognition_backend')}
+    audio_handler.listen_for_utterance = listen
+    audio_handler.frames_to_audio_data = timed('trimming', original['frames_to_audio_data'])
+    audio_handler.recognize_move = timed('recognition', original['recognize_move'])
+    audio_handler.rescore_alternatives = timed('normalization', original['rescore_alternatives'])
+    if backend == 'local':
+        audio_handler.recognition_backend = 'local'
+    else:
+        audio_handler.recognition_backend = 'google'
+        audio_handler.request_alternatives = stub_alternatives
+    try:
+        audio_handler.start_speech_to_text(capture=capture, move_handler=submit, max_utterances=len(corpus))
+    finally:
+        for name, value in original.items():
+            setattr(audio_handler, name, value)
+
+    return {
+        'utterances': len(records),
+        'clips': len(corpus),
+        'accepted': sum(record['accepted'] for record in records),
+        'settings': {'recognizer_latency': recognizer_latency, 'board_latency': board_latency,
+                     'backend': backend, 'gap_seconds': gap_seconds,
+                     'stream_rate': audio_handler.STREAM_RATE, 'stream_chunk': audio_handler.STREAM_CHUNK},
+        'percentiles': {stage: percentiles([record[stage] for record in records]) for stage in STAGES},
+        'records': records,
+    }
+
+
+if __name__ == "__main__":
+    """
+    Replays clips from the directory given as the first argument, by default
+    the generated move_files, through the speech pipeline and prints the
+    p50, p95 and p99 latency of every stage. Pass --clips <count> to change
+    the sample size, --recognizer-latency and --board-latency <seconds> to
+    configure the stubs, --local to recognize with the offline recognizer
+    and --output <path> to also write the results as JSON.
+    """
+
+    arguments = sys.argv[1:]
+    option = lambda name, default: type(default)(arguments[arguments.index(name) + 1]) \
+        if name in arguments else default
+    options = {'--clips', '--recognizer-latency', '--board-latency', '--output'}
+    positional = [argument for index, argument in enumerate(arguments)
+                  if not argument.startswith('--') and (index == 0 or arguments[index - 1] not in options)]
+    corpus_dir = positional[0] if positional else os.path.join(audio_handler.network_training_directory,
+                                                               'move_files')
+
+    corpus = load_corpus(corpus_dir, option('--clips', 20))
+    results = run_replay(corpus, option('--recognizer-latency', 0.3), option('--board-latency', 0.15),
+                         'local' if '--local' in arguments else 'stub')
+
+    print('\nReplayed %d clips, %d utterances, %d moves accepted' % (
+        results['clips'], results['utterances'], results['accepted']))
+    print('%-14s %9s %9s %9s' % ('stage', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for stage, values in results['percentiles'].items():
+        if values:
+            print('%-14s %9.1f %9.1f %9.1f' % (stage, 1000 * values['p50'], 1000 * values['p95'], 1000 * values['p99']))
+    if '--output' in arguments:
+        with open(option('--output', results_file_path), 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,249 @@
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
+
+# instrumentation is off unless enabled, in which case timers and counters
+# return after a single check of this flag
+enabled: bool = False
+
+METRICS_PORT: int = 9464
+# upper bounds in seconds of the latency histogram buckets, the last bucket
+# holds everything slower
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                                      0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_counters: Dict[str, int] = {}
+_histograms: Dict[str, 'Histogram'] = {}
+_started: float = time.monotonic()
+
+
+class Histogram:
+    """
+    Counts observations into fixed buckets, keeping their sum and count.
+
+    Parameters
+        buckets ((float)): increasing upper bounds of the buckets
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction: float) -> float:
+        """
+        Returns the upper bound of the bucket holding the given quantile, or
+        infinity if it falls in the last bucket.
+        """
+
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self) -> Dict:
+        return {'count': self.count, 'sum': self.sum, 'buckets': list(self.buckets), 'counts': list(self.counts),
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99)}
+
+
+def enable():
+    """
+    Turns instrumentation on.
+    """
+
+    global enabled
+    enabled = True
+
+
+def reset():
+    """
+    Forgets every recorded counter and histogram.
+    """
+
+    global _started
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _started = time.monotonic()
+
+
+def count(name: str, amount: int = 1):
+    """
+    Adds amount to the counter name.
+    """
+
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def observe(name: str, value: float, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+    """
+    Records value in the histogram name.
+    """
+
+    if not enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram(buckets)
+        histogram.observe(value)
+
+
+class _Disabled:
+    # shared no-op context manager returned by timer while disabled
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_disabled = _Disabled()
+
+
+class _Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        observe(self.name + '_seconds', time.monotonic() - self.start)
+        if exc_type is not None:
+            count(self.name + '_errors')
+        return False
+
+
+def timer(name: str):
+    """
+    Returns a context manager timing its block into the histogram
+    name + '_seconds' with a monotonic clock. Exceptions raised in the block
+    are counted in name + '_errors'.
+
+    Parameters
+        name (str): the name of the timed stage
+    """
+
+    return _Timer(name) if enabled else _disabled
+
+
+def snapshot() -> Dict:
+    """
+    Returns every counter and histogram as a JSON serializable dict.
+    """
+
+    with _lock:
+        return {'uptime_seconds': time.monotonic() - _started, 'pid': os.getpid(),
+                'counters': dict(_counters),
+                'histograms': {name: histogram.snapshot() for name, histogram in _histograms.items()}}
+
+
+def to_json() -> str:
+    return json.dumps(snapshot(), indent=2)
+
+
+def to_text() -> str:
+    """
+    Returns the metrics in the Prometheus text exposition format.
+    """
+
+    data = snapshot()
+    lines = []
+    for name, value in sorted(data['counters'].items()):
+        lines.append('# TYPE %s counter' % name)
+        lines.append('%s %d' % (name, value))
+    for name, histogram in sorted(data['histograms'].items()):
+        lines.append('# TYPE %s histogram' % name)
+        cumulative = 0
+        for bound, bucket_count in zip(histogram['buckets'] + ['+Inf'], histogram['counts']):
+            cumulative += bucket_count
+            lines.append('%s_bucket{le="%s"} %d' % (name, bound, cumulative))
+        lines.append('%s_sum %f' % (name, histogram['sum']))
+        lines.append('%s_count %d' % (name, histogram['count']))
+    return '\n'.join(lines) + '\n'
+
+
+def serve(port: int = METRICS_PORT) -> ThreadingHTTPServer:
+    """
+    Serves the metrics on localhost from a daemon thread, as text at /metrics
+    and as JSON at /metrics.json.
+
+    Parameters
+        port (int): the port to listen on, 0 for any free port
+
+    Returns
+        ThreadingHTTPServer: the running server
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics.json':
+                body, content_type = to_json().encode('utf-8'), 'application/json'
+            elif self.path == '/metrics':
+                body, content_type = to_text().encode('utf-8'), 'text/plain; version=0.0.4'
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def dump(file_path: str):
+    """
+    Writes the metrics as JSON, replacing the file atomically.
+    """
+
+    with open(file_path + '.partial', 'w') as file:
+        file.write(to_json())
+    os.replace(file_path + '.partial', file_path)
+
+
+def start_dumping(file_path: str, interval: float = 10.0) -> threading.Event:
+    """
+    Dumps the metrics to file_path every interval seconds from a daemon
+    thread, until the returned event is set.
+    """
+
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            dump(file_path)
+        dump(file_path)
+
+    threading.Thread(target=run, daemon=True).start()
+    return stop
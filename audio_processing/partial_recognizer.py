@@ -0,0 +1,115 @@
+from typing import Callable, Dict, NamedTuple, Optional
+
+import numpy as np
+
+from resampler import PolyphaseResampler, downmix
+
+
+class PartialHypothesis(NamedTuple):
+    """
+    The best guess at the move being spoken, based on the audio so far.
+
+    Fields
+        move (str): the most likely move
+        score (float): the recognizer's score for the move
+        margin (float): how far the move's score is ahead of the runner up
+        committed (bool): whether the hypothesis is final
+    """
+
+    move: str
+    score: float
+    margin: float
+    committed: bool
+
+
+class PartialRecognizer:
+    """
+    Runs a move recognizer on an utterance while it is still being spoken.
+    Chunks are fed in as they are captured and a partial hypothesis is
+    produced every few chunks. Once the same move has led the candidates by a
+    clear margin for several hypotheses in a row it is committed, so the move
+    can be played before trailing silence confirms the end of the utterance.
+
+    Parameters
+        score_moves (function): maps mono samples at model_rate to a dict of
+            move scores, restricted to the candidate moves
+        input_rate (int): the sample rate of the fed chunks
+        input_channels (int): the number of interleaved channels in the fed chunks
+        model_rate (int): the sample rate the recognizer expects
+        interval_samples (int): input samples between hypotheses
+        min_samples (int): input samples required before the first hypothesis
+        commit_margin (float): score lead over the runner up required to commit
+        stable_hypotheses (int): consecutive agreeing hypotheses required to commit
+    """
+
+    def __init__(self, score_moves: Callable[[np.ndarray], Dict[str, float]], input_rate: int,
+                 input_channels: int = 1, model_rate: int = 16000, interval_samples: int = 1600,
+                 min_samples: int = 4800, commit_margin: float = 0.1, stable_hypotheses: int = 3):
+        self.score_moves = score_moves
+        self.input_rate = input_rate
+        self.input_channels = input_channels
+        self.model_rate = model_rate
+        self.interval_samples = interval_samples
+        self.min_samples = min_samples
+        self.commit_margin = commit_margin
+        self.stable_hypotheses = stable_hypotheses
+        self.reset()
+
+    def reset(self):
+        """
+        Discards the audio of the current utterance.
+        """
+
+        self.resampler = None if self.input_rate == self.model_rate else \
+            PolyphaseResampler(self.input_rate, self.model_rate)
+        self.samples = np.zeros(0, dtype=np.float32)
+        self.input_samples = 0
+        self.next_hypothesis_at = self.min_samples
+        self.leading_move = None
+        self.leading_count = 0
+        self.committed_move: Optional[str] = None
+
+    def feed(self, data: bytes) -> Optional[PartialHypothesis]:
+        """
+        Adds captured audio to the current utterance.
+
+        Parameters
+            data (bytes): one or more chunks of 16 bit audio data
+
+        Returns
+            PartialHypothesis: a new hypothesis if one was due, otherwise None
+        """
+
+        if self.committed_move is not None:
+            return None
+
+        mono = downmix(data, self.input_channels)
+        self.input_samples += len(mono)
+        if self.resampler is not None:
+            mono = self.resampler.process(mono)
+        self.samples = np.concatenate((self.samples, mono))
+
+        if self.input_samples < self.next_hypothesis_at:
+            return None
+        self.next_hypothesis_at = self.input_samples + self.interval_samples
+        return self._hypothesize()
+
+    def _hypothesize(self) -> Optional[PartialHypothesis]:
+        scores = self.score_moves(self.samples)
+        if len(scores) == 0:
+            return None
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        move, score = ranked[0]
+        margin = score - ranked[1][1] if len(ranked) > 1 else score
+
+        if move == self.leading_move and margin >= self.commit_margin:
+            self.leading_count += 1
+        else:
+            self.leading_move = move
+            self.leading_count = 1 if margin >= self.commit_margin else 0
+
+        committed = len(ranked) == 1 or self.leading_count >= self.stable_hypotheses
+        if committed:
+            self.committed_move = move
+        return PartialHypothesis(move, score, margin, committed)
@@ -0,0 +1,186 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional
+
+
+class RecognitionResult(NamedTuple):
+    """
+    The outcome of a recognition race.
+
+    Fields
+        move (str): the accepted move
+        backend (str): the name of the backend which produced it
+        latency (float): seconds from the start of the race to the result
+    """
+
+    move: str
+    backend: str
+    latency: float
+
+
+class BackendStats:
+    """
+    Running totals for a single recognition backend.
+    """
+
+    def __init__(self):
+        self.attempts = 0
+        self.completions = 0
+        self.wins = 0
+        self.failures = 0
+        self.skipped = 0
+        self.total_latency = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'attempts': self.attempts,
+            'wins': self.wins,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'win_rate': self.wins / self.attempts if self.attempts else 0.0,
+            'mean_latency': self.total_latency / self.completions if self.completions else None,
+        }
+
+
+class RecognitionCoordinator:
+    """
+    Sends the same utterance to several recognition backends at once and
+    returns the first result which maps to a valid move. Backends which are
+    still running when a winner is found, or when the deadline passes, are
+    cancelled if they have not started and ignored otherwise.
+
+    A backend which is still busy with max_in_flight earlier utterances, such
+    as one stuck on a network timeout, sits out the next races instead of
+    being given more work, so stragglers never pile up.
+
+    Parameters
+        backends ({str: function}): named functions taking the utterance and
+            returning a transcript or move, or None if nothing was recognized
+        accept (function): maps a backend result to a valid move, or to None
+            if the result is not usable
+        deadline (float): the longest time in seconds to wait for a usable result
+        max_in_flight (int): the most utterances a backend works on at once
+    """
+
+    def __init__(self, backends: Dict[str, Callable], accept: Callable[[str], Optional[str]], deadline: float = 3.0,
+                 max_in_flight: int = 1):
+        self.backends = dict(backends)
+        self.accept = accept
+        self.deadline = deadline
+        self.max_in_flight = max_in_flight
+        self.stats: Dict[str, BackendStats] = {name: BackendStats() for name in self.backends}
+        self.in_flight: Dict[str, int] = {name: 0 for name in self.backends}
+        self.stats_lock = threading.Lock()
+        # one thread per permitted call, so a submitted backend always starts at once
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_in_flight * len(self.backends)),
+                                           thread_name_prefix='recognizer')
+
+    def _run_backend(self, name: str, audio, start: float) -> Optional[str]:
+        try:
+            result = self.backends[name](audio)
+            failed = result is None
+        except Exception:
+            result = None
+            failed = True
+
+        with self.stats_lock:
+            stats = self.stats[name]
+            stats.completions += 1
+            stats.total_latency += time.monotonic() - start
+            stats.failures += failed
+            self.in_flight[name] -= 1
+        return result
+
+    def recognize(self, audio, deadline: Optional[float] = None) -> Optional[RecognitionResult]:
+        """
+        Races every backend on the provided utterance.
+
+        Parameters
+            audio: the utterance, passed unchanged to every backend
+            deadline (float): overrides the coordinator deadline for this call
+
+        Returns
+            RecognitionResult: the first usable result, or None if no backend
+                produced a valid move before the deadline
+        """
+
+        start = time.monotonic()
+        end = start + (self.deadline if deadline is None else deadline)
+
+        futures = {}
+        for name in self.backends:
+            with self.stats_lock:
+                if self.in_flight[name] >= self.max_in_flight:
+                    self.stats[name].skipped += 1
+                    continue
+                self.in_flight[name] += 1
+                self.stats[name].attempts += 1
+            futures[self.executor.submit(self._run_backend, name, audio, start)] = name
+
+        winner = None
+        pending = set(futures)
+        while pending and winner is None:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                move = None if result is None else self.accept(result)
+                if move is not None:
+                    winner = RecognitionResult(move, futures[future], time.monotonic() - start)
+                    break
+
+        for future in pending:
+            if future.cancel():
+                with self.stats_lock:
+                    self.in_flight[futures[future]] -= 1
+
+        if winner is not None:
+            with self.stats_lock:
+                self.stats[winner.backend].wins += 1
+        return winner
+
+    def report(self) -> Dict[str, dict]:
+        """
+        Returns the win rate, failure and skip counts and mean latency of
+        every backend.
+        """
+
+        with self.stats_lock:
+            return {name: stats.as_dict() for name, stats in self.stats.items()}
+
+    def shutdown(self):
+        """
+        Stops the worker threads once any running backends have finished.
+        """
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    """
+    Main method for testing, racing local stand-in backends with fixed delays
+    """
+
+    import random
+
+    def stand_in(delay: float, transcript: Optional[str]):
+        def backend(audio):
+            time.sleep(random.uniform(0.5, 1.5) * delay)
+            return transcript
+        return backend
+
+    valid_moves = {'e4', 'Nf3', 'd4'}
+    coordinator = RecognitionCoordinator({
+        'fast_invalid': stand_in(0.05, 'hello'),
+        'medium_valid': stand_in(0.1, 'e4'),
+        'slow_valid': stand_in(0.12, 'Nf3'),
+        'silent': stand_in(0.02, None),
+    }, accept=lambda text: text if text in valid_moves else None, deadline=0.5)
+
+    for _ in range(20):
+        print(coordinator.recognize(None))
+    print(coordinator.report())
+    coordinator.shutdown()
@@ -0,0 +1,101 @@
+import sys
+import time
+
+import numpy as np
+
+import frame_energy
+from resampler import CaptureConverter
+
+CAPTURE_RATE = 44100
+CAPTURE_CHANNELS = 2
+CAPTURE_CHUNK = 1024
+TARGET_RATE = 16000
+TARGET_CHUNK = 384
+
+
+def synthesize_capture(seconds: float, seed: int = 0) -> list:
+    """
+    Builds a list of stereo capture chunks holding a noisy, amplitude
+    modulated tone, roughly resembling speech over room noise.
+
+    Parameters
+        seconds (float): the length of audio to generate
+        seed (int): the seed of the noise generator
+
+    Returns
+        [bytes]: chunks as they would be returned by the capture stream
+    """
+
+    rng = np.random.default_rng(seed)
+    num_frames = int(seconds * CAPTURE_RATE) // CAPTURE_CHUNK * CAPTURE_CHUNK
+    t = np.arange(num_frames) / CAPTURE_RATE
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)
+    signal = 8000 * envelope * np.sin(2 * np.pi * 220 * t) + rng.normal(0, 300, num_frames)
+    stereo = np.repeat(signal[:, None], CAPTURE_CHANNELS, axis=1).astype(np.int16).tobytes()
+    chunk_bytes = CAPTURE_CHUNK * CAPTURE_CHANNELS * 2
+    return [stereo[i:i + chunk_bytes] for i in range(0, len(stereo), chunk_bytes)]
+
+
+def run_benchmark(seconds: float = 60.0) -> dict:
+    """
+    Compares the cost of processing captured audio at the capture format
+    with converting it first and processing the reduced stream.
+
+    Parameters
+        seconds (float): the length of audio to process
+
+    Returns
+        dict: CPU seconds and bytes for each path
+    """
+
+    chunks = synthesize_capture(seconds)
+
+    # capture format: energy on every raw chunk
+    start = time.process_time()
+    for chunk in chunks:
+        frame_energy.rms(chunk, CAPTURE_CHANNELS)
+    raw_cpu = time.process_time() - start
+    raw_bytes = sum(len(chunk) for chunk in chunks)
+
+    # conversion stage, which runs in the capture process
+    converter = CaptureConverter(CAPTURE_RATE, CAPTURE_CHANNELS, TARGET_RATE, TARGET_CHUNK)
+    converted_chunks = []
+    start = time.process_time()
+    for chunk in chunks:
+        converted_chunks.extend(converter.process(chunk))
+    conversion_cpu = time.process_time() - start
+    converted_bytes = sum(len(chunk) for chunk in converted_chunks)
+
+    # converted format: energy on every reduced chunk
+    start = time.process_time()
+    for chunk in converted_chunks:
+        frame_energy.rms(chunk)
+    converted_cpu = time.process_time() - start
+
+    return {
+        'audio_seconds': seconds,
+        'raw_cpu_seconds': raw_cpu,
+        'raw_bytes': raw_bytes,
+        'conversion_cpu_seconds': conversion_cpu,
+        'converted_cpu_seconds': converted_cpu,
+        'converted_bytes': converted_bytes,
+    }
+
+
+if __name__ == "__main__":
+    """
+    Prints the CPU time and bytes used per second of audio with and without
+    the capture conversion stage. Pass the number of seconds to process as
+    the first argument.
+    """
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 60.0
+    results = run_benchmark(seconds)
+
+    print('Processed ' + str(seconds) + ' s of ' + str(CAPTURE_CHANNELS) + ' channel ' + str(CAPTURE_RATE) + ' Hz audio')
+    print('  energy at capture format:   %8.2f ms CPU/s  %9d bytes/s' %
+          (1000 * results['raw_cpu_seconds'] / seconds, results['raw_bytes'] / seconds))
+    print('  energy at converted format: %8.2f ms CPU/s  %9d bytes/s' %
+          (1000 * results['converted_cpu_seconds'] / seconds, results['converted_bytes'] / seconds))
+    print('  conversion stage:           %8.2f ms CPU/s' % (1000 * results['conversion_cpu_seconds'] / seconds))
+    print('  bytes stored and sent to the recognizer reduced %.1fx' % (results['raw_bytes'] / results['converted_bytes']))
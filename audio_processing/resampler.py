@@ -0,0 +1,163 @@
+from math import gcd
+from typing import List
+
+import numpy as np
+
+import frame_energy
+
+
+def downmix(data: bytes, channels: int) -> np.ndarray:
+    """
+    Averages the interleaved channels of the provided audio data into a
+    single channel.
+
+    Parameters
+        data (bytes): a byte representation of 16 bit audio data
+        channels (int): the number of interleaved channels in the data
+
+    Returns
+        np.ndarray: float32 mono samples on the int16 scale
+    """
+
+    samples = frame_energy.frame_view(data, channels)
+    if channels == 1:
+        return samples[:, 0].astype(np.float32)
+    return samples.mean(axis=1, dtype=np.float32)
+
+
+def design_polyphase_filter(up: int, down: int, taps_per_phase: int, cutoff: float = 0.9,
+                            kaiser_beta: float = 6.0) -> np.ndarray:
+    """
+    Designs a windowed-sinc low pass filter for rational resampling by
+    up / down and splits it into its polyphase components.
+
+    Parameters
+        up (int): the interpolation factor
+        down (int): the decimation factor
+        taps_per_phase (int): the number of input samples each output depends on
+        cutoff (float): the passband edge as a fraction of the lower Nyquist rate
+        kaiser_beta (float): the shape parameter of the Kaiser window
+
+    Returns
+        np.ndarray: an array of shape (up, taps_per_phase) where row p holds the
+            taps applied to the most recent input samples for output phase p
+    """
+
+    length = up * taps_per_phase
+    # normalized to the upsampled rate, in cycles per sample
+    cutoff_frequency = cutoff * 0.5 / max(up, down)
+    n = np.arange(length) - (length - 1) / 2.0
+    prototype = 2 * cutoff_frequency * np.sinc(2 * cutoff_frequency * n) * np.kaiser(length, kaiser_beta)
+    # zero stuffing divides the signal energy by up, so restore it in the filter gain
+    prototype *= up / prototype.sum()
+    return prototype.reshape(taps_per_phase, up).T.astype(np.float32)
+
+
+class PolyphaseResampler:
+    """
+    Streaming rational sample rate converter. Input may be passed in chunks of
+    any size; filter history is carried between calls so the output is the
+    same as resampling the whole signal at once.
+
+    Parameters
+        input_rate (int): the sample rate of the input
+        output_rate (int): the sample rate to convert to
+        taps_per_phase (int): the filter length in input samples
+    """
+
+    def __init__(self, input_rate: int, output_rate: int, taps_per_phase: int = 64):
+        divisor = gcd(input_rate, output_rate)
+        self.up = output_rate // divisor
+        self.down = input_rate // divisor
+        self.taps_per_phase = taps_per_phase
+        self.filters = design_polyphase_filter(self.up, self.down, taps_per_phase)
+        self.tap_offsets = np.arange(taps_per_phase)
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the filter history so the next input starts a new signal.
+        """
+
+        self.history = np.zeros(self.taps_per_phase - 1, dtype=np.float32)
+        self.samples_consumed = 0
+        # position of the next output in the upsampled time base
+        self.next_output_position = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Resamples the next block of a mono signal.
+
+        Parameters
+            samples (np.ndarray): the next input samples
+
+        Returns
+            np.ndarray: float32 output samples which could be computed from
+                the input seen so far
+        """
+
+        extended = np.concatenate((self.history, samples.astype(np.float32, copy=False)))
+        total_input = self.samples_consumed + len(samples)
+
+        # an output is ready once the newest input sample it depends on has arrived
+        last_position = total_input * self.up
+        positions = np.arange(self.next_output_position, last_position, self.down, dtype=np.int64)
+        newest_input = positions // self.up
+        phases = positions % self.up
+
+        # gather the window of recent input samples for every output at once
+        window_ends = newest_input - self.samples_consumed + self.taps_per_phase - 1
+        windows = extended[window_ends[:, None] - self.tap_offsets]
+        output = np.einsum('nk,nk->n', self.filters[phases], windows)
+
+        if len(positions) > 0:
+            self.next_output_position = int(positions[-1]) + self.down
+        self.history = extended[len(extended) - (self.taps_per_phase - 1):]
+        self.samples_consumed = total_input
+        return output
+
+
+class CaptureConverter:
+    """
+    Conversion stage applied to microphone chunks straight after capture.
+    Interleaved input is downmixed to mono, resampled to the target rate and
+    regrouped into fixed size 16 bit output chunks.
+
+    Parameters
+        input_rate (int): the capture sample rate
+        input_channels (int): the number of captured channels
+        output_rate (int): the sample rate to convert to
+        output_chunk (int): the number of frames in each output chunk
+    """
+
+    def __init__(self, input_rate: int, input_channels: int, output_rate: int, output_chunk: int):
+        self.input_channels = input_channels
+        self.output_chunk = output_chunk
+        self.resampler = None if input_rate == output_rate else PolyphaseResampler(input_rate, output_rate)
+        self.pending = np.zeros(0, dtype=np.float32)
+
+    def process(self, data: bytes) -> List[bytes]:
+        """
+        Converts a captured chunk.
+
+        Parameters
+            data (bytes): a chunk of captured 16 bit audio data
+
+        Returns
+            [bytes]: every output chunk completed by this input, possibly none
+        """
+
+        mono = downmix(data, self.input_channels)
+        if self.resampler is not None:
+            mono = self.resampler.process(mono)
+        self.pending = np.concatenate((self.pending, mono))
+
+        num_chunks = len(self.pending) // self.output_chunk
+        if num_chunks == 0:
+            return []
+
+        ready = self.pending[:num_chunks * self.output_chunk]
+        self.pending = self.pending[num_chunks * self.output_chunk:]
+        pcm = np.clip(np.rint(ready), -32768, 32767).astype(frame_energy.SAMPLE_DTYPE).tobytes()
+        chunk_bytes = self.output_chunk * frame_energy.SAMPLE_DTYPE.itemsize
+        return [pcm[i:i + chunk_bytes] for i in range(0, len(pcm), chunk_bytes)]
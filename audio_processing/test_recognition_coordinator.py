@@ -0,0 +1,142 @@
+import threading
+import time
+import unittest
+from typing import Optional
+
+from recognition_coordinator import RecognitionCoordinator
+
+VALID_MOVES = {'e4', 'Nf3', 'd4'}
+
+
+def accept_move(text: str) -> Optional[str]:
+    return text if text in VALID_MOVES else None
+
+
+def stub(delay: float, transcript: Optional[str], calls: Optional[list] = None):
+    """
+    Returns a backend answering with transcript after delay seconds, noting
+    every call in calls.
+    """
+
+    def backend(audio):
+        if calls is not None:
+            calls.append(audio)
+        time.sleep(delay)
+        return transcript
+    return backend
+
+
+def blocking(release: threading.Event, transcript: Optional[str], calls: list):
+    """
+    Returns a backend which only answers once release is set.
+    """
+
+    def backend(audio):
+        calls.append(audio)
+        release.wait()
+        return transcript
+    return backend
+
+
+def failing(audio):
+    raise ConnectionError('backend unavailable')
+
+
+class RecognitionCoordinatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.coordinators = []
+
+    def tearDown(self):
+        for coordinator in self.coordinators:
+            coordinator.shutdown()
+
+    def coordinator(self, backends, deadline: float = 1.0, **kwargs) -> RecognitionCoordinator:
+        coordinator = RecognitionCoordinator(backends, accept_move, deadline, **kwargs)
+        self.coordinators.append(coordinator)
+        return coordinator
+
+    def test_first_valid_result_wins(self):
+        coordinator = self.coordinator({
+            'fast_invalid': stub(0.01, 'hello'),
+            'medium_valid': stub(0.05, 'e4'),
+            'slow_valid': stub(0.3, 'Nf3'),
+        })
+
+        result = coordinator.recognize('utterance')
+
+        self.assertEqual(result.move, 'e4')
+        self.assertEqual(result.backend, 'medium_valid')
+        self.assertLess(result.latency, 0.3)
+        self.assertEqual(coordinator.report()['medium_valid']['wins'], 1)
+        self.assertEqual(coordinator.report()['slow_valid']['wins'], 0)
+
+    def test_deadline_expiry_returns_fallback(self):
+        release = threading.Event()
+        coordinator = self.coordinator({'hung': blocking(release, 'e4', []), 'invalid': stub(0.01, 'hello')},
+                                       deadline=0.1)
+
+        start = time.monotonic()
+        result = coordinator.recognize('utterance')
+        elapsed = time.monotonic() - start
+        release.set()
+
+        self.assertIsNone(result)
+        self.assertLess(elapsed, 0.5)
+
+    def test_deadline_can_be_overridden(self):
+        coordinator = self.coordinator({'slow_valid': stub(0.2, 'd4')}, deadline=0.05)
+
+        self.assertIsNone(coordinator.recognize('utterance'))
+        time.sleep(0.3)
+        self.assertEqual(coordinator.recognize('utterance', deadline=1.0).move, 'd4')
+
+    def test_failing_backend_is_counted(self):
+        coordinator = self.coordinator({'failing': failing, 'silent': stub(0.0, None), 'valid': stub(0.05, 'Nf3')})
+
+        result = coordinator.recognize('utterance')
+        time.sleep(0.1)
+        report = coordinator.report()
+
+        self.assertEqual(result.backend, 'valid')
+        self.assertEqual(report['failing']['attempts'], 1)
+        self.assertEqual(report['failing']['failures'], 1)
+        self.assertEqual(report['silent']['failures'], 1)
+        self.assertEqual(report['valid']['failures'], 0)
+
+    def test_stragglers_are_abandoned_and_not_given_more_work(self):
+        release = threading.Event()
+        straggler_calls = []
+        coordinator = self.coordinator({'straggler': blocking(release, 'e4', straggler_calls),
+                                        'valid': stub(0.01, 'd4')})
+
+        # the winner is returned while the straggler is still running
+        for utterance in range(5):
+            self.assertEqual(coordinator.recognize(utterance).backend, 'valid')
+        self.assertEqual(straggler_calls, [0])
+        self.assertEqual(coordinator.report()['straggler']['skipped'], 4)
+
+        # once it finishes, its late result is discarded and it races again
+        release.set()
+        time.sleep(0.1)
+        self.assertEqual(coordinator.report()['straggler']['wins'], 0)
+        coordinator.recognize(5)
+        self.assertEqual(straggler_calls, [0, 5])
+
+    def test_in_flight_work_is_bounded_under_repeated_timeouts(self):
+        release = threading.Event()
+        calls = []
+        coordinator = self.coordinator({'hung': blocking(release, 'e4', calls)}, deadline=0.02, max_in_flight=2)
+
+        for utterance in range(10):
+            self.assertIsNone(coordinator.recognize(utterance))
+        busy_threads = coordinator.in_flight['hung']
+        release.set()
+
+        self.assertEqual(calls, [0, 1])
+        self.assertEqual(busy_threads, 2)
+        self.assertEqual(coordinator.report()['hung']['skipped'], 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import numpy as np
+import speech_recognition as sr
+
+import frame_energy
+
+
+def frames_to_audio_data(frames: bytes, channels: int, sample_rate: int, sample_width: int = 2) -> sr.AudioData:
+    """
+    Packages captured audio for a speech_recognition recognizer. Recognizers
+    expect mono audio, so interleaved channels are averaged.
+
+    Parameters
+        frames (bytes): interleaved audio data, or a memoryview of it
+        channels (int): the number of interleaved channels in the data
+        sample_rate (int): the sample rate of the captured audio
+        sample_width (int): the number of bytes in each sample
+
+    Returns
+        sr.AudioData: the provided audio
+    """
+
+    if channels == 1:
+        return sr.AudioData(bytes(frames), sample_rate, sample_width)
+
+    samples = frame_energy.frame_view(frames, channels)
+    mono = samples.mean(axis=1, dtype=np.float64).astype(frame_energy.SAMPLE_DTYPE)
+    return sr.AudioData(mono.tobytes(), sample_rate, sample_width)
+
@@ -0,0 +1,268 @@
+from fractions import Fraction
+import os
+import sys
+import wave
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+from pydub import AudioSegment
+
+# the sample format and resampler of the live recorder are shared with audio_processing
+audio_processing_directory: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'audio_processing')
+sys.path.append(audio_processing_directory)
+
+import frame_energy
+from resampler import PolyphaseResampler
+
+# speed factors are approximated by a ratio of integers up to this size,
+# within a fraction of a cent for semitone shifts
+MAX_SPEED_DENOMINATOR: int = 100
+
+
+class AugmentationPlan(NamedTuple):
+    """
+    The variants derived from a single TTS render. Every combination of the
+    listed pitch and tempo changes is produced, and each of those is
+    additionally produced with every noise level and every room.
+
+    Fields
+        pitches ((int)): semitone shifts, 0 keeps the render as is
+        tempos ((float)): speed factors which keep the pitch, 1.0 for none
+        noise_snrs ((float)): signal to noise ratios in dB of added white noise
+        rooms ((float)): reverberation times in seconds of simulated rooms
+    """
+
+    pitches: Tuple[int, ...] = (0,)
+    tempos: Tuple[float, ...] = (1.0,)
+    noise_snrs: Tuple[float, ...] = ()
+    rooms: Tuple[float, ...] = ()
+
+
+def load_render(file_path: str) -> Tuple[np.ndarray, int]:
+    """
+    Reads a rendered clip as mono float32 samples in [-1, 1].
+
+    Returns
+        (np.ndarray, int): the samples and their sample rate
+    """
+
+    audio = AudioSegment.from_file(file_path).set_channels(1).set_sample_width(2)
+    samples = np.frombuffer(audio.raw_data, dtype=frame_energy.SAMPLE_DTYPE).astype(np.float32)
+    return samples * np.float32(frame_energy.SAMPLE_SCALE), audio.frame_rate
+
+
+def to_pcm(samples: np.ndarray) -> np.ndarray:
+    """
+    Converts float samples in [-1, 1] to 16 bit samples on the scale
+    load_render reads them with, clipping anything out of range.
+    """
+
+    return np.clip(np.rint(samples / frame_energy.SAMPLE_SCALE), -32768, 32767).astype(frame_energy.SAMPLE_DTYPE)
+
+
+def write_wav(file_path: str, samples: np.ndarray, sample_rate: int):
+    """
+    Writes float samples in [-1, 1] as a 16 bit mono wav file.
+    """
+
+    pcm = to_pcm(samples)
+    with wave.open(file_path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+
+
+def resample_speed(samples: np.ndarray, factor: float) -> np.ndarray:
+    """
+    Plays samples back factor times faster, raising the pitch and shortening
+    the clip as a faster tape would. The clip is resampled with the band
+    limited PolyphaseResampler of the live recorder, so speeding up does not
+    alias.
+    """
+
+    if factor == 1.0 or len(samples) < 2:
+        return samples
+    ratio = Fraction(factor).limit_denominator(MAX_SPEED_DENOMINATOR)
+    resampler = PolyphaseResampler(ratio.numerator, ratio.denominator)
+    # flush the filter with silence and drop its delay, so the output lines up with the input
+    taps = resampler.taps_per_phase
+    output = resampler.process(np.concatenate((samples, np.zeros(taps, dtype=np.float32))))
+    delay = int(round((taps - 1) / 2 * ratio.denominator / ratio.numerator))
+    return output[delay:delay + int(len(samples) * ratio.denominator / ratio.numerator)]
+
+
+def pitch_shift(samples: np.ndarray, semitones: float) -> np.ndarray:
+    """
+    Shifts the pitch by the given number of semitones by resampling, so the
+    clip also speeds up by the same factor.
+    """
+
+    return resample_speed(samples, 2.0 ** (semitones / 12.0))
+
+
+def change_tempo(samples: np.ndarray, factor: float, sample_rate: int, frame_seconds: float = 0.03) -> np.ndarray:
+    """
+    Speeds speech up or slows it down without changing its pitch, using
+    waveform similarity overlap-add: windowed frames are taken at a different
+    hop than they are placed at, each shifted slightly so that it lines up
+    with the continuation of the frame before it.
+
+    Parameters
+        samples (np.ndarray): mono float samples
+        factor (float): the speed factor, above 1 is faster
+        sample_rate (int): the sample rate of the samples
+        frame_seconds (float): the length of each overlapped frame
+    """
+
+    frame = max(16, int(frame_seconds * sample_rate)) & ~1
+    hop_out = frame // 2
+    hop_in = hop_out * factor
+    tolerance = hop_out // 2
+    if factor == 1.0 or len(samples) < frame:
+        return samples
+
+    window = np.hanning(frame).astype(np.float32)
+    padded = np.pad(samples, (tolerance, frame + tolerance))
+    count = int((len(samples) - frame) / hop_in) + 1
+    output = np.zeros(hop_out * (count - 1) + frame, dtype=np.float32)
+    weights = np.zeros_like(output)
+
+    previous = None
+    for index in range(count):
+        nominal = int(round(index * hop_in)) + tolerance
+        if previous is None:
+            start = nominal
+        else:
+            continuation = padded[previous + hop_out:previous + hop_out + frame]
+            region = padded[nominal - tolerance:nominal + tolerance + frame]
+            start = nominal - tolerance + int(np.argmax(np.correlate(region, continuation, mode='valid')))
+        output[index * hop_out:index * hop_out + frame] += padded[start:start + frame] * window
+        weights[index * hop_out:index * hop_out + frame] += window
+        previous = start
+    return output / np.maximum(weights, 1e-3)
+
+
+def add_noise(samples: np.ndarray, snr_db: float, rng: np.random.Generator) -> np.ndarray:
+    """
+    Adds white noise at the given signal to noise ratio.
+    """
+
+    signal_power = np.mean(samples ** 2) if len(samples) else 0.0
+    noise_power = signal_power / (10.0 ** (snr_db / 10.0))
+    return samples + rng.normal(0.0, np.sqrt(noise_power), len(samples)).astype(np.float32)
+
+
+def add_room(samples: np.ndarray, reverb_seconds: float, sample_rate: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Simulates a room by convolving with exponentially decaying noise, an
+    approximation of a diffuse impulse response with the given RT60.
+    """
+
+    length = max(1, int(reverb_seconds * sample_rate))
+    decay = np.exp(-6.9 * np.arange(length) / length)
+    response = rng.normal(0.0, 1.0, length) * decay
+    response[0] = 1.0
+    response /= np.sqrt(np.sum(response ** 2))
+
+    size = len(samples) + length - 1
+    fft_size = 1 << (size - 1).bit_length()
+    wet = np.fft.irfft(np.fft.rfft(samples, fft_size) * np.fft.rfft(response, fft_size), fft_size)[:len(samples)]
+    peak = np.abs(wet).max() if len(wet) else 0.0
+    source_peak = np.abs(samples).max() if len(samples) else 0.0
+    return (wet * (source_peak / peak if peak > 0 else 1.0)).astype(np.float32)
+
+
+def variant_name(pitch: int, tempo: float = 1.0, noise_snr: Optional[float] = None,
+                 room: Optional[float] = None) -> str:
+    """
+    Returns the file name suffix identifying a variant, such as '-pitch-2' or
+    '-pitch--1-tempo-0.9-noise-20'.
+    """
+
+    name = '-pitch-' + str(pitch)
+    if tempo != 1.0:
+        name += '-tempo-' + str(tempo)
+    if noise_snr is not None:
+        name += '-noise-' + str(noise_snr)
+    if room is not None:
+        name += '-room-' + str(room)
+    return name
+
+
+def variant_names(plan: AugmentationPlan) -> List[str]:
+    """
+    Returns the names of every variant of the plan, in the order augment
+    produces them.
+    """
+
+    names = []
+    for pitch in plan.pitches:
+        for tempo in plan.tempos:
+            names.append(variant_name(pitch, tempo))
+            names.extend(variant_name(pitch, tempo, noise_snr=snr) for snr in plan.noise_snrs)
+            names.extend(variant_name(pitch, tempo, room=room) for room in plan.rooms)
+    return names
+
+
+def augment(samples: np.ndarray, sample_rate: int, plan: AugmentationPlan, seed: Optional[int] = None,
+            names: Optional[Set[str]] = None) -> Iterator[Tuple[str, np.ndarray]]:
+    """
+    Derives the variants of the plan from one render.
+
+    Parameters
+        samples (np.ndarray): the rendered clip as mono float samples
+        sample_rate (int): the sample rate of the clip, kept by every variant
+        plan (AugmentationPlan): the variants to produce
+        seed (int): seeds the noise and rooms, so variants are reproducible
+        names ({str}): if given, only the variants with these names are produced
+
+    Returns
+        (str, np.ndarray): (variant name, samples) for every variant
+    """
+
+    # every variant draws from its own generator, so a variant is the same
+    # whether or not the others are produced
+    wanted = lambda name: names is None or name in names
+    variant_rng = lambda name: np.random.default_rng([seed or 0, zlib.crc32(name.encode('utf-8'))])
+
+    for pitch in plan.pitches:
+        shifted = None
+        for tempo in plan.tempos:
+            clean = None
+            variants = [(variant_name(pitch, tempo, noise_snr=snr), snr, None) for snr in [None] + list(plan.noise_snrs)]
+            variants += [(variant_name(pitch, tempo, room=room), None, room) for room in plan.rooms]
+            for name, snr, room in variants:
+                if not wanted(name):
+                    continue
+                if clean is None:
+                    shifted = pitch_shift(samples, pitch) if shifted is None else shifted
+                    clean = change_tempo(shifted, tempo, sample_rate)
+                if room is not None:
+                    yield name, add_room(clean, room, sample_rate, variant_rng(name))
+                elif snr is not None:
+                    yield name, add_noise(clean, snr, variant_rng(name))
+                else:
+                    yield name, clean
+
+
+def write_variants(file_prefix: str, samples: np.ndarray, sample_rate: int, plan: AugmentationPlan,
+                   seed: Optional[int] = None, names: Optional[Set[str]] = None) -> Dict[str, str]:
+    """
+    Derives the variants of the plan from one render and writes them next
+    to each other as file_prefix + variant name + '.wav'.
+
+    Parameters
+        names ({str}): if given, only the variants with these names are written
+
+    Returns
+        {str: str}: the path of the written file for each variant name
+    """
+
+    os.makedirs(os.path.dirname(file_prefix) or '.', exist_ok=True)
+    paths = {}
+    for name, variant in augment(samples, sample_rate, plan, seed, names):
+        paths[name] = file_prefix + name + '.wav'
+        write_wav(paths[name], variant, sample_rate)
+    return paths
@@ -0,0 +1,277 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import queue
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+
+from move_recognizer import list_dataset, load_clip, move_files_directory
+from text_move_enumerator import get_move_vocabulary
+
+
+class Batch(NamedTuple):
+    """
+    A batch of labelled clips, padded with zeros to its longest clip.
+
+    Fields
+        moves ([str]): the move of each clip in algebraic notation
+        move_ids (np.ndarray): the vocabulary ID of each move
+        data (np.ndarray): int16 samples of shape (batch, samples), or float32
+            features of shape (batch, frames, dimensions) when loading features
+        lengths (np.ndarray): the unpadded length of each clip
+    """
+
+    moves: List[str]
+    move_ids: np.ndarray
+    data: np.ndarray
+    lengths: np.ndarray
+
+
+def balanced_order(labels: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Draws count clip indices so that every label is equally likely: a label
+    is chosen uniformly for each draw and then the next clip of that label is
+    taken from a shuffled cycle through its clips.
+
+    Parameters
+        labels (np.ndarray): the label of every clip
+        count (int): the number of indices to draw
+        rng (np.random.Generator): the source of randomness
+
+    Returns
+        np.ndarray: the clip indices
+    """
+
+    classes, inverse = np.unique(labels, return_inverse=True)
+    members = np.argsort(inverse, kind='stable')
+    starts = np.searchsorted(inverse[members], np.arange(len(classes)))
+    sizes = np.bincount(inverse, minlength=len(classes))
+
+    chosen = rng.integers(0, len(classes), count)
+    # the n-th draw of a label takes position n of its cycle, which is
+    # reshuffled through a random offset and stride coprime to its size
+    by_label = np.argsort(chosen, kind='stable')
+    draws = np.empty(count, dtype=np.int64)
+    draws[by_label] = np.arange(count) - np.searchsorted(chosen[by_label], chosen[by_label])
+    offsets = rng.integers(0, sizes)
+    strides = np.array([_coprime_stride(int(size), rng) for size in sizes])
+    within = (offsets[chosen] + draws * strides[chosen]) % sizes[chosen]
+    return members[starts[chosen] + within]
+
+
+def _coprime_stride(size: int, rng: np.random.Generator) -> int:
+    while True:
+        stride = int(rng.integers(1, size + 1))
+        if np.gcd(stride, size) == 1:
+            return stride
+
+
+class BatchLoader:
+    """
+    Streams fixed size batches of labelled clips for training. Clips are read
+    from the packed form of the dataset if it has been packed, from the
+    individual files otherwise, or from the feature cache if a feature config
+    is given.
+
+    A background thread orders the clips for each epoch, loads them with a
+    pool of worker threads and passes them through a shuffle buffer into a
+    queue of prepared batches. At most workers * 4 clips are being loaded,
+    shuffle_buffer clips are buffered and prefetch batches are queued, so
+    memory stays constant whatever the size of the dataset; only the labels
+    and locations of the clips are held for the whole dataset. Given the same
+    seed, every epoch yields the same batches in the same order.
+
+    Parameters
+        dataset_dir (str): the directory holding one subdirectory per move
+        batch_size (int): the number of clips in a batch; a final smaller
+            batch is dropped
+        feature_config (FeatureConfig): if given, batches hold the cached
+            features of this config instead of samples
+        balanced (bool): draw every move equally often rather than every clip once
+        shuffle_buffer (int): the number of clips shuffled among each other
+        workers (int): the number of loading threads
+        prefetch (int): the number of batches prepared ahead
+        seed (int): seeds the order of every epoch
+    """
+
+    def __init__(self, dataset_dir: str = move_files_directory, batch_size: int = 64, feature_config=None,
+                 balanced: bool = True, shuffle_buffer: int = 4096, workers: int = 4, prefetch: int = 4,
+                 seed: int = 0):
+        self.batch_size = batch_size
+        self.balanced = balanced
+        self.shuffle_buffer = max(1, shuffle_buffer)
+        self.workers = workers
+        self.prefetch = prefetch
+        self.seed = seed
+        self.epoch = 0
+
+        vocabulary = get_move_vocabulary()
+        self.load: Callable[[int], np.ndarray]
+        if feature_config is not None:
+            # imported here since feature_cache is only needed for features
+            from feature_cache import FeatureCache
+
+            cache = FeatureCache(dataset_dir, feature_config)
+            clips = cache.update()
+            self.moves = [move for move, _ in clips]
+            hashes = [clip_hash for _, clip_hash in clips]
+            self.load = lambda index: cache.features(hashes[index]).astype(np.float32)
+        else:
+            from packed_dataset import open_packed_dataset
+
+            packed = open_packed_dataset(dataset_dir)
+            if packed is not None:
+                self.moves = [vocabulary.text(int(move_id)) for move_id in packed.index['move_id']]
+                self.load = lambda index: np.asarray(packed[index].samples)
+            else:
+                files = list_dataset(dataset_dir)
+                self.moves = [move for move, _ in files]
+                self.load = lambda index: load_clip(files[index][1])
+        self.move_ids = np.array([vocabulary.id_by_text[move] for move in self.moves], dtype=np.int64)
+
+    def __len__(self) -> int:
+        """
+        Returns the number of batches in an epoch.
+        """
+
+        return len(self.moves) // self.batch_size
+
+    def epoch_order(self, epoch: int) -> np.ndarray:
+        """
+        Returns the clip indices of an epoch before shuffling. Without
+        balancing this is dataset order, which reads packed shards and
+        directories sequentially, and the shuffle buffer mixes it.
+        """
+
+        if self.balanced:
+            return balanced_order(self.move_ids, len(self.moves), np.random.default_rng([self.seed, epoch, 0]))
+        return np.arange(len(self.moves))
+
+    def batches(self, epoch: int) -> Iterator[Batch]:
+        """
+        Yields the batches of one epoch.
+        """
+
+        prepared: queue.Queue = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce, args=(epoch, prepared, stop), daemon=True)
+        producer.start()
+        try:
+            while True:
+                batch = prepared.get()
+                if batch is None:
+                    break
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            while producer.is_alive():
+                try:
+                    prepared.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            producer.join()
+
+    def __iter__(self) -> Iterator[Batch]:
+        """
+        Yields the batches of the next epoch.
+        """
+
+        epoch = self.epoch
+        self.epoch += 1
+        return self.batches(epoch)
+
+    def _produce(self, epoch: int, prepared: queue.Queue, stop: threading.Event):
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    prepared.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            rng = np.random.default_rng([self.seed, epoch, 1])
+            # the buffer holds (clip index, slot in samples) pairs, since one
+            # clip can be drawn more than once in a balanced epoch
+            buffer: List[Tuple[int, int]] = []
+            samples: Dict[int, np.ndarray] = {}
+            pending: List[Tuple[int, int]] = []
+            for slot, (index, clip) in enumerate(self._load_in_order(self.epoch_order(epoch), stop)):
+                samples[slot] = clip
+                buffer.append((index, slot))
+                if len(buffer) >= self.shuffle_buffer:
+                    pending.append(buffer.pop(int(rng.integers(len(buffer)))))
+                if len(pending) == self.batch_size:
+                    if not put(self._collate(pending, samples)):
+                        return
+                    pending = []
+            while buffer and not stop.is_set():
+                pending.append(buffer.pop(int(rng.integers(len(buffer)))))
+                if len(pending) == self.batch_size:
+                    if not put(self._collate(pending, samples)):
+                        return
+                    pending = []
+            put(None)
+        except BaseException as error:
+            put(error)
+
+    def _load_in_order(self, order: np.ndarray, stop: threading.Event) -> Iterator:
+        """
+        Loads clips on the worker threads, yielding them in order with a
+        bounded number in flight.
+        """
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            in_flight = deque()
+            for index in order:
+                if stop.is_set():
+                    break
+                in_flight.append((int(index), executor.submit(self.load, int(index))))
+                if len(in_flight) >= 4 * self.workers:
+                    index, future = in_flight.popleft()
+                    yield index, future.result()
+            while in_flight and not stop.is_set():
+                index, future = in_flight.popleft()
+                yield index, future.result()
+            for _, future in in_flight:
+                future.cancel()
+
+    def _collate(self, pending: List[Tuple[int, int]], samples: Dict[int, np.ndarray]) -> Batch:
+        clips = [samples.pop(slot) for _, slot in pending]
+        indices = [index for index, _ in pending]
+        lengths = np.array([len(clip) for clip in clips], dtype=np.int64)
+        data = np.zeros((len(clips), int(lengths.max())) + clips[0].shape[1:], dtype=clips[0].dtype)
+        for row, clip in enumerate(clips):
+            data[row, :len(clip)] = clip
+        return Batch([self.moves[index] for index in indices], self.move_ids[indices], data, lengths)
+
+
+if __name__ == "__main__":
+    """
+    Streams one epoch from the dataset directory given as the first argument,
+    or move_files, and reports the loading throughput. Pass --features to
+    stream cached log-mel features instead of samples.
+    """
+
+    dataset_dir = next((argument for argument in sys.argv[1:] if not argument.startswith('--')), move_files_directory)
+    feature_config = None
+    if '--features' in sys.argv:
+        from feature_cache import FeatureConfig
+        feature_config = FeatureConfig('log_mel')
+
+    loader = BatchLoader(dataset_dir, feature_config=feature_config)
+    start = time.perf_counter()
+    clips = 0
+    moves = set()
+    for batch in loader:
+        clips += len(batch.moves)
+        moves.update(batch.moves)
+    elapsed = time.perf_counter() - start
+    print('Loaded ' + str(clips) + ' clips of ' + str(len(moves)) + ' moves in ' + str(len(loader)) +
+          ' batches, %.0f clips/s' % (clips / max(elapsed, 1e-9)))
@@ -0,0 +1,168 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import sys
+import time
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+from pydub import AudioSegment
+
+# the silence detection of the live recorder is shared with audio_processing
+audio_processing_directory: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'audio_processing')
+sys.path.append(audio_processing_directory)
+
+import frame_energy
+from endpoint_detector import END_SPEECH_FACTOR, START_SPEECH_FACTOR
+from augmentation import load_render, to_pcm, write_wav
+from move_recognizer import list_dataset, move_files_directory
+
+# clips are measured in 10 ms chunks; TTS output is often digitally silent, so
+# the noise level is never taken to be below MIN_NOISE_LEVEL (-60 dBFS)
+CHUNK_SECONDS: float = 0.01
+MIN_NOISE_LEVEL: float = 0.001
+NOISE_PERCENTILE: float = 10.0
+PAD_SECONDS: float = 0.05
+TARGET_RMS_DBFS: float = -20.0
+PEAK_LIMIT_DBFS: float = -1.0
+
+
+class NormalizedClip(NamedTuple):
+    """
+    The outcome of normalizing one clip.
+
+    Fields
+        file_path (str): the clip's file
+        original_seconds (float): the length of the clip before trimming
+        trimmed_seconds (float): the length of the clip after trimming
+        gain_db (float): the gain applied to the clip
+    """
+
+    file_path: str
+    original_seconds: float
+    trimmed_seconds: float
+    gain_db: float
+
+
+def speech_bounds(samples: np.ndarray, sample_rate: int) -> Tuple[int, int]:
+    """
+    Finds the speech in a clip the way the live recorder does: the chunk
+    volumes are compared against multiples of the noise level, the start of
+    speech being the first chunk above START_SPEECH_FACTOR times the noise
+    and the end the last chunk above END_SPEECH_FACTOR times the noise. The
+    noise level is a low percentile of the chunk volumes. PAD_SECONDS of
+    audio is kept on either side.
+
+    Parameters
+        samples (np.ndarray): mono float samples in [-1, 1]
+        sample_rate (int): the sample rate of the samples
+
+    Returns
+        (int, int): the first sample and one past the last sample to keep
+    """
+
+    chunk_frames = max(1, int(CHUNK_SECONDS * sample_rate))
+    pcm = to_pcm(samples)
+    volumes = frame_energy.buffer_energies(pcm.tobytes(), chunk_frames).rms
+    if len(volumes) == 0:
+        return 0, len(samples)
+
+    noise_level = max(float(np.percentile(volumes, NOISE_PERCENTILE)), MIN_NOISE_LEVEL)
+    started = np.flatnonzero(volumes > START_SPEECH_FACTOR * noise_level)
+    if len(started) == 0:
+        return 0, len(samples)
+    ongoing = np.flatnonzero(volumes > END_SPEECH_FACTOR * noise_level)
+    pad = int(PAD_SECONDS * sample_rate)
+    start = max(0, started[0] * chunk_frames - pad)
+    end = min(len(samples), (ongoing[-1] + 1) * chunk_frames + pad)
+    return start, end
+
+
+def loudness_gain(samples: np.ndarray, target_dbfs: float = TARGET_RMS_DBFS,
+                  peak_limit_dbfs: float = PEAK_LIMIT_DBFS) -> float:
+    """
+    Returns the gain in dB which brings the rms of a clip to target_dbfs,
+    reduced if needed so its peak stays below peak_limit_dbfs.
+    """
+
+    level = np.sqrt(np.mean(samples ** 2)) if len(samples) else 0.0
+    peak = np.abs(samples).max() if len(samples) else 0.0
+    if level <= 0.0:
+        return 0.0
+    gain = target_dbfs - 20.0 * np.log10(level)
+    return float(min(gain, peak_limit_dbfs - 20.0 * np.log10(peak)))
+
+
+def normalize_clip(file_path: str, dry_run: bool = False) -> NormalizedClip:
+    """
+    Trims the silence around a clip and normalizes its loudness, rewriting
+    it in place in its own format.
+
+    Parameters
+        file_path (str): the clip's file
+        dry_run (bool): only measure the clip
+
+    Returns
+        NormalizedClip: what was done to the clip
+    """
+
+    samples, sample_rate = load_render(file_path)
+    start, end = speech_bounds(samples, sample_rate)
+    trimmed = samples[start:end]
+    gain_db = loudness_gain(trimmed)
+
+    if not dry_run:
+        trimmed = trimmed * np.float32(10.0 ** (gain_db / 20.0))
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension == '.wav':
+            write_wav(file_path, trimmed, sample_rate)
+        else:
+            pcm = to_pcm(trimmed)
+            AudioSegment(pcm.tobytes(), frame_rate=sample_rate, sample_width=2, channels=1) \
+                .export(file_path, format=extension[1:])
+    return NormalizedClip(file_path, len(samples) / sample_rate, len(trimmed) / sample_rate, gain_db)
+
+
+def normalize_dataset(dataset_dir: str = move_files_directory, dry_run: bool = False,
+                      workers: Optional[int] = None, report_interval: int = 1000) -> Tuple[float, float]:
+    """
+    Trims and loudness normalizes every clip of a dataset with a process pool
+    and reports the total duration removed.
+
+    Parameters
+        dataset_dir (str): the directory holding one subdirectory per move
+        dry_run (bool): only report what would be removed
+        workers (int): the number of worker processes, the core count if None
+        report_interval (int): clips between progress messages
+
+    Returns
+        (float, float): the total duration of the dataset in seconds before
+            and after trimming
+    """
+
+    files = [file_path for _, file_path in list_dataset(dataset_dir)]
+    before = after = 0.0
+    gains = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for count, clip in enumerate(executor.map(normalize_clip, files, [dry_run] * len(files), chunksize=32), 1):
+            before += clip.original_seconds
+            after += clip.trimmed_seconds
+            gains.append(clip.gain_db)
+            if count % report_interval == 0:
+                print('Normalized ' + str(count) + '/' + str(len(files)) + ' clips')
+
+    print('{} {} clips: {:.1f} s of {:.1f} s removed ({:.0f}%), median gain {:+.1f} dB'.format(
+        'Measured' if dry_run else 'Normalized', len(files), before - after, before,
+        100 * (before - after) / max(before, 1e-9), float(np.median(gains)) if gains else 0.0))
+    return before, after
+
+
+if __name__ == "__main__":
+    """
+    Trims and normalizes the dataset directory given as the first argument,
+    or move_files. Pass --dry-run to only report the duration to be removed.
+    """
+
+    dataset_dir = next((argument for argument in sys.argv[1:] if not argument.startswith('--')), move_files_directory)
+    start = time.perf_counter()
+    normalize_dataset(dataset_dir, dry_run='--dry-run' in sys.argv)
+    print('Finished in %.1f s' % (time.perf_counter() - start))
@@ -0,0 +1,458 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import os
+import random
+import threading
+import time
+from typing import Iterable, List, NamedTuple, Optional
+import urllib.error
+import urllib.request
+import wave
+
+import numpy as np
+from pydub import AudioSegment
+
+from synthesis_manifest import SynthesisManifest, synthesis_key
+
+# requests per second each provider allows; gTTS is limited to 900 requests
+# per minute and Polly to 80 SynthesizeSpeech calls per second for standard voices
+GTTS_REQUESTS_PER_SECOND: float = 15.0
+POLLY_REQUESTS_PER_SECOND: float = 80.0
+
+
+class ThrottledError(Exception):
+    """
+    Raised by a provider when the service rejected a request for exceeding
+    its quota. Throttled requests are retried after a backoff.
+    """
+
+
+class SynthesisRequest(NamedTuple):
+    """
+    A single cloud TTS request.
+
+    Fields
+        text (str): the text to speak
+        output_file (str): the wav file the speech is written to
+        key (str): the synthesis key of the audio, used with a manifest
+        parameters (dict): the parameters the key was computed from
+    """
+
+    text: str
+    output_file: str
+    key: Optional[str] = None
+    parameters: Optional[dict] = None
+
+
+class TokenBucket:
+    """
+    Rate limiter allowing rate requests per second on average and bursts of
+    up to capacity requests. The bucket starts empty, so no burst is sent
+    before the first token is earned. Safe to share between coroutines of
+    one loop.
+
+    Parameters
+        rate (float): tokens added per second
+        capacity (float): the most tokens held at once
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """
+        Waits until a token is available and takes it.
+        """
+
+        async with self.lock:
+            self._refill()
+            while self.tokens < 1.0:
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1.0
+
+    def penalize(self, seconds: float):
+        """
+        Drains the bucket so that no request is sent for the given time, used
+        when the service reports throttling despite the limiter.
+        """
+
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class GttsProvider:
+    """
+    Synthesizes mp3 speech with gTTS. gTTS opens a pooled requests session
+    per call, so calls are simply spread over threads.
+
+    Parameters
+        tld (str): the Google top level domain, which selects the accent
+        slow (bool): whether to speak slowly
+    """
+
+    audio_format = 'mp3'
+    requests_per_second = GTTS_REQUESTS_PER_SECOND
+
+    def __init__(self, tld: str = 'com', slow: bool = False):
+        self.tld = tld
+        self.slow = slow
+
+    def synthesize(self, text: str) -> bytes:
+        from gtts import gTTS, gTTSError
+
+        buffer = io.BytesIO()
+        try:
+            gTTS(text, lang='en', tld=self.tld, slow=self.slow, lang_check=False).write_to_fp(buffer)
+        except gTTSError as error:
+            response = getattr(error, 'rsp', None)
+            if response is not None and response.status_code == 429:
+                raise ThrottledError(str(error)) from error
+            raise
+        return buffer.getvalue()
+
+
+class PollyProvider:
+    """
+    Synthesizes mp3 speech with Amazon Polly through a single client whose
+    connection pool is sized for the number of concurrent requests.
+
+        ------------------- WARNING -------------------
+    Amazon Polly operates on a pay-per system which can involve charges
+    to your AWS account if you exceed usage amounts.
+
+    Parameters
+        voice (str): the Polly voice ID
+        max_connections (int): the size of the connection pool
+        profile_name (str): the AWS profile to use
+        region (str): the AWS region to use
+    """
+
+    audio_format = 'mp3'
+    requests_per_second = POLLY_REQUESTS_PER_SECOND
+
+    def __init__(self, voice: str, max_connections: int = 16, profile_name: Optional[str] = 'adminuser',
+                 region: str = 'us-east-1'):
+        import boto3
+        from botocore.config import Config
+
+        self.voice = voice
+        session = boto3.Session(profile_name=profile_name)
+        # botocore clients are thread safe, so one client serves every request
+        self.client = session.client('polly', region, config=Config(max_pool_connections=max_connections,
+                                                                    retries={'max_attempts': 0}))
+
+    def synthesize(self, text: str) -> bytes:
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.synthesize_speech(Text=text, OutputFormat='mp3', VoiceId=self.voice)
+        except ClientError as error:
+            if error.response.get('Error', {}).get('Code') in ('ThrottlingException', 'TooManyRequestsException'):
+                raise ThrottledError(str(error)) from error
+            raise
+        with response['AudioStream'] as stream:
+            return stream.read()
+
+
+class HttpProvider:
+    """
+    Synthesizes speech by posting the text to an HTTP endpoint which answers
+    with audio, or with status 429 when throttling. Used with the fake
+    endpoint below.
+
+    Parameters
+        url (str): the endpoint URL
+        audio_format (str): the format of the returned audio
+        requests_per_second (float): the quota of the endpoint
+    """
+
+    def __init__(self, url: str, audio_format: str = 'wav', requests_per_second: float = 20.0):
+        self.url = url
+        self.audio_format = audio_format
+        self.requests_per_second = requests_per_second
+
+    def synthesize(self, text: str) -> bytes:
+        request = urllib.request.Request(self.url, data=text.encode('utf-8'), method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=30.0) as response:
+                return response.read()
+        except urllib.error.HTTPError as error:
+            if error.code == 429:
+                raise ThrottledError('HTTP 429 from ' + self.url) from error
+            raise
+
+
+def convert_to_wav(data: bytes, audio_format: str, output_file: str):
+    """
+    Decodes synthesized audio and writes it as a wav file.
+    """
+
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    AudioSegment.from_file(io.BytesIO(data), format=audio_format).export(output_file, format='wav')
+
+
+class SynthesisStats:
+    """
+    Counters kept by a synthesis run.
+    """
+
+    def __init__(self):
+        self.completed = 0
+        self.skipped = 0
+        self.cached = 0
+        self.failed = 0
+        self.throttled = 0
+        self.retries = 0
+        self.start = time.monotonic()
+
+    def __str__(self) -> str:
+        elapsed = time.monotonic() - self.start
+        return '{} done ({:.1f}/s), {} skipped, {} from cache, {} failed, {} throttled, {} retries'.format(
+            self.completed, self.completed / elapsed if elapsed > 0 else 0.0,
+            self.skipped, self.cached, self.failed, self.throttled, self.retries)
+
+
+async def _synthesize_one(provider, request: SynthesisRequest, limiter: TokenBucket,
+                          request_pool: ThreadPoolExecutor, conversion_pool: ThreadPoolExecutor,
+                          stats: SynthesisStats, max_retries: int, base_backoff: float,
+                          manifest: Optional[SynthesisManifest]) -> bool:
+    loop = asyncio.get_running_loop()
+    use_manifest = manifest is not None and request.key is not None
+    if use_manifest and manifest.is_done(request.key):
+        stats.skipped += 1
+        return True
+
+    cached = manifest.cached_render(request.key) if use_manifest else None
+    if cached is not None:
+        with open(cached, 'rb') as file:
+            data = file.read()
+        stats.cached += 1
+    else:
+        data = await _request_with_retries(provider, request, limiter, request_pool, stats,
+                                           max_retries, base_backoff)
+        if data is None:
+            stats.failed += 1
+            return False
+
+    # decoding and writing happen off the request path, so the next request
+    # can be sent while this one is converted
+    try:
+        await loop.run_in_executor(conversion_pool, convert_to_wav, data, provider.audio_format,
+                                   request.output_file)
+        if use_manifest and cached is None:
+            cache_path = manifest.cache_path(request.key, provider.audio_format)
+            await loop.run_in_executor(conversion_pool, _write_bytes, cache_path, data)
+            manifest.record_render(request.key, type(provider).__name__, request.text, cache_path, request.parameters)
+    except Exception as error:
+        print('Converting \'' + request.text + '\' failed: ' + str(error))
+        stats.failed += 1
+        return False
+
+    if use_manifest:
+        manifest.record_output(request.key, request.output_file, request.key, request.parameters)
+    stats.completed += 1
+    return True
+
+
+async def _request_with_retries(provider, request: SynthesisRequest, limiter: TokenBucket,
+                                request_pool: ThreadPoolExecutor, stats: SynthesisStats,
+                                max_retries: int, base_backoff: float) -> Optional[bytes]:
+    loop = asyncio.get_running_loop()
+    for attempt in range(max_retries + 1):
+        await limiter.acquire()
+        try:
+            return await loop.run_in_executor(request_pool, provider.synthesize, request.text)
+        except ThrottledError:
+            stats.throttled += 1
+            backoff = base_backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+            limiter.penalize(backoff)
+        except Exception as error:
+            print('Synthesis of \'' + request.text + '\' failed: ' + str(error))
+            backoff = base_backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+        if attempt < max_retries:
+            stats.retries += 1
+            await asyncio.sleep(backoff)
+    return None
+
+
+def _write_bytes(file_path: str, data: bytes):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'wb') as file:
+        file.write(data)
+
+
+async def synthesize_all_async(provider, requests: Iterable[SynthesisRequest], concurrency: int = 16,
+                               requests_per_second: Optional[float] = None, max_retries: int = 5,
+                               base_backoff: float = 1.0, report_interval: float = 10.0,
+                               manifest: Optional[SynthesisManifest] = None) -> SynthesisStats:
+    """
+    Sends every request to the provider, keeping up to concurrency requests in
+    flight while a token bucket holds the request rate to the provider quota.
+    Throttled and failed requests are retried with exponential backoff.
+    With a manifest, requests whose output already exists are skipped and raw
+    responses are cached, so an interrupted run can be resumed.
+
+    Parameters
+        provider: an object with synthesize(text) -> bytes, audio_format and
+            requests_per_second, such as GttsProvider or PollyProvider
+        requests ([SynthesisRequest]): the texts to synthesize, consumed lazily
+        concurrency (int): the most requests in flight at once
+        requests_per_second (float): overrides the provider quota
+        max_retries (int): attempts after the first before a request fails
+        base_backoff (float): seconds to wait before the first retry
+        report_interval (float): seconds between progress reports
+        manifest (SynthesisManifest): the record of finished work, used for
+            requests which have a key
+
+    Returns
+        SynthesisStats: the counters of the run
+    """
+
+    # a single token of burst keeps every one second window within the quota
+    limiter = TokenBucket(requests_per_second or provider.requests_per_second, capacity=1.0)
+    stats = SynthesisStats()
+    next_report = stats.start + report_interval
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='tts-request') as request_pool, \
+            ThreadPoolExecutor(max_workers=max(1, (os.cpu_count() or 1)), thread_name_prefix='tts-convert') as conversion_pool:
+        pending = set()
+        for request in requests:
+            if len(pending) >= concurrency:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.add(asyncio.ensure_future(_synthesize_one(provider, request, limiter, request_pool,
+                                                              conversion_pool, stats, max_retries, base_backoff,
+                                                              manifest)))
+            if time.monotonic() >= next_report:
+                next_report += report_interval
+                print(stats)
+        if pending:
+            await asyncio.wait(pending)
+    return stats
+
+
+def synthesize_all(provider, requests: Iterable[SynthesisRequest], **options) -> SynthesisStats:
+    """
+    Runs synthesize_all_async to completion, see there for the parameters.
+    """
+
+    return asyncio.run(synthesize_all_async(provider, requests, **options))
+
+
+def _tone_wav(text: str, sample_rate: int = 16000) -> bytes:
+    # a short tone whose pitch depends on the text stands in for speech
+    duration = 0.2 + 0.02 * len(text)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    samples = (0.3 * np.sin(2 * np.pi * (200 + sum(map(ord, text)) % 400) * t) * 32767).astype('<i2')
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+class FakeTTSEndpoint:
+    """
+    Local HTTP server imitating a cloud TTS service, for testing the
+    synthesis driver without credentials or charges. Requests are answered
+    with a wav tone after a latency, and with status 429 once more than
+    requests_per_second requests arrive within a second.
+
+    Parameters
+        requests_per_second (float): the quota enforced by the endpoint
+        latency (float): seconds each request takes
+        port (int): the port to listen on, 0 for any free port
+    """
+
+    def __init__(self, requests_per_second: float = 20.0, latency: float = 0.2, port: int = 0):
+        self.requests_per_second = requests_per_second
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.arrivals: List[float] = []
+        self.served = 0
+        self.rejected = 0
+
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                text = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+                if not endpoint._admit():
+                    self.send_response(429)
+                    self.end_headers()
+                    return
+                time.sleep(endpoint.latency)
+                body = _tone_wav(text)
+                self.send_response(200)
+                self.send_header('Content-Type', 'audio/wav')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = 'http://127.0.0.1:' + str(self.server.server_address[1]) + '/synthesize'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def _admit(self) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            self.arrivals = [arrival for arrival in self.arrivals if now - arrival < 1.0]
+            if len(self.arrivals) >= self.requests_per_second:
+                self.rejected += 1
+                return False
+            self.arrivals.append(now)
+            self.served += 1
+            return True
+
+    def __enter__(self) -> 'FakeTTSEndpoint':
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    """
+    Main method for testing, synthesizing moves against a local fake endpoint
+    """
+
+    import tempfile
+
+    from text_move_enumerator import get_move_vocabulary
+
+    quota = 40.0
+    output_dir = tempfile.mkdtemp()
+    moves = list(get_move_vocabulary())[:200]
+    with FakeTTSEndpoint(requests_per_second=quota, latency=0.25) as endpoint, \
+            SynthesisManifest(output_dir) as manifest:
+        provider = HttpProvider(endpoint.url, requests_per_second=quota)
+        # the second pass finds every file in the manifest and sends nothing
+        for attempt in range(2):
+            requests = (SynthesisRequest(voice, os.path.join(output_dir, text, 'fake.wav'),
+                                         synthesis_key('fake', voice), {}) for _, text, voice in moves)
+            start = time.monotonic()
+            stats = synthesize_all(provider, requests, concurrency=32, base_backoff=0.2, report_interval=1.0,
+                                   manifest=manifest)
+            elapsed = time.monotonic() - start
+            print(stats)
+            print('{} requests in {:.2f} s against a quota of {:.0f}/s, endpoint rejected {}'.format(
+                len(moves), elapsed, quota, endpoint.rejected))
+        print('Files written to ' + output_dir)
@@ -0,0 +1,232 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import random
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from pydub import AudioSegment
+
+from move_recognizer import FEATURE_RATE, list_dataset, load_clip, log_mel_spectrogram, move_files_directory
+from synthesis_manifest import SynthesisManifest, manifest_file_name
+
+# fingerprints compare the direction of energy changes over a coarse grid
+# of time and frequency cells, which survives small rate and pitch changes
+FINGERPRINT_TIME_CELLS: int = 32
+FINGERPRINT_BANDS: int = 16
+FINGERPRINT_RANGE_DB: float = 30.0
+# log energy changes smaller than this, about 1.3 dB, count as no change
+FINGERPRINT_MARGIN: float = 0.3
+DUPLICATE_THRESHOLD: float = 0.05
+DURATION_TOLERANCE: float = 0.1
+
+
+class ClipFingerprint(NamedTuple):
+    """
+    Fields
+        file_path (str): the clip's file
+        bits (np.ndarray): the boolean fingerprint
+        duration (float): the clip's length in seconds
+    """
+
+    file_path: str
+    bits: np.ndarray
+    duration: float
+
+
+def fingerprint(samples: np.ndarray) -> np.ndarray:
+    """
+    Computes a binary fingerprint of a clip: whether the energy of each
+    frequency band clearly rises from one time cell to the next, and whether it
+    clearly rises from one band to the next within each time cell. The grid is
+    stretched over the clip with its leading and trailing silence removed, so
+    slower or faster renders of the same speech give nearly the same bits.
+    Energy more than FINGERPRINT_RANGE_DB below the loudest cell is treated
+    as silence, so background noise does not decide any bits.
+
+    Parameters
+        samples (np.ndarray): mono samples at FEATURE_RATE
+
+    Returns
+        np.ndarray: a boolean vector
+    """
+
+    spectrogram = log_mel_spectrogram(samples)
+    floor = spectrogram.max() - FINGERPRINT_RANGE_DB * np.log(10.0) / 10.0
+    spectrogram = np.maximum(spectrogram, floor)
+    voiced = np.flatnonzero((spectrogram > floor).any(axis=1))
+    if len(voiced):
+        spectrogram = spectrogram[voiced[0]:voiced[-1] + 1]
+    if len(spectrogram) < FINGERPRINT_TIME_CELLS:
+        spectrogram = np.pad(spectrogram, ((0, FINGERPRINT_TIME_CELLS - len(spectrogram)), (0, 0)), mode='edge')
+    cells = np.stack([cell.mean(axis=0) for cell in np.array_split(spectrogram, FINGERPRINT_TIME_CELLS)])
+    cells = np.stack([band.mean(axis=1) for band in np.array_split(cells, FINGERPRINT_BANDS, axis=1)], axis=1)
+    return np.concatenate([(np.diff(cells, axis=0) > FINGERPRINT_MARGIN).ravel(),
+                           (np.diff(cells, axis=1) > FINGERPRINT_MARGIN).ravel()])
+
+
+def _fingerprint_move(file_paths: List[str]) -> List[ClipFingerprint]:
+    fingerprints = []
+    for file_path in file_paths:
+        samples = load_clip(file_path)
+        fingerprints.append(ClipFingerprint(file_path, fingerprint(samples), len(samples) / FEATURE_RATE))
+    return fingerprints
+
+
+def find_duplicates(fingerprints: List[ClipFingerprint], threshold: float = DUPLICATE_THRESHOLD,
+                    duration_tolerance: float = DURATION_TOLERANCE) -> Dict[str, str]:
+    """
+    Finds the near-duplicates among the clips of one move. Clips are visited
+    in order and each is kept unless it is within threshold of a clip
+    already kept.
+
+    Parameters
+        fingerprints ([ClipFingerprint]): the clips of a single move
+        threshold (float): the largest fraction of differing bits for a duplicate
+        duration_tolerance (float): the largest relative difference in length
+            for a duplicate
+
+    Returns
+        {str: str}: the file path of the kept clip for every duplicate
+    """
+
+    if len(fingerprints) < 2:
+        return {}
+    bits = np.stack([clip.bits for clip in fingerprints]).astype(np.float32)
+    durations = np.array([clip.duration for clip in fingerprints])
+
+    # fraction of differing bits between every pair, as two matrix products
+    distances = (bits @ (1.0 - bits).T + (1.0 - bits) @ bits.T) / bits.shape[1]
+    lengths = np.abs(durations[:, None] - durations[None, :]) / np.maximum(durations[:, None], 1e-6)
+    similar = (distances <= threshold) & (lengths <= duration_tolerance)
+
+    duplicates = {}
+    kept: List[int] = []
+    for index in range(len(fingerprints)):
+        matches = [keeper for keeper in kept if similar[index, keeper]]
+        if matches:
+            duplicates[fingerprints[index].file_path] = fingerprints[matches[0]].file_path
+        else:
+            kept.append(index)
+    return duplicates
+
+
+def _encode_flac(file_path: str) -> Tuple[str, str, int, int]:
+    """
+    Re-encodes a clip as FLAC next to the original, checks the decoded audio
+    is identical and then removes the original.
+    """
+
+    flac_path = os.path.splitext(file_path)[0] + '.flac'
+    audio = AudioSegment.from_file(file_path)
+    audio.export(flac_path, format='flac')
+    if AudioSegment.from_file(flac_path, format='flac').raw_data != audio.raw_data:
+        os.remove(flac_path)
+        raise ValueError('FLAC encoding of ' + file_path + ' is not lossless')
+    old_size = os.path.getsize(file_path)
+    os.remove(file_path)
+    return file_path, flac_path, old_size, os.path.getsize(flac_path)
+
+
+def dataset_usage(dataset_dir: str, sample_size: int = 200) -> Tuple[int, int, float]:
+    """
+    Measures a dataset on disk.
+
+    Returns
+        (int, int, float): the number of clips, their total size in bytes and
+            the mean time in seconds to load a clip, from a random sample
+    """
+
+    clips = [file_path for _, file_path in list_dataset(dataset_dir)]
+    total_bytes = sum(os.path.getsize(file_path) for file_path in clips)
+    sample = random.Random(0).sample(clips, min(sample_size, len(clips)))
+    start = time.perf_counter()
+    for file_path in sample:
+        load_clip(file_path)
+    return len(clips), total_bytes, (time.perf_counter() - start) / max(1, len(sample))
+
+
+def maintain_dataset(dataset_dir: str = move_files_directory, prune: bool = False, encode_flac: bool = False,
+                     threshold: float = DUPLICATE_THRESHOLD, workers: Optional[int] = None) -> Dict[str, str]:
+    """
+    Reports the near-duplicate clips of every move, optionally deletes them
+    and optionally re-encodes the remaining clips as FLAC, printing the disk
+    usage and load time of the dataset before and after. Fingerprinting and
+    encoding are spread over a process pool. Deleted and re-encoded clips are
+    recorded in the generation manifest, so they are not generated again.
+
+    Parameters
+        dataset_dir (str): the directory holding one subdirectory per move
+        prune (bool): delete the near-duplicates
+        encode_flac (bool): re-encode the clips losslessly as FLAC
+        threshold (float): the largest fraction of differing fingerprint bits
+            for a duplicate
+        workers (int): the number of worker processes, the core count if None
+
+    Returns
+        {str: str}: the file path of the kept clip for every duplicate
+    """
+
+    clips_before, bytes_before, load_before = dataset_usage(dataset_dir)
+    print('Before: {} clips, {:.1f} MB, {:.2f} ms per clip load'.format(
+        clips_before, bytes_before / 1e6, 1000 * load_before))
+
+    files_by_move: Dict[str, List[str]] = {}
+    for move, file_path in list_dataset(dataset_dir):
+        files_by_move.setdefault(move, []).append(file_path)
+
+    manifest = SynthesisManifest(dataset_dir) \
+        if os.path.exists(os.path.join(dataset_dir, manifest_file_name)) else None
+
+    duplicates = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for move, fingerprints in zip(files_by_move, executor.map(_fingerprint_move, files_by_move.values())):
+            move_duplicates = find_duplicates(fingerprints, threshold)
+            if move_duplicates:
+                print('{}: {} of {} clips are near-duplicates'.format(move, len(move_duplicates), len(fingerprints)))
+            duplicates.update(move_duplicates)
+        print('{} near-duplicates in total'.format(len(duplicates)))
+
+        if prune:
+            for file_path in duplicates:
+                os.remove(file_path)
+            if manifest is not None:
+                with manifest.transaction():
+                    for file_path in duplicates:
+                        manifest.mark_pruned(file_path)
+
+        if encode_flac:
+            remaining = [file_path for _, file_path in list_dataset(dataset_dir)
+                         if not file_path.endswith('.flac')]
+            saved = 0
+            for file_path, flac_path, old_size, new_size in executor.map(_encode_flac, remaining, chunksize=16):
+                saved += old_size - new_size
+                if manifest is not None:
+                    manifest.move_output(file_path, flac_path)
+            print('Re-encoded {} clips as FLAC, saving {:.1f} MB'.format(len(remaining), saved / 1e6))
+
+    if manifest is not None:
+        manifest.close()
+
+    if prune or encode_flac:
+        clips_after, bytes_after, load_after = dataset_usage(dataset_dir)
+        print('After: {} clips, {:.1f} MB ({:.0f}%), {:.2f} ms per clip load'.format(
+            clips_after, bytes_after / 1e6, 100 * bytes_after / max(1, bytes_before), 1000 * load_after))
+    return duplicates
+
+
+if __name__ == "__main__":
+    """
+    Reports near-duplicate clips in the dataset directory given as the first
+    argument, or move_files. Pass --prune to delete them, --flac to re-encode
+    the rest and --threshold <fraction> to change the duplicate threshold.
+    """
+
+    arguments = [argument for argument in sys.argv[1:]]
+    threshold = DUPLICATE_THRESHOLD
+    if '--threshold' in arguments:
+        threshold = float(arguments.pop(arguments.index('--threshold') + 1))
+    dataset_dir = next((argument for argument in arguments if not argument.startswith('--')), move_files_directory)
+    maintain_dataset(dataset_dir, prune='--prune' in arguments, encode_flac='--flac' in arguments,
+                     threshold=threshold)
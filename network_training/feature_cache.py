@@ -0,0 +1,298 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from move_recognizer import FEATURE_RATE, FFT_SIZE, FRAME_LENGTH, HOP_LENGTH, NUM_MELS, NUM_SEGMENTS, \
+    list_dataset, load_clip, log_mel_spectrogram, move_files_directory, utterance_features
+
+FEATURE_CACHE_VERSION: int = 1
+features_directory_name: str = 'features'
+header_file_name: str = 'header.json'
+data_file_name: str = 'features.f16'
+index_file_name: str = 'index.npy'
+files_file_name: str = 'files.json'
+
+# one row per distinct clip content; offsets and frames count feature rows
+INDEX_DTYPE = np.dtype([('hash', 'S32'), ('offset', '<i8'), ('frames', '<i4')])
+
+
+class FeatureConfig(NamedTuple):
+    """
+    The features stored by a FeatureCache.
+
+    Fields
+        kind (str): 'log_mel' for the log-mel spectrogram, 'mfcc' for its
+            cepstral coefficients or 'utterance' for the fixed length vector
+            of utterance_features
+        num_mfcc (int): the number of cepstral coefficients kept for 'mfcc'
+    """
+
+    kind: str = 'log_mel'
+    num_mfcc: int = 13
+
+    def dimensions(self) -> int:
+        if self.kind == 'log_mel':
+            return NUM_MELS
+        if self.kind == 'mfcc':
+            return self.num_mfcc
+        if self.kind == 'utterance':
+            return NUM_MELS * (NUM_SEGMENTS + 1)
+        raise ValueError('Unknown feature kind ' + self.kind)
+
+    def key(self) -> str:
+        """
+        Returns a digest of the config together with the extraction
+        parameters of move_recognizer, so changing either starts a new cache.
+        """
+
+        content = json.dumps({'version': FEATURE_CACHE_VERSION, 'config': self._asdict(),
+                              'extraction': [FEATURE_RATE, FRAME_LENGTH, HOP_LENGTH, FFT_SIZE, NUM_MELS,
+                                             NUM_SEGMENTS]}, sort_keys=True)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+
+def dct_matrix(num_coefficients: int, num_mels: int = NUM_MELS) -> np.ndarray:
+    """
+    Returns the orthonormal DCT-II matrix mapping log-mel energies to
+    cepstral coefficients, of shape (num_mels, num_coefficients).
+    """
+
+    bands = np.arange(num_mels) + 0.5
+    matrix = np.cos(np.pi / num_mels * np.outer(bands, np.arange(num_coefficients))) * np.sqrt(2.0 / num_mels)
+    matrix[:, 0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+def extract_features(samples: np.ndarray, config: FeatureConfig) -> np.ndarray:
+    """
+    Computes the features of a clip described by config.
+
+    Parameters
+        samples (np.ndarray): mono audio samples at FEATURE_RATE
+        config (FeatureConfig): the features to compute
+
+    Returns
+        np.ndarray: a float16 array of shape (frames, config.dimensions()),
+            with a single row for 'utterance'
+    """
+
+    if config.kind == 'utterance':
+        features = utterance_features(samples)[None, :]
+    elif config.kind == 'mfcc':
+        features = log_mel_spectrogram(samples) @ dct_matrix(config.num_mfcc)
+    else:
+        features = log_mel_spectrogram(samples)
+    return features.astype(np.float16)
+
+
+def content_hash(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+def _hash_file(file_path: str) -> bytes:
+    with open(file_path, 'rb') as file:
+        return content_hash(file.read())
+
+
+def _extract_file(arguments: Tuple[str, FeatureConfig]) -> np.ndarray:
+    file_path, config = arguments
+    return extract_features(load_clip(file_path), config)
+
+
+def _extract_samples(arguments: Tuple[np.ndarray, FeatureConfig]) -> np.ndarray:
+    samples, config = arguments
+    return extract_features(samples, config)
+
+
+class FeatureCache:
+    """
+    Incremental store of the features of every clip of a dataset, kept in the
+    dataset directory under features/<config key>. Features are float16 rows
+    appended to a single data file and addressed by the sha256 of the clip's
+    content, so renaming or copying a clip costs nothing and a clip is only
+    processed again when its audio changes. The cache also remembers the size,
+    modification time and hash of every clip file, so an update only reads
+    the files which are new or have changed.
+
+    A cache should be updated by one process at a time.
+
+    Parameters
+        dataset_dir (str): the directory holding one subdirectory per move
+        config (FeatureConfig): the features to store
+    """
+
+    def __init__(self, dataset_dir: str = move_files_directory, config: FeatureConfig = FeatureConfig()):
+        self.dataset_dir = dataset_dir
+        self.config = config
+        self.directory = os.path.join(dataset_dir, features_directory_name, config.key())
+        self.dimensions = config.dimensions()
+
+        os.makedirs(self.directory, exist_ok=True)
+        header_path = os.path.join(self.directory, header_file_name)
+        if not os.path.exists(header_path):
+            with open(header_path, 'w') as file:
+                json.dump({'version': FEATURE_CACHE_VERSION, 'config': config._asdict(),
+                           'dimensions': self.dimensions, 'dtype': 'float16'}, file)
+
+        index_path = os.path.join(self.directory, index_file_name)
+        self.index = np.load(index_path) if os.path.exists(index_path) else np.zeros(0, dtype=INDEX_DTYPE)
+        self.positions: Dict[bytes, int] = {bytes(row_hash): position
+                                            for position, row_hash in enumerate(self.index['hash'])}
+        files_path = os.path.join(self.directory, files_file_name)
+        self.files: Dict[str, List] = {}
+        if os.path.exists(files_path):
+            with open(files_path) as file:
+                self.files = json.load(file)
+        self.data: Optional[np.memmap] = None
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, clip_hash: bytes) -> bool:
+        return clip_hash in self.positions
+
+    def features(self, clip_hash: bytes) -> np.ndarray:
+        """
+        Returns the cached features of the clip with this content hash, as a
+        read-only float16 array of shape (frames, dimensions).
+        """
+
+        row = self.index[self.positions[clip_hash]]
+        if self.data is None or len(self.data) < (row['offset'] + row['frames']) * self.dimensions:
+            self.data = np.memmap(os.path.join(self.directory, data_file_name), dtype='<f2', mode='r')
+        start = row['offset'] * self.dimensions
+        return self.data[start:start + row['frames'] * self.dimensions].reshape(-1, self.dimensions)
+
+    def _file_hashes(self, clips: List[Tuple[str, str]]) -> List[bytes]:
+        """
+        Returns the content hash of every clip file, hashing only the files
+        whose size or modification time changed since they were last seen.
+        """
+
+        hashes = []
+        for _, file_path in clips:
+            relative_path = os.path.relpath(file_path, self.dataset_dir)
+            status = os.stat(file_path)
+            seen = self.files.get(relative_path)
+            if seen is None or seen[0] != status.st_size or seen[1] != status.st_mtime_ns:
+                seen = [status.st_size, status.st_mtime_ns, _hash_file(file_path).hex()]
+                self.files[relative_path] = seen
+            hashes.append(bytes.fromhex(seen[2]))
+        return hashes
+
+    def _append(self, new_hashes: List[bytes], features: Iterator[np.ndarray], report_interval: int = 1000):
+        """
+        Appends features to the data file, then rewrites the index and file
+        list. The index is replaced atomically, so an interrupted update only
+        leaves unreferenced rows at the end of the data file.
+        """
+
+        data_path = os.path.join(self.directory, data_file_name)
+        offset = os.path.getsize(data_path) // (2 * self.dimensions) if os.path.exists(data_path) else 0
+        rows = []
+        with open(data_path, 'ab') as data_file:
+            data_file.truncate(offset * 2 * self.dimensions)
+            for count, (clip_hash, clip_features) in enumerate(zip(new_hashes, features), 1):
+                data_file.write(np.ascontiguousarray(clip_features, dtype='<f2').tobytes())
+                rows.append((clip_hash, offset, len(clip_features)))
+                offset += len(clip_features)
+                if count % report_interval == 0:
+                    print('Extracted features of ' + str(count) + '/' + str(len(new_hashes)) + ' clips')
+
+        self.index = np.concatenate([self.index, np.array(rows, dtype=INDEX_DTYPE)])
+        self.positions.update((clip_hash, len(self.index) - len(rows) + number)
+                              for number, (clip_hash, _, _) in enumerate(rows))
+        self._write_json_and_index()
+
+    def _write_json_and_index(self):
+        index_path = os.path.join(self.directory, index_file_name)
+        with open(index_path + '.partial', 'wb') as file:
+            np.save(file, self.index)
+        os.replace(index_path + '.partial', index_path)
+        files_path = os.path.join(self.directory, files_file_name)
+        with open(files_path + '.partial', 'w') as file:
+            json.dump(self.files, file)
+        os.replace(files_path + '.partial', files_path)
+
+    def update(self, workers: Optional[int] = None) -> List[Tuple[str, bytes]]:
+        """
+        Brings the cache up to date with the dataset, extracting features with
+        a process pool for the clips which are not cached yet. A packed
+        dataset is read from its shards and loose clip files are decoded.
+
+        Parameters
+            workers (int): the number of worker processes, the core count if None
+
+        Returns
+            [(str, bytes)]: (move, content hash) of every clip of the dataset
+        """
+
+        # imported here since packed_dataset builds on move_recognizer as well
+        from packed_dataset import open_packed_dataset
+
+        packed = open_packed_dataset(self.dataset_dir)
+        if packed is not None:
+            clips = list(packed)
+            hashes = [content_hash(clip.samples.tobytes()) for clip in clips]
+            moves = [clip.move for clip in clips]
+            sources = [clip.samples for clip in clips]
+            extract = _extract_samples
+        else:
+            files = list_dataset(self.dataset_dir)
+            hashes = self._file_hashes(files)
+            moves = [move for move, _ in files]
+            sources = [file_path for _, file_path in files]
+            extract = _extract_file
+
+        new = {}
+        for clip_hash, source in zip(hashes, sources):
+            if clip_hash not in self.positions and clip_hash not in new:
+                new[clip_hash] = source
+
+        if new:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                features = executor.map(extract, [(source, self.config) for source in new.values()], chunksize=32)
+                self._append(list(new), features)
+        else:
+            self._write_json_and_index()
+        return list(zip(moves, hashes))
+
+    def dataset_features(self, workers: Optional[int] = None) -> Iterator[Tuple[str, np.ndarray]]:
+        """
+        Updates the cache and yields the features of every clip of the
+        dataset in list_dataset order.
+
+        Returns
+            (str, np.ndarray): (move, float16 features) pairs
+        """
+
+        for move, clip_hash in self.update(workers):
+            yield move, self.features(clip_hash)
+
+
+if __name__ == "__main__":
+    """
+    Updates the feature cache of the dataset directory given as the first
+    argument, or move_files. Pass --mfcc or --utterance to choose the
+    features, log-mel spectrograms by default.
+    """
+
+    dataset_dir = next((argument for argument in sys.argv[1:] if not argument.startswith('--')), move_files_directory)
+    kind = 'mfcc' if '--mfcc' in sys.argv else 'utterance' if '--utterance' in sys.argv else 'log_mel'
+    cache = FeatureCache(dataset_dir, FeatureConfig(kind))
+
+    cached = len(cache)
+    start = time.perf_counter()
+    clips = cache.update()
+    print('Cached ' + str(len(cache) - cached) + ' new of ' + str(len(clips)) + ' clips in %.1f s'
+          % (time.perf_counter() - start))
+
+    start = time.perf_counter()
+    frames = sum(len(cache.features(clip_hash)) for _, clip_hash in clips)
+    print('Read ' + str(frames) + ' feature rows back in %.3f s' % (time.perf_counter() - start))
@@ -0,0 +1,374 @@
+from contextlib import contextmanager
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pydub import AudioSegment
+
+import augmentation
+import cloud_synthesis
+from cloud_synthesis import SynthesisRequest, synthesize_all
+from synthesis_manifest import SynthesisManifest, synthesis_key
+from text_move_enumerator import get_move_vocabulary
+import voice_data_generator
+
+BENCHMARK_VERSION: int = 1
+results_file_path: str = 'generation_benchmark.json'
+generators: List[str] = ['pyttsx3', 'gtts', 'polly']
+
+# stages timed in every generator; time outside them is reported as 'other'
+STAGES: List[str] = ['synth', 'decode', 'pitch', 'conversion', 'write']
+
+
+class StageTimer:
+    """
+    Accumulates the time spent in each stage of a generator. Stages running
+    on several threads at once add up, so with cloud engines the stage
+    totals can exceed the elapsed time.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {stage: 0.0 for stage in STAGES}
+        self.calls: Dict[str, int] = {stage: 0 for stage in STAGES}
+        self.lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self.lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += 1
+
+    def wrap(self, stage: str, function: Callable) -> Callable:
+        """
+        Returns function with every call timed as stage.
+        """
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+
+@contextmanager
+def instrumented(timer: StageTimer, patches: List[Tuple[object, str, str]]):
+    """
+    Times the listed functions as their stages for the duration of the
+    block, then restores them.
+
+    Parameters
+        timer (StageTimer): the timer to record into
+        patches ([(object, str, str)]): (module or object, attribute, stage) triples
+    """
+
+    originals = [(owner, name, getattr(owner, name)) for owner, name, _ in patches]
+    for owner, name, stage in patches:
+        setattr(owner, name, timer.wrap(stage, getattr(owner, name)))
+    try:
+        yield timer
+    finally:
+        for owner, name, original in originals:
+            setattr(owner, name, original)
+
+
+def _encode(wav: bytes, audio_format: str) -> bytes:
+    if audio_format == 'wav':
+        return wav
+    buffer = io.BytesIO()
+    AudioSegment.from_file(io.BytesIO(wav), format='wav').export(buffer, format=audio_format)
+    return buffer.getvalue()
+
+
+class FakePyttsx3Engine:
+    """
+    Stands in for a pyttsx3 engine, writing a tone to the requested file
+    after a fixed latency per render.
+
+    Parameters
+        latency (float): seconds each render takes
+    """
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.properties = {'voices': [], 'voice': 'fake', 'rate': 200}
+        self.queued: List[Tuple[str, str]] = []
+
+    def getProperty(self, name: str):
+        return self.properties[name]
+
+    def setProperty(self, name: str, value):
+        self.properties[name] = value
+
+    def save_to_file(self, text: str, file_path: str):
+        self.queued.append((text, file_path))
+
+    def runAndWait(self):
+        for text, file_path in self.queued:
+            time.sleep(self.latency)
+            with open(file_path, 'wb') as file:
+                file.write(cloud_synthesis._tone_wav(text, sample_rate=22050))
+        self.queued = []
+
+
+class FakeProvider:
+    """
+    Stands in for a cloud TTS provider, answering after a fixed latency with
+    a tone in the provider's audio format, mp3 like gTTS and Polly.
+
+    Parameters
+        audio_format (str): the format of the returned audio
+        latency (float): seconds each request takes
+        requests_per_second (float): the quota given to the driver
+    """
+
+    def __init__(self, audio_format: str = 'mp3', latency: float = 0.1, requests_per_second: float = 1000.0):
+        self.audio_format = audio_format
+        self.latency = latency
+        self.requests_per_second = requests_per_second
+
+    def synthesize(self, text: str) -> bytes:
+        time.sleep(self.latency)
+        return _encode(cloud_synthesis._tone_wav(text), self.audio_format)
+
+
+def _timed_convert_to_wav(timer: StageTimer) -> Callable:
+    # convert_to_wav split into its decode and its write, timed separately
+    def convert_to_wav(data: bytes, audio_format: str, output_file: str):
+        start = time.perf_counter()
+        audio = AudioSegment.from_file(io.BytesIO(data), format=audio_format)
+        timer.add('conversion', time.perf_counter() - start)
+        start = time.perf_counter()
+        os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+        audio.export(output_file, format='wav')
+        timer.add('write', time.perf_counter() - start)
+    return convert_to_wav
+
+
+def sample_moves(count: int, seed: int = 0) -> List[Tuple[int, str, str]]:
+    """
+    Returns a fixed random sample of (move ID, text move, spoken move) from
+    the vocabulary, in ID order, so every run benchmarks the same moves.
+    """
+
+    vocabulary = list(get_move_vocabulary())
+    return sorted(random.Random(seed).sample(vocabulary, min(count, len(vocabulary))))
+
+
+def benchmark_pyttsx3(moves: List[Tuple[int, str, str]], dataset_dir: str, timer: StageTimer,
+                      latency: float, local: bool) -> int:
+    """
+    Renders the sample through render_pyttsx3_job with one voice and rate,
+    writing every variant of pyttsx3_augmentation.
+
+    Returns
+        int: the number of clips written
+    """
+
+    if local:
+        import pyttsx3
+        engine = pyttsx3.init()
+        voice_ids = [engine.getProperty('voices')[0].id]
+    else:
+        engine = FakePyttsx3Engine(latency)
+        voice_ids = ['fake']
+    rate = voice_data_generator.pyttsx3_rates[0]
+
+    patches = [(engine, 'runAndWait', 'synth'), (voice_data_generator, 'load_render', 'decode'),
+               (augmentation, 'pitch_shift', 'pitch'), (augmentation, 'write_wav', 'write')]
+    clips = 0
+    with SynthesisManifest(dataset_dir) as manifest, instrumented(timer, patches):
+        for move_id, text_move, move in moves:
+            for voice_id in voice_ids:
+                job = voice_data_generator.SynthesisJob(text_move, move, voice_id, rate)
+                clips += len(voice_data_generator.render_pyttsx3_job(
+                    engine, job, voice_data_generator.pyttsx3_augmentation, manifest))
+    return clips
+
+
+def benchmark_cloud(generator: str, moves: List[Tuple[int, str, str]], dataset_dir: str, timer: StageTimer,
+                    latency: float, quota: bool) -> Tuple[int, int]:
+    """
+    Synthesizes the sample through synthesize_all with the requests the gTTS
+    or Polly generator would send, answered by a FakeProvider. With quota,
+    the request rate is held to the real engine's quota.
+
+    Returns
+        (int, int): the number of clips written and of requests that failed
+    """
+
+    if generator == 'gtts':
+        requests = [voice_data_generator.gtts_request(move, text_move, 'us', False, 'us')
+                    for _, text_move, move in moves]
+        rate = cloud_synthesis.GTTS_REQUESTS_PER_SECOND
+    else:
+        requests = [SynthesisRequest(move, os.path.join(voice_data_generator.move_files_directory, text_move,
+                                                        'Geraint.wav'),
+                                     synthesis_key('polly', move, voice='Geraint'), {'voice': 'Geraint'})
+                    for _, text_move, move in moves]
+        rate = cloud_synthesis.POLLY_REQUESTS_PER_SECOND
+    provider = FakeProvider('mp3', latency, rate if quota else 1000.0)
+
+    patches = [(provider, 'synthesize', 'synth'), (cloud_synthesis, '_write_bytes', 'write')]
+    original_convert = cloud_synthesis.convert_to_wav
+    cloud_synthesis.convert_to_wav = _timed_convert_to_wav(timer)
+    try:
+        with SynthesisManifest(dataset_dir) as manifest, instrumented(timer, patches):
+            stats = synthesize_all(provider, requests, manifest=manifest, report_interval=3600.0)
+    finally:
+        cloud_synthesis.convert_to_wav = original_convert
+    return stats.completed, stats.failed
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak resident set size of this process and its finished
+    children, such as ffmpeg, in MB.
+    """
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1.0 / 1024 if sys.platform != 'darwin' else 1.0 / (1024 * 1024)
+    peaks = [resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return max(peaks) * scale
+
+
+def run_generator(generator: str, moves: List[Tuple[int, str, str]], latency: float = 0.05,
+                  local: bool = False, quota: bool = False) -> Dict:
+    """
+    Benchmarks one generator on the sample of moves in a fresh dataset
+    directory.
+
+    Parameters
+        generator (str): 'pyttsx3', 'gtts' or 'polly'
+        moves ([(int, str, str)]): the moves to synthesize
+        latency (float): seconds each fake TTS call takes
+        local (bool): use the installed pyttsx3 engine instead of a fake one
+        quota (bool): hold cloud requests to the real engine's quota
+
+    Returns
+        dict: the clips written, requests failed, elapsed seconds, clips per
+            second, seconds per stage and peak RSS, with an error if no clip
+            was written
+    """
+
+    dataset_dir = tempfile.mkdtemp(prefix='generation_benchmark_')
+    voice_data_generator.move_files_directory = dataset_dir
+    timer = StageTimer()
+    start = time.perf_counter()
+    try:
+        if generator == 'pyttsx3':
+            clips, failed = benchmark_pyttsx3(moves, dataset_dir, timer, latency, local), 0
+        else:
+            clips, failed = benchmark_cloud(generator, moves, dataset_dir, timer, latency, quota)
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+
+    stages = dict(timer.seconds)
+    stages['other'] = max(0.0, elapsed - sum(stages.values()))
+    result = {
+        'moves': len(moves),
+        'clips': clips,
+        'failed': failed,
+        'seconds': elapsed,
+        'clips_per_second': clips / elapsed if elapsed > 0 else 0.0,
+        'stage_seconds': stages,
+        'stage_calls': dict(timer.calls),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if clips == 0:
+        result['error'] = 'no clips written, %d requests failed' % failed
+    return result
+
+
+def _run_isolated(generator: str, moves: List[Tuple[int, str, str]], options: Dict, results: multiprocessing.Queue):
+    try:
+        results.put(run_generator(generator, moves, **options))
+    except Exception as error:
+        results.put({'error': repr(error)})
+
+
+def run_benchmark(selected: Optional[List[str]] = None, num_moves: int = 50, seed: int = 0,
+                  latency: float = 0.05, local: bool = False, quota: bool = False) -> Dict:
+    """
+    Benchmarks each selected generator in its own process, so that the peak
+    RSS of one is not carried into the next.
+
+    Parameters
+        selected ([str]): the generators to run, every generator if None
+        num_moves (int): the size of the fixed sample of moves
+        seed (int): selects the sample of moves
+        latency (float): seconds each fake TTS call takes
+        local (bool): use the installed pyttsx3 engine instead of a fake one
+        quota (bool): hold cloud requests to the real engine's quota
+
+    Returns
+        dict: the results of every generator along with the run's settings
+    """
+
+    moves = sample_moves(num_moves, seed)
+    options = {'latency': latency, 'local': local, 'quota': quota}
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for generator in selected or generators:
+        queue = context.Queue()
+        process = context.Process(target=_run_isolated, args=(generator, moves, options, queue))
+        process.start()
+        results[generator] = queue.get()
+        process.join()
+
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        revision = None
+    return {
+        'benchmark_version': BENCHMARK_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': revision,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': dict(options, moves=num_moves, seed=seed),
+        'generators': results,
+    }
+
+
+if __name__ == "__main__":
+    """
+    Benchmarks the dataset generators against fake engines and writes the
+    results to generation_benchmark.json. Pass generator names to run only
+    those, --moves <count> to change the sample size, --output <path> for
+    the results file, --local to render with the installed pyttsx3 engine
+    and --quota to hold the cloud engines to their real quotas.
+    """
+
+    arguments = sys.argv[1:]
+    num_moves = int(arguments[arguments.index('--moves') + 1]) if '--moves' in arguments else 50
+    output = arguments[arguments.index('--output') + 1] if '--output' in arguments else results_file_path
+    selected = [argument for argument in arguments if argument in generators]
+
+    report = run_benchmark(selected, num_moves, local='--local' in arguments, quota='--quota' in arguments)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    for generator, result in report['generators'].items():
+        if 'error' in result:
+            print(generator + ': failed with ' + result['error'])
+            continue
+        stages = ', '.join('%s %.2f s' % (stage, seconds) for stage, seconds in result['stage_seconds'].items())
+        print('%s: %d clips (%d failed) in %.1f s, %.1f clips/s, peak RSS %.0f MB' % (
+            generator, result['clips'], result['failed'], result['seconds'], result['clips_per_second'], result['peak_rss_mb']))
+        print('  ' + stages)
+    print('Results written to ' + output)
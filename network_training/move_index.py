@@ -0,0 +1,577 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from text_move_enumerator import get_move_vocabulary
+
+# canonical tokens are the characters of a move in standard algebraic notation,
+# except castling which is a single token
+PIECE_WORDS = {
+    'N': ['knight', 'knights', 'night', 'nights', 'nite', 'knite'],
+    'B': ['bishop', 'bishops'],
+    'R': ['rook', 'rooks', 'rock', 'rocks', 'brook', 'ruck'],
+    'Q': ['queen', 'queens'],
+    'K': ['king', 'kings'],
+}
+FILE_WORDS = {
+    'a': ['a', 'ay', 'eh'],
+    'b': ['b', 'be', 'bee'],
+    'c': ['c', 'see', 'sea', 'si', 'cee'],
+    'd': ['d', 'dee', 'de'],
+    'e': ['e', 'ee'],
+    'f': ['f', 'ef', 'eff'],
+    'g': ['g', 'gee', 'ji'],
+    'h': ['h', 'age', 'aitch', 'each', 'ache'],
+}
+RANK_WORDS = {
+    '1': ['1', 'one', 'won', 'juan'],
+    '2': ['2', 'two'],
+    '3': ['3', 'three', 'tree', 'free'],
+    '4': ['4', 'four', 'fore'],
+    '5': ['5', 'five', 'hive'],
+    '6': ['6', 'six', 'sicks', 'sex'],
+    '7': ['7', 'seven'],
+    '8': ['8', 'eight', 'ate'],
+}
+SYMBOL_WORDS = {
+    'x': ['x', 'takes', 'take', 'took', 'taking', 'captures', 'capture', 'ex'],
+    '+': ['+', 'check', 'czech', 'checks'],
+    '#': ['#', 'checkmate', 'mate'],
+    '=': ['=', 'equals', 'equal', 'promotes', 'promote', 'promotion', 'promoting'],
+    'castle': ['castle', 'castles', 'castling'],
+    'short': ['short', 'kingside'],
+    'long': ['long', 'queenside'],
+}
+# words which are a rank directly after a file and filler anywhere else
+AMBIGUOUS_RANK_WORDS = {'to': '2', 'too': '2', 'for': '4'}
+FILLER_WORDS = ['pawn', 'pawns', 'move', 'moves', 'on', 'the', 'square', 'and', 'please', 'side']
+
+FILES = 'abcdefgh'
+RANKS = '12345678'
+SAN_PATTERN = re.compile(r'([NBRQK]?[a-h]?[1-8]?x?[a-h][1-8](=[NBRQ])?|O-O(-O)?)[+#]?')
+# the parts of a move in standard algebraic notation other than castling
+SAN_PARTS_PATTERN = re.compile(r'([NBRQK]?)([a-h]?[1-8]?)x?([a-h][1-8])(?:=([NBRQ]))?[+#]?')
+CASTLING_TOKENS = {('short', 'castle'): 'O-O', ('long', 'castle'): 'O-O-O'}
+
+
+def _build_lexicon() -> Dict[str, str]:
+    lexicon = {}
+    for table in (PIECE_WORDS, FILE_WORDS, RANK_WORDS, SYMBOL_WORDS):
+        for token, words in table.items():
+            for word in words:
+                lexicon[word] = token
+    for word in FILLER_WORDS:
+        lexicon[word] = ''
+    return lexicon
+
+
+def phonetic_key(word: str) -> str:
+    """
+    Reduces a word to a rough representation of how it sounds, so that
+    misspellings and near homophones share a key. Silent letter pairs are
+    simplified, letters with similar sounds are merged and vowels after the
+    first letter are dropped.
+
+    Parameters
+        word (str): a lowercase word
+
+    Returns
+        str: the phonetic key of the word
+    """
+
+    for pattern, replacement in (('^kn', 'n'), ('^wr', 'r'), ('^ps', 's'), ('ph', 'f'), ('gh', ''),
+                                 ('ck', 'k'), ('q', 'k'), ('z', 's'), ('[yw]', '')):
+        word = re.sub(pattern, replacement, word)
+    if len(word) == 0:
+        return ''
+    key = word[0] + re.sub('[aeiou]', '', word[1:])
+    return re.sub(r'(.)\1+', r'\1', key)
+
+
+LEXICON: Dict[str, str] = _build_lexicon()
+
+# only keys shared by words with a single meaning are usable
+_phonetic_candidates: Dict[str, set] = {}
+for _word, _token in LEXICON.items():
+    if len(_word) >= 3:
+        _phonetic_candidates.setdefault(phonetic_key(_word), set()).add(_token)
+PHONETIC_LEXICON: Dict[str, str] = {key: tokens.pop() for key, tokens in _phonetic_candidates.items() if len(tokens) == 1}
+
+
+def normalize_san(move: str) -> Optional[str]:
+    """
+    Brings a move typed or transcribed in algebraic notation without regard
+    to case, such as 'nf3', 'NF3' or 'o-o', into standard algebraic notation.
+    A lowercase leading b is a pawn on the b file when the rest is a pawn
+    move, as in 'b4' or 'bxc3', and a bishop otherwise, as in 'be5'.
+
+    Parameters
+        move (str): the move as typed or transcribed
+
+    Returns
+        str: the move in standard algebraic notation, or None if the text is
+            not a move
+    """
+
+    move = move.strip()
+    piece = move[:1] in ('N', 'B', 'R', 'Q', 'K')
+    move = move.lower().replace('0', 'o')
+    if move.startswith('o-o'):
+        move = move.upper()
+    elif piece or move[:1] in ('n', 'r', 'q', 'k') or \
+            (move[:1] == 'b' and not re.fullmatch(r'b(x[ac])?[1-8].*', move)):
+        move = move[0].upper() + move[1:]
+    move = re.sub('=[nbrq]', lambda promotion: promotion.group(0).upper(), move)
+    return move if SAN_PATTERN.fullmatch(move) else None
+
+
+def _segment(word: str) -> Optional[List[str]]:
+    """
+    Splits a word which speech recognition ran together, such as 'htakes',
+    into lexicon words. Returns None if no split exists.
+    """
+
+    best: List[Optional[List[str]]] = [[]] + [None] * len(word)
+    for end in range(1, len(word) + 1):
+        for start in range(max(0, end - 10), end):
+            if best[start] is not None and word[start:end] in LEXICON:
+                candidate = best[start] + [word[start:end]]
+                if best[end] is None or len(candidate) < len(best[end]):
+                    best[end] = candidate
+    return best[len(word)]
+
+
+def _word_tokens(word: str) -> List[str]:
+    if word in LEXICON or word in AMBIGUOUS_RANK_WORDS:
+        return [word]
+    segmented = _segment(word)
+    if segmented is not None:
+        return segmented
+    phonetic = PHONETIC_LEXICON.get(phonetic_key(word))
+    return [] if phonetic is None else [phonetic]
+
+
+def transcript_tokens(transcript: str) -> Tuple[str, ...]:
+    """
+    Converts a spoken or transcribed move into canonical tokens.
+
+    Parameters
+        transcript (str): text such as 'night to f3' or 'Knight F3'
+
+    Returns
+        (str): canonical tokens, e.g. ('N', 'f', '3')
+    """
+
+    # engines occasionally transcribe a move directly in algebraic notation
+    move = normalize_san(transcript)
+    if move is not None:
+        return san_tokens(move)
+
+    words = []
+    for word in re.findall(r'[a-z]+|\d|[=+#]', transcript.lower()):
+        words.extend(_word_tokens(word))
+
+    tokens = []
+    for word in words:
+        if word in AMBIGUOUS_RANK_WORDS:
+            if len(tokens) > 0 and tokens[-1] in FILES:
+                tokens.append(AMBIGUOUS_RANK_WORDS[word])
+            continue
+        token = LEXICON.get(word, word)
+        if token == '':
+            continue
+        # 'check mate' is a single suffix
+        if token == '#' and len(tokens) > 0 and tokens[-1] == '+':
+            tokens.pop()
+        if token == 'castle' and len(tokens) > 0 and (tokens[-1], token) in CASTLING_TOKENS:
+            token = CASTLING_TOKENS[(tokens.pop(), token)]
+        # 'castles kingside' names the side after the castle
+        elif token in ('short', 'long') and len(tokens) > 0 and tokens[-1] == 'castle':
+            token = CASTLING_TOKENS[(token, tokens.pop())]
+        tokens.append(token)
+    return tuple(tokens)
+
+
+def san_tokens(move: str) -> Tuple[str, ...]:
+    """
+    Converts a move in standard algebraic notation into canonical tokens.
+
+    Parameters
+        move (str): a move such as 'Nf3' or 'O-O+'
+
+    Returns
+        (str): canonical tokens, e.g. ('N', 'f', '3')
+    """
+
+    for castle in ('O-O-O', 'O-O'):
+        if move.startswith(castle):
+            return (castle,) + tuple(move[len(castle):])
+    return tuple(move)
+
+
+def token_distance(first: Tuple[str, ...], second: Tuple[str, ...]) -> int:
+    """
+    Returns the Levenshtein distance between two token sequences.
+    """
+
+    previous = list(range(len(second) + 1))
+    for i, first_token in enumerate(first, 1):
+        current = [i]
+        for j, second_token in enumerate(second, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (first_token != second_token)))
+        previous = current
+    return previous[-1]
+
+
+def is_move_tokens(tokens: Tuple[str, ...]) -> bool:
+    """
+    Returns whether canonical tokens could describe a move at all, which
+    needs a destination square or castling. Transcripts of other speech, such
+    as 'have' becoming a lone rank, are never matched to a move.
+    """
+
+    if 'O-O' in tokens or 'O-O-O' in tokens:
+        return True
+    return any(first in FILES and second in RANKS for first, second in zip(tokens, tokens[1:]))
+
+
+def coordinate_tokens(tokens: Tuple[str, ...]) -> Optional[Tuple[str, str, Optional[str]]]:
+    """
+    Recognizes a move given by its origin and destination squares, such as
+    'e2 e4', 'e two takes d three' or 'e7e8 queen', which standard algebraic
+    notation never produces without a piece letter.
+
+    Returns
+        (str, str, str): the origin square, the destination square and the
+            promotion piece or None, or None if the tokens are not coordinates
+    """
+
+    tokens = tuple(token for token in tokens if token not in ('x', '=', '+', '#'))
+    if len(tokens) not in (4, 5) or any(token not in FILES for token in tokens[0:4:2]) or \
+            any(token not in RANKS for token in tokens[1:4:2]):
+        return None
+    promotion = tokens[4] if len(tokens) == 5 else None
+    if promotion is not None and promotion not in 'NBRQ':
+        return None
+    return tokens[0] + tokens[1], tokens[2] + tokens[3], promotion
+
+
+def _reaches(piece: str, origin: str, destination: str) -> bool:
+    """
+    Returns whether a piece can move from origin to destination on an empty
+    board, pawns of either colour moving or capturing.
+    """
+
+    file_step = abs(FILES.index(destination[0]) - FILES.index(origin[0]))
+    rank_step = abs(int(destination[1]) - int(origin[1]))
+    if piece == 'N':
+        return {file_step, rank_step} == {1, 2}
+    if piece == 'B':
+        return file_step == rank_step > 0
+    if piece == 'R':
+        return (file_step == 0) != (rank_step == 0)
+    if piece == 'Q':
+        return file_step == rank_step > 0 or (file_step == 0) != (rank_step == 0)
+    if piece == 'K':
+        return max(file_step, rank_step) == 1
+    return (file_step == 0 and rank_step in (1, 2)) or file_step == rank_step == 1
+
+
+def move_squares(move: str) -> Optional[Tuple[str, str, str, Optional[str]]]:
+    """
+    Splits a move in standard algebraic notation into the moving piece, the
+    known part of its origin, its destination and the promotion piece. The
+    moving piece of a pawn move is '' and its known origin is its file.
+    Castling is a king move from the e file to the g or c file.
+
+    Returns
+        (str, str, str, str): piece, origin, destination and promotion, or
+            None if the move is not in standard algebraic notation
+    """
+
+    if move.startswith('O-O'):
+        return 'K', 'e', 'c' if move.startswith('O-O-O') else 'g', None
+    parts = SAN_PARTS_PATTERN.fullmatch(move)
+    if parts is None:
+        return None
+    piece, origin, destination, promotion = parts.groups()
+    if piece == '' and origin == '':
+        origin = destination[0]
+    return piece, origin, destination, promotion
+
+
+def fits_coordinates(move: str, origin: str, destination: str, promotion: Optional[str] = None) -> bool:
+    """
+    Returns whether a move in standard algebraic notation can be the move
+    from origin to destination. A pawn reaching the last rank promotes to a
+    queen unless another promotion is given.
+    """
+
+    squares = move_squares(move)
+    if squares is None:
+        return False
+    piece, known_origin, known_destination, move_promotion = squares
+    if move.startswith('O-O'):
+        return origin[0] == 'e' and origin[1] in '18' and destination == known_destination + origin[1]
+    if known_destination != destination or not _reaches(piece, origin, destination):
+        return False
+    # the known origin is a file, a rank or a whole square
+    if any(part not in origin for part in known_origin):
+        return False
+    if move_promotion is not None:
+        return move_promotion == (promotion or 'Q')
+    return promotion is None
+
+
+def _bit_counts(values: np.ndarray) -> np.ndarray:
+    """
+    Returns the number of set bits of every element of an array of 8 or 16
+    bit unsigned integers.
+    """
+
+    dtype = values.dtype.type
+    counts = values - ((values >> dtype(1)) & dtype(0x5555 & np.iinfo(dtype).max))
+    counts = (counts & dtype(0x3333 & np.iinfo(dtype).max)) + \
+        ((counts >> dtype(2)) & dtype(0x3333 & np.iinfo(dtype).max))
+    counts = (counts + (counts >> dtype(4))) & dtype(0x0F0F & np.iinfo(dtype).max)
+    if dtype == np.uint16:
+        counts = (counts + (counts >> dtype(8))) & dtype(0x1F)
+    return counts.astype(np.int16)
+
+
+def _without_check(tokens: Tuple[str, ...]) -> Tuple[str, ...]:
+    return tokens[:-1] if len(tokens) > 1 and tokens[-1] in ('+', '#') else tokens
+
+
+class TokenMatcher:
+    """
+    Finds every token sequence of a fixed set within a bounded edit distance
+    of a query. The distances to all sequences are computed at once with
+    Myers' bit-parallel algorithm: each sequence is a column of bit masks,
+    one bit per token, and every query token updates the whole column with a
+    handful of vectorized integer operations. The cost of a search is
+    therefore independent of how many sequences are close to the query.
+
+    Parameters
+        sequences ([(str)]): the non-empty token sequences to search, of at
+            most 16 tokens each
+    """
+
+    def __init__(self, sequences: Iterable[Tuple[str, ...]]):
+        # sequences are kept by length, so only those of a length within reach
+        # of the query are scored
+        self.sequences = sorted(sequences, key=len)
+        longest = max((len(sequence) for sequence in self.sequences), default=1)
+        if longest > 16:
+            raise ValueError('Token sequences are limited to 16 tokens, found ' + str(longest))
+        self.dtype = np.uint8 if longest <= 8 else np.uint16
+        self.token_ids: Dict[str, int] = {}
+        for sequence in self.sequences:
+            for token in sequence:
+                self.token_ids.setdefault(token, len(self.token_ids))
+
+        # bit i of match_masks[token][j] is set when token i of sequence j is token;
+        # the extra row matches nothing, for query tokens in no sequence
+        self.match_masks = np.zeros((len(self.token_ids) + 1, len(self.sequences)), dtype=self.dtype)
+        for column, sequence in enumerate(self.sequences):
+            for position, token in enumerate(sequence):
+                self.match_masks[self.token_ids[token], column] |= self.dtype(1 << position)
+        self.lengths = np.array([len(sequence) for sequence in self.sequences], dtype=np.int16)
+        self.full_masks = np.array([(1 << length) - 1 for length in self.lengths], dtype=self.dtype)
+        # the position of every sequence in sorted order, to break ties
+        self.ranks = np.empty(len(self.sequences), dtype=np.int64)
+        self.ranks[sorted(range(len(self.sequences)), key=self.sequences.__getitem__)] = \
+            np.arange(len(self.sequences))
+
+    def distances(self, tokens: Tuple[str, ...], start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """
+        Returns the Levenshtein distance from the query to every sequence, or
+        to the sequences in positions start to end.
+        """
+
+        full_masks = self.full_masks[start:end]
+        positive = full_masks.copy()
+        negative = np.zeros_like(positive)
+        vertical = np.empty_like(positive)
+        horizontal = np.empty_like(positive)
+        horizontal_positive = np.empty_like(positive)
+        horizontal_negative = np.empty_like(positive)
+        for token in tokens:
+            matches = self.match_masks[self.token_ids.get(token, len(self.token_ids)), start:end]
+            np.bitwise_or(matches, negative, out=vertical)
+            np.bitwise_and(matches, positive, out=horizontal)
+            horizontal += positive
+            horizontal ^= positive
+            horizontal |= matches
+            np.bitwise_or(horizontal, positive, out=horizontal_positive)
+            np.invert(horizontal_positive, out=horizontal_positive)
+            horizontal_positive |= negative
+            np.bitwise_and(positive, horizontal, out=horizontal_negative)
+            horizontal_positive <<= 1
+            horizontal_positive |= 1
+            horizontal_negative <<= 1
+            np.bitwise_or(vertical, horizontal_positive, out=positive)
+            np.invert(positive, out=positive)
+            positive |= horizontal_negative
+            np.bitwise_and(horizontal_positive, vertical, out=negative)
+
+        # the last column of the distance table starts at the query length
+        # and every set bit of the vertical deltas moves it up or down by one
+        positive &= full_masks
+        negative &= full_masks
+        return len(tokens) + _bit_counts(positive) - _bit_counts(negative)
+
+    def search(self, tokens: Tuple[str, ...], max_distance: int) -> List[Tuple[int, Tuple[str, ...]]]:
+        """
+        Returns every sequence within max_distance of the query, closest
+        first, then closest in length, then in sorted order.
+
+        Returns
+            [(int, (str))]: (distance, sequence) pairs
+        """
+
+        start = int(np.searchsorted(self.lengths, len(tokens) - max_distance, 'left'))
+        end = int(np.searchsorted(self.lengths, len(tokens) + max_distance, 'right'))
+        if start == end:
+            return []
+        distances = self.distances(tokens, start, end)
+        found = np.flatnonzero(distances <= max_distance)
+        lengths = self.lengths[start:end][found]
+        found = found[np.lexsort((self.ranks[start:end][found], np.abs(lengths - len(tokens)), distances[found]))]
+        return [(int(distances[column]), self.sequences[start + column]) for column in found]
+
+
+class MoveIndex:
+    """
+    Precomputed lookup from transcripts to moves. Every spoken and written
+    move form is reduced to canonical tokens, which are found exactly through
+    a hash map or approximately through a TokenMatcher. A spoken form
+    resolves to the move it is paired with in the vocabulary. Moves given as
+    origin and destination squares are looked up by their destination.
+
+    Parameters
+        text_moves ([str]): moves in standard algebraic notation
+        voice_moves ([str]): the spoken form of each move, in the same order
+        max_distance (int): the largest token edit distance accepted for a match
+    """
+
+    def __init__(self, text_moves: Iterable[str], voice_moves: Iterable[str], max_distance: int = 2):
+        self.max_distance = max_distance
+        self.moves_by_tokens: Dict[Tuple[str, ...], str] = {}
+
+        text_moves = list(text_moves)
+        keys = [(san_tokens(move), move) for move in text_moves] + \
+            [(transcript_tokens(voice), move) for voice, move in zip(voice_moves, text_moves)]
+        for tokens, move in keys:
+            if len(tokens) > 0 and tokens not in self.moves_by_tokens:
+                self.moves_by_tokens[tokens] = move
+        # the check suffix does not identify a move, so approximate matching
+        # only compares the rest and the suffix of the transcript is kept
+        self.matcher = TokenMatcher({_without_check(tokens) for tokens in self.moves_by_tokens})
+        self.moves = frozenset(self.moves_by_tokens.values())
+
+        # a move named by its squares is never written with disambiguation or
+        # check, so only the plain form of each move is kept by destination
+        self.moves_by_destination: Dict[str, List[str]] = {}
+        for move in self.moves:
+            squares = move_squares(move)
+            if squares is None or move[-1] in '+#' or \
+                    (squares[0] != '' and squares[1] != '' and not move.startswith('O-O')):
+                continue
+            destinations = [squares[2] + rank for rank in '18'] if move.startswith('O-O') else [squares[2]]
+            for destination in destinations:
+                self.moves_by_destination.setdefault(destination, []).append(move)
+
+    def _distance_bound(self, tokens: Tuple[str, ...]) -> int:
+        # a single token edit turns a two token move into another valid move,
+        # so short transcripts must match exactly
+        return min(self.max_distance, len(tokens) // 3)
+
+    def resolve(self, transcript: str, candidates: Optional[Iterable[str]] = None) -> Optional[str]:
+        """
+        Finds the move closest to a transcript.
+
+        Parameters
+            transcript (str): the text produced by a speech to text engine
+            candidates ([str]): if given, only these moves are considered
+
+        Returns
+            str: the closest move in standard algebraic notation, or None if no
+                move is close enough
+        """
+
+        tokens = transcript_tokens(transcript)
+        if not is_move_tokens(tokens):
+            return None
+        coordinates = coordinate_tokens(tokens)
+        if coordinates is not None:
+            return self.resolve_coordinates(*coordinates, candidates)
+
+        if candidates is not None:
+            bound = self._distance_bound(tokens)
+            matches = [(token_distance(tokens, san_tokens(move)), move) for move in candidates]
+            matches = [match for match in matches if match[0] <= bound]
+            return min(matches, key=lambda match: (match[0], match[1]))[1] if matches else None
+
+        if tokens in self.moves_by_tokens:
+            return self.moves_by_tokens[tokens]
+        move_tokens = _without_check(tokens)
+        matches = self.matcher.search(move_tokens, self._distance_bound(move_tokens))
+        if len(matches) == 0:
+            return None
+        closest = matches[0][1]
+        return self.moves_by_tokens.get(closest + tokens[len(move_tokens):], self.moves_by_tokens[closest])
+
+    def resolve_coordinates(self, origin: str, destination: str, promotion: Optional[str] = None,
+                            candidates: Optional[Iterable[str]] = None) -> Optional[str]:
+        """
+        Finds the move from origin to destination. Without candidates to
+        narrow the choice several moves can fit, in which case pawn moves and
+        castling are preferred to piece moves and shorter moves, those
+        without disambiguation or check, to longer ones.
+
+        Parameters
+            origin (str): the origin square, e.g. 'g1'
+            destination (str): the destination square, e.g. 'f3'
+            promotion (str): the promotion piece, a queen if None
+            candidates ([str]): if given, only these moves are considered
+
+        Returns
+            str: the move in standard algebraic notation, or None if no move fits
+        """
+
+        moves = self.moves_by_destination.get(destination, []) if candidates is None else candidates
+        fitting = [move for move in moves if fits_coordinates(move, origin, destination, promotion)]
+        return min(fitting, key=lambda move: (move[0] in 'NBRQK', len(move), move)) if fitting else None
+
+
+_default_index: Optional[MoveIndex] = None
+
+
+def get_move_index() -> MoveIndex:
+    """
+    Returns the index over the enumerated move vocabulary, building it the
+    first time it is needed.
+    """
+
+    global _default_index
+
+    if _default_index is None:
+        vocabulary = get_move_vocabulary()
+        _default_index = MoveIndex(vocabulary.text_moves, vocabulary.voice_moves)
+    return _default_index
+
+
+if __name__ == "__main__":
+    """
+    Main function used only to try transcripts against the index
+    """
+
+    index = get_move_index()
+    while True:
+        transcript = input('Enter a transcript, or exit to quit: ')
+        if transcript.lower() in ('exit', 'quit'):
+            break
+        print('  ' + str(transcript_tokens(transcript)) + ' -> ' + str(index.resolve(transcript)))
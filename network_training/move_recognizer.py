@@ -0,0 +1,366 @@
+import os
+import statistics
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from pydub import AudioSegment
+
+from text_move_enumerator import get_move_vocabulary
+
+move_files_directory: str = 'move_files'
+model_file_path: str = 'move_recognizer_model.npz'
+
+# feature extraction parameters, at FEATURE_RATE: 25 ms frames with a 10 ms hop
+FEATURE_RATE = 16000
+FRAME_LENGTH = 400
+HOP_LENGTH = 160
+FFT_SIZE = 512
+NUM_MELS = 40
+NUM_SEGMENTS = 5
+
+
+def mel_filterbank(num_mels: int = NUM_MELS, fft_size: int = FFT_SIZE, sample_rate: int = FEATURE_RATE,
+                   min_frequency: float = 20.0, max_frequency: Optional[float] = None) -> np.ndarray:
+    """
+    Builds a matrix of triangular filters which maps a power spectrum onto
+    the mel scale.
+
+    Parameters
+        num_mels (int): the number of mel bands
+        fft_size (int): the size of the FFT the spectrum was computed with
+        sample_rate (int): the sample rate of the audio
+        min_frequency (float): the lower edge of the first band in Hz
+        max_frequency (float): the upper edge of the last band in Hz, or None
+            for the Nyquist frequency
+
+    Returns
+        np.ndarray: an array of shape (num_mels, fft_size // 2 + 1)
+    """
+
+    max_frequency = max_frequency or sample_rate / 2.0
+    to_mel = lambda hz: 2595.0 * np.log10(1.0 + hz / 700.0)
+    to_hz = lambda mel: 700.0 * (10.0 ** (mel / 2595.0) - 1.0)
+
+    edges = to_hz(np.linspace(to_mel(min_frequency), to_mel(max_frequency), num_mels + 2))
+    bins = np.fft.rfftfreq(fft_size, 1.0 / sample_rate)
+    lower, centre, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (bins - lower) / (centre - lower)
+    falling = (upper - bins) / (upper - centre)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+
+_filterbank = mel_filterbank()
+_window = np.hamming(FRAME_LENGTH).astype(np.float32)
+
+
+def log_mel_spectrogram(samples: np.ndarray) -> np.ndarray:
+    """
+    Computes the log-mel spectrogram of a mono signal sampled at FEATURE_RATE.
+
+    Parameters
+        samples (np.ndarray): the audio samples, on any scale
+
+    Returns
+        np.ndarray: an array of shape (frames, NUM_MELS)
+    """
+
+    samples = samples.astype(np.float32)
+    peak = np.abs(samples).max() if len(samples) else 0.0
+    if peak > 0:
+        samples = samples / peak
+    if len(samples) < FRAME_LENGTH:
+        samples = np.pad(samples, (0, FRAME_LENGTH - len(samples)))
+
+    # pre-emphasis boosts the high frequencies which carry consonants
+    samples = np.append(samples[0], samples[1:] - 0.97 * samples[:-1])
+
+    num_frames = 1 + (len(samples) - FRAME_LENGTH) // HOP_LENGTH
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_LENGTH)[::HOP_LENGTH][:num_frames]
+    power = np.abs(np.fft.rfft(frames * _window, FFT_SIZE)) ** 2
+    return np.log(power @ _filterbank.T + 1e-6)
+
+
+def utterance_features(samples: np.ndarray) -> np.ndarray:
+    """
+    Summarizes an utterance as a fixed length vector: the mean log-mel energy
+    over each of NUM_SEGMENTS equal stretches of time, followed by the
+    standard deviation over the whole utterance.
+
+    Parameters
+        samples (np.ndarray): mono audio samples at FEATURE_RATE
+
+    Returns
+        np.ndarray: a float32 vector of length NUM_MELS * (NUM_SEGMENTS + 1)
+    """
+
+    spectrogram = log_mel_spectrogram(samples)
+    # removing the mean per band cancels out differences between microphones
+    spectrogram = spectrogram - spectrogram.mean(axis=0)
+
+    if len(spectrogram) < NUM_SEGMENTS:
+        spectrogram = np.pad(spectrogram, ((0, NUM_SEGMENTS - len(spectrogram)), (0, 0)), mode='edge')
+    segments = [segment.mean(axis=0) for segment in np.array_split(spectrogram, NUM_SEGMENTS)]
+    return np.concatenate(segments + [spectrogram.std(axis=0)]).astype(np.float32)
+
+
+def load_clip(file_path: str) -> np.ndarray:
+    """
+    Reads an audio file of any format supported by pydub and converts it to
+    mono samples at FEATURE_RATE.
+
+    Parameters
+        file_path (str): the path of the audio file
+
+    Returns
+        np.ndarray: the int16 samples of the clip
+    """
+
+    audio = AudioSegment.from_file(file_path).set_channels(1).set_frame_rate(FEATURE_RATE).set_sample_width(2)
+    return np.frombuffer(audio.raw_data, dtype=np.int16)
+
+
+def list_dataset(dataset_dir: str = move_files_directory) -> List[Tuple[str, str]]:
+    """
+    Lists the labelled clips written by voice_data_generator, keeping only
+    directories named after an enumerated move.
+
+    Parameters
+        dataset_dir (str): the directory holding one subdirectory per move
+
+    Returns
+        [(str, str)]: (move, file path) pairs
+    """
+
+    vocabulary = get_move_vocabulary().id_by_text
+    clips = []
+    for move in sorted(os.listdir(dataset_dir)):
+        move_dir = os.path.join(dataset_dir, move)
+        if move not in vocabulary or not os.path.isdir(move_dir):
+            continue
+        for file_name in sorted(os.listdir(move_dir)):
+            clips.append((move, os.path.join(move_dir, file_name)))
+    return clips
+
+
+def dataset_clips(dataset_dir: str = move_files_directory) -> Iterator[Tuple[str, np.ndarray]]:
+    """
+    Yields every labelled clip of a dataset, read from its packed form if it
+    has been packed and decoded from the individual files otherwise.
+
+    Parameters
+        dataset_dir (str): the directory holding one subdirectory per move
+
+    Returns
+        (str, np.ndarray): (move, mono samples at FEATURE_RATE) pairs
+    """
+
+    # imported here since packed_dataset builds on this module
+    from packed_dataset import open_packed_dataset
+
+    packed = open_packed_dataset(dataset_dir)
+    if packed is not None:
+        for clip in packed:
+            yield clip.move, clip.samples
+    else:
+        for move, file_path in list_dataset(dataset_dir):
+            yield move, load_clip(file_path)
+
+
+class MoveRecognizer:
+    """
+    Offline recognizer for spoken chess moves. Each move in the vocabulary is
+    represented by the centroid of the standardized features of its training
+    clips, and an utterance is recognized as the move with the most similar
+    centroid.
+
+    Parameters
+        moves ([str]): the move of each centroid row
+        centroids (np.ndarray): unit length centroids of shape (moves, features)
+        feature_mean (np.ndarray): per feature mean of the training data
+        feature_std (np.ndarray): per feature standard deviation of the training data
+    """
+
+    def __init__(self, moves: List[str], centroids: np.ndarray, feature_mean: np.ndarray, feature_std: np.ndarray):
+        self.moves = list(moves)
+        self.move_indices: Dict[str, int] = {move: index for index, move in enumerate(self.moves)}
+        self.centroids = centroids
+        self.feature_mean = feature_mean
+        self.feature_std = feature_std
+
+    @classmethod
+    def train(cls, clips: Iterable[Tuple[str, np.ndarray]]) -> 'MoveRecognizer':
+        """
+        Fits a recognizer to labelled audio.
+
+        Parameters
+            clips ([(str, np.ndarray)]): (move, mono samples at FEATURE_RATE) pairs
+
+        Returns
+            MoveRecognizer: the trained recognizer
+        """
+
+        labels = []
+        features = []
+        for move, samples in clips:
+            labels.append(move)
+            features.append(utterance_features(samples))
+        return cls.fit(labels, np.stack(features))
+
+    @classmethod
+    def fit(cls, labels: List[str], features: np.ndarray) -> 'MoveRecognizer':
+        """
+        Fits a recognizer to precomputed utterance features.
+
+        Parameters
+            labels ([str]): the move of each row of features
+            features (np.ndarray): utterance_features of every clip, one row each
+
+        Returns
+            MoveRecognizer: the trained recognizer
+        """
+
+        features = features.astype(np.float32)
+        feature_mean = features.mean(axis=0)
+        feature_std = features.std(axis=0) + 1e-6
+        features = (features - feature_mean) / feature_std
+
+        moves = sorted(set(labels))
+        move_indices = {move: index for index, move in enumerate(moves)}
+        label_indices = np.array([move_indices[move] for move in labels])
+        centroids = np.zeros((len(moves), features.shape[1]), dtype=np.float32)
+        np.add.at(centroids, label_indices, features)
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-6
+
+        return cls(moves, centroids, feature_mean.astype(np.float32), feature_std.astype(np.float32))
+
+    @classmethod
+    def train_from_directory(cls, dataset_dir: str = move_files_directory) -> 'MoveRecognizer':
+        """
+        Fits a recognizer to the clips generated by voice_data_generator,
+        taking their features from the dataset's feature cache so that only
+        clips added since the last run are decoded.
+
+        Parameters
+            dataset_dir (str): the directory holding one subdirectory per move
+
+        Returns
+            MoveRecognizer: the trained recognizer
+        """
+
+        # imported here since feature_cache builds on this module
+        from feature_cache import FeatureCache, FeatureConfig
+
+        labels = []
+        features = []
+        for move, clip_features in FeatureCache(dataset_dir, FeatureConfig('utterance')).dataset_features():
+            labels.append(move)
+            features.append(clip_features[0])
+        return cls.fit(labels, np.stack(features))
+
+    def save(self, file_path: str = model_file_path):
+        """
+        Writes the recognizer to a compressed numpy archive.
+
+        Parameters
+            file_path (str): the path of the file to write
+        """
+
+        np.savez_compressed(file_path, moves=np.array(self.moves), centroids=self.centroids,
+                            feature_mean=self.feature_mean, feature_std=self.feature_std)
+
+    @classmethod
+    def load(cls, file_path: str = model_file_path) -> 'MoveRecognizer':
+        """
+        Reads a recognizer written by save.
+
+        Parameters
+            file_path (str): the path of the file to read
+
+        Returns
+            MoveRecognizer: the stored recognizer
+        """
+
+        with np.load(file_path) as archive:
+            return cls(archive['moves'].tolist(), archive['centroids'], archive['feature_mean'], archive['feature_std'])
+
+    def score(self, samples: np.ndarray, candidates: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        """
+        Scores an utterance against every move, or only against the provided
+        candidate moves.
+
+        Parameters
+            samples (np.ndarray): mono audio samples at FEATURE_RATE
+            candidates ([str]): the moves to consider, or None for the whole vocabulary
+
+        Returns
+            {str: float}: the cosine similarity of the utterance to each move
+        """
+
+        features = (utterance_features(samples) - self.feature_mean) / self.feature_std
+        features /= np.linalg.norm(features) + 1e-6
+
+        if candidates is None:
+            moves = self.moves
+            similarities = self.centroids @ features
+        else:
+            moves = [move for move in candidates if move in self.move_indices]
+            similarities = self.centroids[[self.move_indices[move] for move in moves]] @ features
+        return dict(zip(moves, similarities.tolist()))
+
+    def recognize(self, samples: np.ndarray, candidates: Optional[Iterable[str]] = None) -> Tuple[Optional[str], float]:
+        """
+        Returns the move most similar to an utterance.
+
+        Parameters
+            samples (np.ndarray): mono audio samples at FEATURE_RATE
+            candidates ([str]): the moves to consider, or None for the whole vocabulary
+
+        Returns
+            (str, float): the recognized move and its similarity, or (None, 0.0)
+                if none of the candidates are known
+        """
+
+        scores = self.score(samples, candidates)
+        if len(scores) == 0:
+            return None, 0.0
+        move = max(scores, key=scores.get)
+        return move, scores[move]
+
+
+if __name__ == "__main__":
+    """
+    Trains a recognizer on the generated dataset, reports its accuracy and
+    latency on one held out clip per move, then retrains on every clip and
+    saves the model. Pass the dataset directory as the first argument.
+    """
+
+    dataset_dir = sys.argv[1] if len(sys.argv) > 1 else move_files_directory
+    clips = list(dataset_clips(dataset_dir))
+    print('Loaded ' + str(len(clips)) + ' clips.')
+
+    # hold out the last clip of every move with more than one clip
+    held_out_indices = {}
+    for index, (move, _) in enumerate(clips):
+        held_out_indices[move] = index
+    counts = {}
+    for move, _ in clips:
+        counts[move] = counts.get(move, 0) + 1
+    held_out = {index for move, index in held_out_indices.items() if counts[move] > 1}
+
+    if len(held_out) > 0:
+        recognizer = MoveRecognizer.train(clip for index, clip in enumerate(clips) if index not in held_out)
+        latencies = []
+        correct = 0
+        for index in held_out:
+            move, samples = clips[index]
+            start = time.perf_counter()
+            recognized, _ = recognizer.recognize(samples)
+            latencies.append(time.perf_counter() - start)
+            correct += recognized == move
+        print('Held out accuracy: ' + str(correct) + '/' + str(len(held_out)))
+        print('Median latency: %.1f ms' % (1000 * statistics.median(latencies)))
+
+    MoveRecognizer.train(clips).save(model_file_path)
+    print('Saved model to ' + model_file_path)
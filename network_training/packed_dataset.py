@@ -0,0 +1,270 @@
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from move_recognizer import FEATURE_RATE, list_dataset, load_clip, move_files_directory
+from text_move_enumerator import get_move_vocabulary
+
+PACKED_VERSION: int = 1
+packed_directory_name: str = 'packed'
+header_file_name: str = 'header.json'
+index_file_name: str = 'index.npy'
+params_file_name: str = 'params.json'
+SHARD_BYTES: int = 256 * 1024 * 1024
+
+# one row per clip; offsets and lengths count int16 samples
+INDEX_DTYPE = np.dtype([('move_id', '<i8'), ('params_id', '<i4'), ('shard', '<i4'),
+                        ('offset', '<i8'), ('length', '<i8')])
+
+
+def shard_file_name(shard: int) -> str:
+    return 'shard-%05d.pcm' % shard
+
+
+class PackedClip(NamedTuple):
+    """
+    A clip read from a packed dataset.
+
+    Fields
+        move (str): the move in algebraic notation
+        params (str): the generator parameters, the original file name stem
+        samples (np.ndarray): read-only int16 mono samples at FEATURE_RATE
+    """
+
+    move: str
+    params: str
+    samples: np.ndarray
+
+
+class PackedDatasetWriter:
+    """
+    Appends clips to large shard files of raw 16 bit mono PCM at FEATURE_RATE
+    and writes the index when closed. A shard is started whenever the current
+    one would grow beyond shard_bytes.
+
+    Parameters
+        output_dir (str): the directory to write the packed dataset to
+        shard_bytes (int): the size at which a new shard is started
+    """
+
+    def __init__(self, output_dir: str, shard_bytes: int = SHARD_BYTES):
+        self.output_dir = output_dir
+        self.shard_bytes = shard_bytes
+        self.rows: List[Tuple[int, int, int, int, int]] = []
+        self.params_ids: Dict[str, int] = {}
+        self.shard = 0
+        self.shard_samples = 0
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.shard_file = open(os.path.join(output_dir, shard_file_name(self.shard)), 'wb')
+
+    def add(self, move_id: int, params: str, samples: np.ndarray):
+        """
+        Appends a clip.
+
+        Parameters
+            move_id (int): the vocabulary ID of the move
+            params (str): the generator parameters of the clip
+            samples (np.ndarray): int16 mono samples at FEATURE_RATE
+        """
+
+        samples = np.ascontiguousarray(samples, dtype='<i2')
+        if self.shard_samples > 0 and 2 * (self.shard_samples + len(samples)) > self.shard_bytes:
+            self.shard_file.close()
+            self.shard += 1
+            self.shard_samples = 0
+            self.shard_file = open(os.path.join(self.output_dir, shard_file_name(self.shard)), 'wb')
+
+        params_id = self.params_ids.setdefault(params, len(self.params_ids))
+        self.rows.append((move_id, params_id, self.shard, self.shard_samples, len(samples)))
+        self.shard_file.write(samples.tobytes())
+        self.shard_samples += len(samples)
+
+    def close(self):
+        """
+        Finishes the last shard and writes the index, sorted by move and
+        parameters so that clips of a move can be found by binary search.
+        """
+
+        self.shard_file.close()
+        index = np.array(self.rows, dtype=INDEX_DTYPE)
+        index = index[np.lexsort((index['params_id'], index['move_id']))]
+        np.save(os.path.join(self.output_dir, index_file_name), index)
+
+        params = sorted(self.params_ids, key=self.params_ids.get)
+        with open(os.path.join(self.output_dir, params_file_name), 'w') as file:
+            json.dump(params, file)
+        with open(os.path.join(self.output_dir, header_file_name), 'w') as file:
+            json.dump({'version': PACKED_VERSION, 'sample_rate': FEATURE_RATE, 'sample_width': 2,
+                       'channels': 1, 'clips': len(index), 'shards': self.shard + 1,
+                       'vocabulary_version': get_move_vocabulary().version}, file)
+
+    def __enter__(self) -> 'PackedDatasetWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PackedDataset:
+    """
+    Reader for a packed dataset. The index and the shards are memory-mapped,
+    so opening is instant and a clip is read without copying or decoding.
+
+    Parameters
+        directory (str): the directory written by PackedDatasetWriter
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, header_file_name)) as file:
+            self.header = json.load(file)
+        if self.header['version'] != PACKED_VERSION:
+            raise ValueError('Packed dataset ' + directory + ' has version ' + str(self.header['version']) +
+                             ', expected ' + str(PACKED_VERSION))
+        with open(os.path.join(directory, params_file_name)) as file:
+            self.params: List[str] = json.load(file)
+        self.index = np.load(os.path.join(directory, index_file_name), mmap_mode='r')
+        self.vocabulary = get_move_vocabulary()
+        self.shards: Dict[int, np.memmap] = {}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _shard(self, shard: int) -> np.ndarray:
+        if shard not in self.shards:
+            path = os.path.join(self.directory, shard_file_name(shard))
+            self.shards[shard] = np.memmap(path, dtype='<i2', mode='r') if os.path.getsize(path) else \
+                np.zeros(0, dtype='<i2')
+        return self.shards[shard]
+
+    def __getitem__(self, position: int) -> PackedClip:
+        row = self.index[position]
+        samples = self._shard(int(row['shard']))[row['offset']:row['offset'] + row['length']]
+        return PackedClip(self.vocabulary.text(int(row['move_id'])), self.params[row['params_id']], samples)
+
+    def __iter__(self) -> Iterator[PackedClip]:
+        for position in range(len(self)):
+            yield self[position]
+
+    def positions_for_move(self, move: str) -> range:
+        """
+        Returns the index positions of every clip of a move.
+        """
+
+        move_id = self.vocabulary.id_by_text.get(move)
+        if move_id is None:
+            return range(0)
+        move_ids = self.index['move_id']
+        return range(int(np.searchsorted(move_ids, move_id, 'left')), int(np.searchsorted(move_ids, move_id, 'right')))
+
+    def positions_for_params(self, pattern: str) -> np.ndarray:
+        """
+        Returns the index positions of every clip whose generator parameters
+        contain pattern, e.g. '-rate-200' or 'pitch-0'.
+        """
+
+        params_ids = [params_id for params_id, params in enumerate(self.params) if pattern in params]
+        return np.flatnonzero(np.isin(self.index['params_id'], params_ids))
+
+    def moves(self) -> List[str]:
+        return [self.vocabulary.text(int(move_id)) for move_id in np.unique(self.index['move_id'])]
+
+
+def packed_directory(dataset_dir: str = move_files_directory) -> str:
+    return os.path.join(dataset_dir, packed_directory_name)
+
+
+def open_packed_dataset(dataset_dir: str = move_files_directory) -> Optional[PackedDataset]:
+    """
+    Returns the packed form of a dataset directory, or None if it has not
+    been packed.
+    """
+
+    directory = packed_directory(dataset_dir)
+    return PackedDataset(directory) if os.path.exists(os.path.join(directory, header_file_name)) else None
+
+
+def pack_directory(dataset_dir: str = move_files_directory, remove_source: bool = False,
+                   shard_bytes: int = SHARD_BYTES) -> PackedDataset:
+    """
+    Converts a move_files tree into a packed dataset stored inside it. Every
+    clip is decoded once to 16 bit mono PCM at FEATURE_RATE. Clips of an
+    existing pack are carried over into the new one, unless a clip file with
+    the same move and parameters replaces them, so packing again after the
+    sources were removed never loses clips. The pack is written to a
+    temporary directory and only moved into place once it is complete, after
+    which the source clips are optionally deleted. The
+    generators only treat clips which still exist as finished, so sources
+    should only be removed once generation is complete.
+
+    Parameters
+        dataset_dir (str): the directory holding one subdirectory per move
+        remove_source (bool): delete the clip files once they are packed
+        shard_bytes (int): the size at which a new shard is started
+
+    Returns
+        PackedDataset: the packed dataset
+    """
+
+    vocabulary = get_move_vocabulary()
+    clips = list_dataset(dataset_dir)
+    existing = open_packed_dataset(dataset_dir)
+    if existing is not None and not clips:
+        print('No clip files to add to the existing pack')
+        return existing
+
+    staging_dir = packed_directory(dataset_dir) + '.partial'
+    if os.path.exists(staging_dir):
+        shutil.rmtree(staging_dir)
+
+    with PackedDatasetWriter(staging_dir, shard_bytes) as writer:
+        if existing is not None:
+            replaced = {(move, os.path.splitext(os.path.basename(file_path))[0]) for move, file_path in clips}
+            carried = 0
+            for clip in existing:
+                if (clip.move, clip.params) not in replaced:
+                    writer.add(vocabulary.id_by_text[clip.move], clip.params, clip.samples)
+                    carried += 1
+            print('Carried over ' + str(carried) + ' clips from the existing pack')
+        for count, (move, file_path) in enumerate(clips, 1):
+            params = os.path.splitext(os.path.basename(file_path))[0]
+            writer.add(vocabulary.id_by_text[move], params, load_clip(file_path))
+            if count % 1000 == 0:
+                print('Packed ' + str(count) + '/' + str(len(clips)) + ' clips')
+
+    final_dir = packed_directory(dataset_dir)
+    if os.path.exists(final_dir):
+        shutil.rmtree(final_dir)
+    os.rename(staging_dir, final_dir)
+
+    if remove_source:
+        for _, file_path in clips:
+            os.remove(file_path)
+        for move in {move for move, _ in clips}:
+            move_dir = os.path.join(dataset_dir, move)
+            if not os.listdir(move_dir):
+                os.rmdir(move_dir)
+    return PackedDataset(final_dir)
+
+
+if __name__ == "__main__":
+    """
+    Packs the dataset directory given as the first argument, or move_files.
+    Pass --remove-source to delete the individual clips afterwards.
+    """
+
+    dataset_dir = next((argument for argument in sys.argv[1:] if not argument.startswith('--')), move_files_directory)
+    start = time.perf_counter()
+    dataset = pack_directory(dataset_dir, remove_source='--remove-source' in sys.argv)
+    print('Packed ' + str(len(dataset)) + ' clips into ' + str(dataset.header['shards']) + ' shards in %.1f s'
+          % (time.perf_counter() - start))
+
+    start = time.perf_counter()
+    total = sum(len(clip.samples) for clip in dataset)
+    print('Read every clip back in %.3f s, %.1f s of audio' % (time.perf_counter() - start, total / FEATURE_RATE))
@@ -0,0 +1,188 @@
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Set
+
+manifest_file_name: str = 'manifest.sqlite'
+cache_directory_name: str = '.synthesis_cache'
+
+
+def synthesis_key(engine: str, text: str, **parameters) -> str:
+    """
+    Returns the content address of a synthesis: a hash of the engine, the
+    spoken text and every parameter affecting the audio, such as voice, rate,
+    tld or pitch. Equal keys always describe identical audio.
+
+    Parameters
+        engine (str): the TTS engine, e.g. 'pyttsx3', 'gtts' or 'polly'
+        text (str): the spoken text
+        parameters: the engine and augmentation parameters
+
+    Returns
+        str: a hex digest
+    """
+
+    content = json.dumps({'engine': engine, 'text': text, 'parameters': parameters}, sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class SynthesisManifest:
+    """
+    Record of the finished work of the dataset generators, kept in an SQLite
+    database next to the dataset so that an interrupted run resumes where it
+    stopped. Two things are recorded:
+    - outputs: every dataset file written, under the key of the audio it holds
+    - renders: raw TTS output kept in a content-addressed cache, so changing
+      only the augmentation of a render does not repeat the TTS call
+
+    Every process should open its own manifest. Each record is committed as
+    soon as it is written, so no process holds the database's write lock
+    while it renders; records written together can be grouped into one short
+    transaction with transaction().
+
+    Parameters
+        dataset_dir (str): the dataset directory holding the manifest and cache
+    """
+
+    def __init__(self, dataset_dir: str):
+        self.dataset_dir = dataset_dir
+        self.cache_dir = os.path.join(dataset_dir, cache_directory_name)
+        self.lock = threading.RLock()
+
+        os.makedirs(dataset_dir, exist_ok=True)
+        # in autocommit mode sqlite3 never opens a transaction implicitly
+        self.connection = sqlite3.connect(os.path.join(dataset_dir, manifest_file_name), timeout=60.0,
+                                          check_same_thread=False, isolation_level=None)
+        # write ahead logging lets several worker processes write concurrently
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS outputs (key TEXT PRIMARY KEY, render_key TEXT, '
+                                'file_path TEXT NOT NULL, parameters TEXT, created REAL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS renders (key TEXT PRIMARY KEY, engine TEXT, '
+                                'text TEXT, parameters TEXT, cache_path TEXT NOT NULL, created REAL)')
+        # outputs removed on purpose, such as pruned duplicates, stay finished
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(outputs)')]
+        if 'pruned' not in columns:
+            self.connection.execute('ALTER TABLE outputs ADD COLUMN pruned INTEGER NOT NULL DEFAULT 0')
+
+    def is_done(self, key: str) -> bool:
+        """
+        Returns whether the output with this key has been written.
+        """
+
+        with self.lock:
+            row = self.connection.execute('SELECT file_path, pruned FROM outputs WHERE key = ?', (key,)).fetchone()
+        return row is not None and (bool(row[1]) or os.path.exists(os.path.join(self.dataset_dir, row[0])))
+
+    def done_keys(self, keys: Iterable[str]) -> Set[str]:
+        """
+        Returns the subset of keys whose outputs have been written.
+        """
+
+        keys = list(keys)
+        done = set()
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self.connection.execute('SELECT key, file_path, pruned FROM outputs WHERE key IN (' +
+                                               ','.join('?' * len(batch)) + ')', batch).fetchall()
+                done.update(key for key, file_path, pruned in rows
+                            if pruned or os.path.exists(os.path.join(self.dataset_dir, file_path)))
+        return done
+
+    def record_output(self, key: str, file_path: str, render_key: Optional[str] = None,
+                      parameters: Optional[Dict] = None):
+        """
+        Records that a dataset file has been written.
+
+        Parameters
+            key (str): the synthesis key of the file's audio
+            file_path (str): the path of the file
+            render_key (str): the key of the cached render it was derived from
+            parameters (dict): the parameters the key was computed from
+        """
+
+        self._write('INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, 0)',
+                    (key, render_key, os.path.relpath(file_path, self.dataset_dir),
+                     json.dumps(parameters, sort_keys=True), time.time()))
+
+    def move_output(self, file_path: str, new_file_path: str):
+        """
+        Records that a dataset file has been moved or re-encoded to a new path.
+        """
+
+        self._write('UPDATE outputs SET file_path = ? WHERE file_path = ?',
+                    (os.path.relpath(new_file_path, self.dataset_dir), os.path.relpath(file_path, self.dataset_dir)))
+
+    def mark_pruned(self, file_path: str):
+        """
+        Records that a dataset file was deliberately deleted, so generators
+        treat it as finished rather than rendering it again.
+        """
+
+        self._write('UPDATE outputs SET pruned = 1 WHERE file_path = ?',
+                    (os.path.relpath(file_path, self.dataset_dir),))
+
+    def cache_path(self, render_key: str, extension: str = 'wav') -> str:
+        """
+        Returns where the raw render with this key is kept.
+        """
+
+        return os.path.join(self.cache_dir, render_key[:2], render_key + '.' + extension)
+
+    def cached_render(self, render_key: str) -> Optional[str]:
+        """
+        Returns the path of the cached raw render with this key, or None if
+        it has not been rendered.
+        """
+
+        with self.lock:
+            row = self.connection.execute('SELECT cache_path FROM renders WHERE key = ?', (render_key,)).fetchone()
+        if row is None:
+            return None
+        path = os.path.join(self.dataset_dir, row[0])
+        return path if os.path.exists(path) else None
+
+    def record_render(self, render_key: str, engine: str, text: str, cache_path: str,
+                      parameters: Optional[Dict] = None):
+        """
+        Records that a raw render has been stored at cache_path.
+        """
+
+        self._write('INSERT OR REPLACE INTO renders VALUES (?, ?, ?, ?, ?, ?)',
+                    (render_key, engine, text, json.dumps(parameters, sort_keys=True),
+                     os.path.relpath(cache_path, self.dataset_dir), time.time()))
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups the records written in the block into a single commit. The
+        write lock is held until the block ends, so the block should only
+        write records, never render.
+        """
+
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+
+    def _write(self, statement: str, values: tuple):
+        with self.lock:
+            self.connection.execute(statement, values)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> 'SynthesisManifest':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
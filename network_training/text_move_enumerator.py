@@ -1,222 +1,452 @@
-from typing import List
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import gzip
+import hashlib
+import json
 import os
+import sys
+
+# the vocabulary artifact is rebuilt whenever the enumeration changes; bump
+# the version with any change to the grammar or the spoken forms
+VOCABULARY_VERSION: int = 2
+vocabulary_file_path: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'move_vocabulary.json.gz')
+
+# -- Move grammar --
+# a move is [piece] [origin] ['x'] target ['=' promotion] [suffix], or castling;
+# 'P' stands for the pawn, which has no letter in algebraic notation
+FILES: str = 'abcdefgh'
+RANKS: str = '12345678'
+MOVE_PIECES: Tuple[str, ...] = ('P', 'N', 'B', 'R', 'Q', 'K')
+MOVE_TYPES: Tuple[str, ...] = ('move', 'capture', 'promotion', 'castle')
+PROMOTION_PIECES: Tuple[str, ...] = ('', 'N', 'B', 'R', 'Q')
+MOVE_SUFFIXES: Tuple[str, ...] = ('', '+', '#')
+PIECE_NAMES: Dict[str, str] = {'K': 'King', 'Q': 'Queen', 'R': 'Rook', 'B': 'Bishop', 'N': 'Knight'}
+SUFFIX_NAMES: Dict[str, str] = {'+': 'check', '#': 'checkmate'}
+
+# the layout of move IDs is fixed so that saved datasets and models stay
+# valid; new pieces or fields may only be added after the existing ones
+ID_PIECES: Tuple[str, ...] = MOVE_PIECES + ('O',)
+ORIGIN_CODES: int = 1 + 8 + 8 + 64
+
+# spoken words and the algebraic notation they stand for
+SPOKEN_SYMBOLS: Dict[str, str] = {
+    'King': 'K', 'Queen': 'Q', 'Rook': 'R', 'Bishop': 'B', 'Knight': 'N',
+    'takes': 'x', 'captures': 'x', '=': '=', 'promotes to': '=', 'check': '+', 'checkmate': '#',
+}
+SPOKEN_CASTLES: Dict[str, str] = {'long castle': 'O-O-O', 'short castle': 'O-O',
+                                  'castles queenside': 'O-O-O', 'castles kingside': 'O-O'}
+
+
+class MoveEntry(NamedTuple):
+    """
+    A single move of the grammar.
+
+    Fields:
+    - move_id (int): the stable ID of the move.
+    - text (str): the move in standard algebraic notation.
+    - voices (str): ways of speaking the move, the first being the default.
+    """
+
+    move_id: int
+    text: str
+    voices: Tuple[str, ...]
 
-def run_move_checker(all_moves_list: List[str]) -> None:
+
+def run_move_checker(vocabulary: 'MoveVocabulary') -> None:
     """
-    Allows for checking whether entered moves are present in the provided list.
+    Allows for checking whether entered moves are present in the provided vocabulary.
     
-    Parametrs:
-    - all_moves_list [str]: A list of strings with all possible chess moves.
+    Parameters:
+    - vocabulary (MoveVocabulary): the enumerated chess moves.
     """
 
     while True:
         print('Enter a move in algebraic notation to see if it\'s included, or enter exit to quit.')
         move = input('  Enter move: ')
-        if move.lower == 'exit' or move.lower == 'quit':
+        if move.lower() == 'exit' or move.lower() == 'quit':
             break
-        elif move in all_moves_list is True:
-            print(move + ' is included in the list of moves.')
+        elif move in vocabulary.id_by_text:
+            print(move + ' is included in the list of moves, spoken as \'' + vocabulary.to_voice(move) + '\'.')
         else:
             print('Nice catch! ' + move + ' is not included in the list of moves.')
 
 
-def get_all_text_moves() -> List[str]:
-    """
-    Creates a list of strings representing all possible chess moves
-    in standard algebraic notation.
-    
-    Returns:
-    [str]: A list of strings with all possible chess moves.
-    """
-
-    pieces = ['K', 'Q', 'R', 'B', 'K']
-    ranks = ['1', '2', '3', '4', '5', '6', '7', '8']
-    files = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+def square_name(square: int) -> str:
+    return FILES[square % 8] + RANKS[square // 8]
 
-    all_moves_list = []
 
-    # movement moves
-    for rank in ranks:
-        for file in files:
+def _reachable_from(piece: str, target: int) -> List[int]:
+    """
+    Returns the squares from which a piece could move to the target square
+    on an otherwise empty board.
+    """
 
-            # piece moves
-            for piece in pieces:
-                move = piece + file + rank
-                all_moves_list.append(move)
+    file, rank = target % 8, target // 8
+    if piece == 'N':
+        steps, sliding = [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)], False
+    elif piece == 'K':
+        steps, sliding = [(df, dr) for df in (-1, 0, 1) for dr in (-1, 0, 1) if df or dr], False
+    else:
+        steps, sliding = {'B': [(1, 1), (1, -1), (-1, 1), (-1, -1)],
+                          'R': [(1, 0), (-1, 0), (0, 1), (0, -1)],
+                          'Q': [(1, 1), (1, -1), (-1, 1), (-1, -1), (1, 0), (-1, 0), (0, 1), (0, -1)]}[piece], True
+
+    sources = []
+    for df, dr in steps:
+        f, r = file + df, rank + dr
+        while 0 <= f < 8 and 0 <= r < 8:
+            sources.append(r * 8 + f)
+            if not sliding:
+                break
+            f, r = f + df, r + dr
+    return sorted(sources)
+
+
+def encode_move_id(piece: str, capture: bool, origin: int, target: int, promotion: str, suffix: str) -> int:
+    """
+    Packs the fields of a move into its integer ID. The ID depends only on
+    the fields, never on the order of enumeration, so moves keep their IDs
+    when the grammar grows.
+
+    Parameters:
+    - piece (str): one of MOVE_PIECES, or 'O' for castling.
+    - capture (bool): whether the move captures.
+    - origin (int): 0 for none, 1-8 for a file, 9-16 for a rank and 17-80 for
+        a square disambiguating the moving piece, or 0/1 for short/long castling.
+    - target (int): the destination square, a1 = 0 to h8 = 63.
+    - promotion (str): one of PROMOTION_PIECES.
+    - suffix (str): one of MOVE_SUFFIXES.
 
-            # pawn moves
-            if rank != '1' and rank != '8':
-                all_moves_list.append(file + rank)
+    Returns:
+    int: the move ID.
+    """
 
-    # captures
-    for rank in ranks:
-        for file in files:
+    move_id = ID_PIECES.index(piece)
+    move_id = move_id * 2 + int(capture)
+    move_id = move_id * ORIGIN_CODES + origin
+    move_id = move_id * 64 + target
+    move_id = move_id * len(PROMOTION_PIECES) + PROMOTION_PIECES.index(promotion)
+    return move_id * len(MOVE_SUFFIXES) + MOVE_SUFFIXES.index(suffix)
+
+
+def _origin_text(origin: int) -> str:
+    if origin == 0:
+        return ''
+    if origin <= 8:
+        return FILES[origin - 1]
+    if origin <= 16:
+        return RANKS[origin - 9]
+    return square_name(origin - 17)
+
+
+def _spoken_square(square_text: str) -> str:
+    # lowercase A is interpreted as the word 'a' by tts, so files are capitalized
+    return square_text.upper()
+
+
+def _move_entry(piece: str, origin: int, capture: bool, target: int, promotion: str, suffix: str) -> 'MoveEntry':
+    move_id = encode_move_id(piece, capture, origin, target, promotion, suffix)
+    if piece == 'O':
+        castle = ('O-O', 'O-O-O')[origin]
+        text = castle + suffix
+        voices = [[('short castle', 'long castle')[origin]], [('castles kingside', 'castles queenside')[origin]]]
+    else:
+        text = ('' if piece == 'P' else piece) + _origin_text(origin) + ('x' if capture else '') + \
+            square_name(target) + ('=' + promotion if promotion else '') + suffix
+        words = [] if piece == 'P' else [PIECE_NAMES[piece]]
+        if origin:
+            words.append(_spoken_square(_origin_text(origin)))
+        voices = [words + ['takes'], words + ['captures']] if capture else [list(words)]
+        for voice in voices:
+            voice.append(_spoken_square(square_name(target)))
+        if promotion:
+            voices = [voice + ending for voice in voices
+                      for ending in (['=', PIECE_NAMES[promotion]], ['promotes to', PIECE_NAMES[promotion]])]
+    if suffix:
+        voices = [voice + [SUFFIX_NAMES[suffix]] for voice in voices]
+    return MoveEntry(move_id, text, tuple(' '.join(voice) for voice in voices))
+
+
+def _piece_moves(piece: str, capture: bool) -> Iterator[Tuple[int, int]]:
+    # (origin, target) pairs; a disambiguating file, rank or square is only
+    # produced if the piece could come from there
+    for target in range(64):
+        yield 0, target
+        if piece in ('K', 'P'):
+            continue
+        sources = _reachable_from(piece, target)
+        for file in sorted(set(source % 8 for source in sources)):
+            yield 1 + file, target
+        for rank in sorted(set(source // 8 for source in sources)):
+            yield 9 + rank, target
+        for source in sources:
+            yield 17 + source, target
+
+
+def _pawn_moves(capture: bool) -> Iterator[Tuple[int, int]]:
+    # moves onto the first and last rank are promotions
+    for target in range(64):
+        if not capture:
+            yield 0, target
+            continue
+        for file in (target % 8 - 1, target % 8 + 1):
+            if 0 <= file < 8:
+                yield 1 + file, target
+
+
+def generate_moves(pieces: Optional[Iterable[str]] = None, move_types: Optional[Iterable[str]] = None,
+                   suffixes: Optional[Iterable[str]] = None) -> Iterator['MoveEntry']:
+    """
+    Lazily yields every move described by the move grammar, in increasing ID
+    order. Moves are produced one at a time so slices of the grammar can be
+    taken without building the whole vocabulary.
+
+    Parameters:
+    - pieces [str]: only yield moves of these pieces, from MOVE_PIECES, with
+        castling counted as a king move. All pieces if None.
+    - move_types [str]: only yield these kinds of move, from MOVE_TYPES. All
+        kinds if None.
+    - suffixes [str]: only yield moves with these suffixes, from MOVE_SUFFIXES.
+        All suffixes if None.
 
-            # piece captures
-            for piece in pieces:
-                all_moves_list.append(piece + 'x' + file + rank)
+    Returns:
+    MoveEntry: (move ID, algebraic notation, spoken variants) for every move.
+    """
 
-            # pawn captures
-            if rank != '1' and rank != '8':
-                if file == 'a':
-                    white_move = file + 'xb' + str(int(rank) + 1)
-                    black_move = file + 'xb' + str(int(rank) - 1)
-                    all_moves_list.extend([white_move, black_move])
-                elif file == 'h':
-                    white_move = file + 'xg' + str(int(rank) + 1)
-                    black_move = file + 'xg' + str(int(rank) - 1)
-                    all_moves_list.extend([white_move, black_move])
+    pieces = set(MOVE_PIECES if pieces is None else pieces)
+    move_types = set(MOVE_TYPES if move_types is None else move_types)
+    suffixes = [suffix for suffix in MOVE_SUFFIXES if suffixes is None or suffix in suffixes]
+
+    for piece in ID_PIECES:
+        if piece == 'O':
+            if 'K' in pieces and 'castle' in move_types:
+                for origin in (0, 1):
+                    for suffix in suffixes:
+                        yield _move_entry('O', origin, False, 0, '', suffix)
+            continue
+        if piece not in pieces:
+            continue
+
+        for capture in (False, True):
+            squares = _pawn_moves(capture) if piece == 'P' else _piece_moves(piece, capture)
+            for origin, target in sorted(squares):
+                if piece == 'P' and target // 8 in (0, 7):
+                    promotions = PROMOTION_PIECES[1:] if 'promotion' in move_types else ()
                 else:
-                    file_index = files.index(file)
-                    white_move_1 = file + 'x' + files[file_index + 1] + str(int(rank) + 1)
-                    white_move_2 = file + 'x' + files[file_index - 1] + str(int(rank) + 1)
-                    black_move_1 = file + 'x' + files[file_index + 1] + str(int(rank) - 1)
-                    black_move_2 = file + 'x' + files[file_index - 1] + str(int(rank) - 1)
-                    all_moves_list.extend([white_move_1, white_move_2, black_move_1, black_move_2])
-
-    # promotions
-    for piece in pieces:
-        for file in files:
-            if piece != 'K':
-
-                # peaceful promotions
-                white_promotion = file + '8=' + piece
-                black_promotion = file + '1=' + piece
-
-                all_moves_list.extend([white_promotion, black_promotion])
-
-                # capture promotions
-                if file == 'a':
-                    white_move = file + 'xb8=' + piece
-                    black_move = file + 'xb1=' + piece
-                    all_moves_list.extend([white_move, black_move])
-                elif file == 'h':
-                    white_move = file + 'xg8=' + piece
-                    black_move = file + 'xg1=' + piece
-                    all_moves_list.extend([white_move, black_move])
-                else:
-                    file_index = files.index(file)
-                    white_move_1 = file + 'x' + files[file_index + 1] + '8=' + piece
-                    white_move_2 = file + 'x' + files[file_index - 1] + '8=' + piece
-                    black_move_1 = file + 'x' + files[file_index + 1] + '1=' + piece
-                    black_move_2 = file + 'x' + files[file_index - 1] + '1=' + piece
-                    all_moves_list.extend([white_move_1, white_move_2, black_move_1, black_move_2])
+                    promotions = ('',) if ('capture' if capture else 'move') in move_types else ()
+                for promotion in promotions:
+                    for suffix in suffixes:
+                        yield _move_entry(piece, origin, capture, target, promotion, suffix)
 
-    # castling
-    all_moves_list.append('O-O')
-    all_moves_list.append('O-O-O')
 
-    # as any move can be a check, create a duplicate of every move
-    # with the addition of a check
-    all_moves_list.extend([move + '+' for move in all_moves_list])
+def get_all_text_moves() -> List[str]:
+    """
+    Creates a list of strings representing all possible chess moves
+    in standard algebraic notation.
+    
+    Returns:
+    [str]: A list of strings with all possible chess moves.
+    """
 
-    return all_moves_list
+    return [entry.text for entry in generate_moves()]
 
 def get_all_voice_moves() -> List[str]:
     """
     Creates a list of strings representing all possible chess moves
     in the form in which they would be spoken, suitable for use with
     a TTS engine. For example, 'Kxe4' would be stored as 'King takes
-    e4'.
+    E4'.
     
     Returns:
     [str]: A list of strings with all possible chess moves.
     """
 
-    # lowercase A is interpreted as the word 'a' by tts, so all files need
-    # to be capitalized before starting
-    pieces = ['King', 'Queen', 'Rook', 'Bishop', 'Knight']
-    ranks = ['1', '2', '3', '4', '5', '6', '7', '8']
-    files = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
-
-    all_moves_list = []
-
-    # movement moves
-    for rank in ranks:
-        for file in files:
-
-            # piece moves
-            for piece in pieces:
-                move = piece + ' ' + file + rank
-                all_moves_list.append(move)
-
-            # pawn moves
-            if rank != '1' and rank != '8':
-                all_moves_list.append(file + rank)
-
-    # captures
-    for rank in ranks:
-        for file in files:
-
-            # piece captures
-            for piece in pieces:
-                all_moves_list.append(piece + ' takes ' + file + rank)
-
-            # pawn captures
-            if rank != '1' and rank != '8':
-                if file == 'A':
-                    white_move = file + ' takes b' + str(int(rank) + 1)
-                    black_move = file + ' takes b' + str(int(rank) - 1)
-                    all_moves_list.extend([white_move, black_move])
-                elif file == 'H':
-                    white_move = file + ' takes g' + str(int(rank) + 1)
-                    black_move = file + ' takes g' + str(int(rank) - 1)
-                    all_moves_list.extend([white_move, black_move])
-                else:
-                    file_index = files.index(file)
-                    white_move_1 = file + ' takes ' + files[file_index + 1] + str(int(rank) + 1)
-                    white_move_2 = file + ' takes ' + files[file_index - 1] + str(int(rank) + 1)
-                    black_move_1 = file + ' takes ' + files[file_index + 1] + str(int(rank) - 1)
-                    black_move_2 = file + ' takes ' + files[file_index - 1] + str(int(rank) - 1)
-                    all_moves_list.extend([white_move_1, white_move_2, black_move_1, black_move_2])
-
-    # promotions
-    for piece in pieces:
-        for file in files:
-            if piece != 'King':
-
-                # peaceful promotions
-                white_promotion = file + '8 = ' + piece
-                black_promotion = file + '1 = ' + piece
-
-                all_moves_list.extend([white_promotion, black_promotion])
-
-                # capture promotions
-                if file == 'A':
-                    white_move = file + ' takes b8 = ' + piece
-                    black_move = file + ' takes b1 = ' + piece
-                    all_moves_list.extend([white_move, black_move])
-                elif file == 'H':
-                    white_move = file + 'takes g8 = ' + piece
-                    black_move = file + 'takes g1 = ' + piece
-                    all_moves_list.extend([white_move, black_move])
-                else:
-                    file_index = files.index(file)
-                    white_move_1 = file + ' takes ' + files[file_index + 1] + '8 = ' + piece
-                    white_move_2 = file + ' takes ' + files[file_index - 1] + '8 = ' + piece
-                    black_move_1 = file + ' takes ' + files[file_index + 1] + '1 = ' + piece
-                    black_move_2 = file + ' takes ' + files[file_index - 1] + '1 = ' + piece
-                    all_moves_list.extend([white_move_1, white_move_2, black_move_1, black_move_2])
+    return [entry.voices[0] for entry in generate_moves()]
 
-    # castling
-    all_moves_list.append('short castle')
-    all_moves_list.append('long castle')
+def spoken_to_text(voice_move: str) -> str:
+    """
+    Converts the spoken form of a move back to standard algebraic notation,
+    for example 'Knight takes E4 check' to 'Nxe4+'.
+
+    Parameters:
+    - voice_move (str): any spoken variant produced by generate_moves.
 
-    # as any move can be a check, create a duplicate of every move
-    # with the addition of a check
-    all_moves_list.extend([move + ' check' for move in all_moves_list])
+    Returns:
+    str: the move in standard algebraic notation.
+    """
 
-    return all_moves_list
+    for words, castle in SPOKEN_CASTLES.items():
+        voice_move = voice_move.replace(words, castle)
+    voice_move = voice_move.replace('promotes to', '=')
+    return ''.join(SPOKEN_SYMBOLS.get(word, word if word.startswith('O-O') else word.lower())
+                   for word in voice_move.split())
+
+
+class MoveVocabulary:
+    """
+    The frozen list of enumerated moves. Every move has a stable integer ID
+    and a default spoken form, and hash maps give constant time lookups from
+    the ID or either form of a move.
+
+    Parameters:
+    - move_ids [int]: the ID of every move, in increasing order.
+    - text_moves [str]: the moves in standard algebraic notation, in the same order.
+    - voice_moves [str]: the spoken form of each move, in the same order.
+    - version (int): the enumeration version the moves were produced by.
+    """
+
+    def __init__(self, move_ids: List[int], text_moves: List[str], voice_moves: List[str],
+                 version: int = VOCABULARY_VERSION):
+        self.version = version
+        self.move_ids: Tuple[int, ...] = tuple(move_ids)
+        self.text_moves: Tuple[str, ...] = tuple(text_moves)
+        self.voice_moves: Tuple[str, ...] = tuple(voice_moves)
+        self.position_by_id: Dict[int, int] = {move_id: position for position, move_id in enumerate(self.move_ids)}
+        self.id_by_text: Dict[str, int] = dict(zip(self.text_moves, self.move_ids))
+        self.id_by_voice: Dict[str, int] = dict(zip(self.voice_moves, self.move_ids))
+
+    def __len__(self) -> int:
+        return len(self.move_ids)
+
+    def __iter__(self) -> Iterator[Tuple[int, str, str]]:
+        return iter(zip(self.move_ids, self.text_moves, self.voice_moves))
+
+    def text(self, move_id: int) -> str:
+        return self.text_moves[self.position_by_id[move_id]]
+
+    def voice(self, move_id: int) -> str:
+        return self.voice_moves[self.position_by_id[move_id]]
+
+    def to_voice(self, text_move: str) -> str:
+        return self.voice(self.id_by_text[text_move])
+
+    def to_text(self, voice_move: str) -> str:
+        return self.text(self.id_by_voice[voice_move])
+
+    def digest(self) -> str:
+        """
+        Returns a hash of the moves, which changes if any ID or form does.
+        """
+
+        content = json.dumps([self.move_ids, self.text_moves, self.voice_moves]).encode('utf-8')
+        return hashlib.sha256(content).hexdigest()
+
+    def check_alignment(self) -> None:
+        """
+        Verifies that both forms of every move describe the same move and
+        that no form is listed twice.
+
+        Raises:
+        ValueError: describing the first few misaligned or duplicated moves.
+        """
+
+        problems = []
+        if not len(self.move_ids) == len(self.text_moves) == len(self.voice_moves):
+            problems.append(str(len(self.move_ids)) + ' move IDs, ' + str(len(self.text_moves)) + ' text moves and ' +
+                            str(len(self.voice_moves)) + ' voice moves')
+        if len(self.position_by_id) != len(self.move_ids):
+            problems.append(str(len(self.move_ids) - len(self.position_by_id)) + ' duplicated move IDs')
+        if len(self.id_by_text) != len(self.text_moves):
+            problems.append(str(len(self.text_moves) - len(self.id_by_text)) + ' duplicated text moves')
+        if len(self.id_by_voice) != len(self.voice_moves):
+            problems.append(str(len(self.voice_moves) - len(self.id_by_voice)) + ' duplicated voice moves')
+        for move_id, text_move, voice_move in self:
+            if spoken_to_text(voice_move) != text_move:
+                problems.append('move ' + str(move_id) + ' is ' + text_move + ' but spoken as \'' + voice_move + '\'')
+            if len(problems) >= 5:
+                break
+        if problems:
+            raise ValueError('Move vocabulary is misaligned: ' + '; '.join(problems))
+
+    def save(self, file_path: str = vocabulary_file_path) -> None:
+        with gzip.open(file_path, 'wt') as file:
+            json.dump({'version': self.version, 'digest': self.digest(), 'move_ids': self.move_ids,
+                       'text_moves': self.text_moves, 'voice_moves': self.voice_moves}, file, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, file_path: str = vocabulary_file_path) -> 'MoveVocabulary':
+        """
+        Reads a saved vocabulary.
+
+        Raises:
+        ValueError: if the file was written by another enumeration version or
+            has been modified since.
+        """
+
+        with gzip.open(file_path, 'rt') as file:
+            content = json.load(file)
+        if content.get('version') != VOCABULARY_VERSION:
+            raise ValueError('Move vocabulary ' + file_path + ' has version ' + str(content.get('version')) +
+                             ', expected ' + str(VOCABULARY_VERSION))
+        vocabulary = cls(content['move_ids'], content['text_moves'], content['voice_moves'], content['version'])
+        if vocabulary.digest() != content['digest']:
+            raise ValueError('Move vocabulary ' + file_path + ' does not match its digest')
+        return vocabulary
+
+
+def build_move_vocabulary() -> MoveVocabulary:
+    """
+    Enumerates every move of the grammar and checks the algebraic and spoken
+    forms line up.
+
+    Returns:
+    MoveVocabulary: the freshly enumerated moves.
+    """
+
+    move_ids, text_moves, voice_moves = [], [], []
+    for entry in generate_moves():
+        if any(spoken_to_text(voice) != entry.text for voice in entry.voices[1:]):
+            raise ValueError('Move ' + entry.text + ' has a misaligned spoken variant: ' + str(entry.voices))
+        move_ids.append(entry.move_id)
+        text_moves.append(entry.text)
+        voice_moves.append(entry.voices[0])
+    vocabulary = MoveVocabulary(move_ids, text_moves, voice_moves)
+    vocabulary.check_alignment()
+    return vocabulary
+
+
+_move_vocabulary: Optional[MoveVocabulary] = None
+
+def get_move_vocabulary() -> MoveVocabulary:
+    """
+    Returns the move vocabulary, loading the saved artifact the first time it
+    is needed. The artifact is never rebuilt here; run
+    'python text_move_enumerator.py --build-vocabulary' after changing the
+    grammar.
+
+    Returns:
+    MoveVocabulary: the enumerated moves.
+
+    Raises:
+    ValueError: if the artifact is missing, unreadable, of another version or
+        does not match its digest.
+    """
+
+    global _move_vocabulary
+
+    if _move_vocabulary is None:
+        try:
+            _move_vocabulary = MoveVocabulary.load()
+        except (OSError, ValueError, KeyError) as error:
+            raise ValueError('Could not load the move vocabulary (' + str(error) + '). Rebuild it with '
+                             '\'python text_move_enumerator.py --build-vocabulary\'') from error
+    return _move_vocabulary
 
 if __name__ == "__main__":
     """
-    Main function used only to test the functions in this file
+    Main function used to check moves against the vocabulary artifact. Pass
+    --build-vocabulary to rebuild the artifact from the grammar and save it
+    first.
     """
 
-    moves = get_all_voice_moves()
+    if '--build-vocabulary' in sys.argv[1:]:
+        vocabulary = build_move_vocabulary()
+        vocabulary.save()
+        print('Saved ' + str(len(vocabulary)) + ' moves, version ' + str(vocabulary.version) + ', to ' +
+              vocabulary_file_path)
+    else:
+        vocabulary = get_move_vocabulary()
     count = 0
-    for move in moves:
+    for move in vocabulary.voice_moves:
         count += len(move)
-    print('All moves comprise ' + str(count) + ' characters.')
-    
-    
\ No newline at end of file
+    print('All spoken moves comprise ' + str(count) + ' characters.')
+    run_move_checker(vocabulary)
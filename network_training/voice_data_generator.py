@@ -1,49 +1,33 @@
-from contextlib import closing
+import multiprocessing
 import os
+import queue
+import signal
 import time
-from typing import List
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
 import sys
-import uuid
 
-import boto3
-from botocore.exceptions import BotoCoreError, ClientError
-from gtts import gTTS
-from pydub import AudioSegment
 import pyttsx3
+from augmentation import AugmentationPlan, load_render, variant_names, write_variants
+from cloud_synthesis import GttsProvider, PollyProvider, SynthesisRequest, synthesize_all
+from synthesis_manifest import SynthesisManifest, synthesis_key
 from text_move_enumerator import *
 
 move_files_directory: str = 'move_files'
-all_text_moves = get_all_text_moves()
-all_voice_moves = get_all_voice_moves()
 
-def change_pitch(input_file, output_file, semitones):
-    """
-    Changes the pitch of the provided audio file by the
-    number of provided semitones.
-    
-    Parameters
-        input_file (str): the os.path to the audio file to read in
-        output_file (str): the os.path of the file to which the
-            audio should be written.
-        semitones (int): the number of semitones by which the
-            pitch of the input file should be changed.    
-    """
-    # Load the audio file
-    audio = AudioSegment.from_file(input_file, format="wav")
-
-    # Change the pitch
-    audio = audio._spawn(audio.raw_data, overrides={
-        "frame_rate": int(audio.frame_rate * (2 ** (semitones / 12.0)))
-    })
-
-    # Export the modified audio to a new file
-    audio.export(output_file, format="wav")
+# -- Speech Parameters for pyttsx3 --
+pyttsx3_rates: List[int] = list(range(200, 301, 10))
+pyttsx3_pitches: List[int] = list(range(-4, 5, 1))
+# variants derived from every pyttsx3 render; add tempos, noise_snrs or
+# rooms to grow the dataset without further TTS calls
+pyttsx3_augmentation: AugmentationPlan = AugmentationPlan(pitches=tuple(pyttsx3_pitches))
 
 def generate_gtts_files():
     """
     Generates and saves audio files for all enumerated chess moves
     using the gTTS engine. Parameters of the engine are varied to
-    produce the maximum number files per move possible.
+    produce the maximum number files per move possible. Requests are
+    sent concurrently at the gTTS quota, skipping files recorded in the
+    manifest by an earlier run.
     """
 
     # -- Speech Parameters for gTTS --
@@ -51,67 +35,278 @@ def generate_gtts_files():
     tlds: List[str] = ['com.au', 'us', 'co.in', 'ie']
     speeds: List[bool] = [True, False]
 
-    for move_index in range(0, len(all_voice_moves)):
-        move = all_voice_moves[move_index]
+    with SynthesisManifest(move_files_directory) as manifest:
         for speed in speeds:
             for tld in tlds:
+                file_prefix = tld + ('-slow' if speed else '')
+                requests = (gtts_request(move, text_move, tld, speed, file_prefix)
+                            for move_id, text_move, move in get_move_vocabulary())
+                print(synthesize_all(GttsProvider(tld, speed), requests, manifest=manifest))
+
+def gtts_request(move: str, text_move: str, tld: str, speed: bool, file_prefix: str) -> SynthesisRequest:
+    # files are named after the content address of their audio, so a rerun
+    # writes the same names rather than duplicates
+    key = synthesis_key('gtts', move, tld=tld, slow=speed)
+    return SynthesisRequest(move, os.path.join(move_files_directory, text_move, file_prefix + '-' + key[:12] + '.wav'),
+                            key, {'tld': tld, 'slow': speed})
+
+class SynthesisJob(NamedTuple):
+    """
+    A single pyttsx3 render, from which every augmented variant is derived.
+
+    Fields
+        text_move (str): the move in algebraic notation, naming its directory
+        spoken_move (str): the text passed to the TTS engine
+        voice_id (str): the pyttsx3 voice to use
+        rate (int): the speaking rate in words per minute
+    """
+
+    text_move: str
+    spoken_move: str
+    voice_id: str
+    rate: int
+
+    def file_prefix(self) -> str:
+        file_name = os.path.basename(self.voice_id)
+        file_name += '-rate-' + str(self.rate)
+        return os.path.join(move_files_directory, self.text_move, file_name)
 
-                tts = gTTS(move, lang='en', tld=tld, slow=speed, lang_check=True)
 
-                file_name = move + '-' +str(uuid.uuid1().fields[0])
-                file_name = os.path.join(move_files_directory, all_text_moves[move_index], file_name)
-                tts.save(file_name + '.mp3')
+def pyttsx3_keys(job: SynthesisJob, plan: AugmentationPlan) -> Tuple[str, Dict[str, str]]:
+    """
+    Returns the key of a job's raw render and the key of each of its variants.
+    """
+
+    parameters = {'voice': job.voice_id, 'rate': job.rate}
+    render_key = synthesis_key('pyttsx3', job.spoken_move, **parameters)
+    return render_key, {name: synthesis_key('pyttsx3', job.spoken_move, variant=name, **parameters)
+                        for name in variant_names(plan)}
+
+
+def render_pyttsx3_job(engine, job: SynthesisJob, plan: AugmentationPlan,
+                       manifest: Optional[SynthesisManifest] = None) -> Dict[str, str]:
+    """
+    Renders a job once and writes every variant of the augmentation plan,
+    derived in memory from that render. With a manifest, variants which were
+    already written are skipped and the raw render is cached, so that a
+    changed plan only repeats the augmentation.
+
+    Parameters
+        engine: an initialized pyttsx3 engine
+        job (SynthesisJob): the render to perform
+        plan (AugmentationPlan): the variants to write
+        manifest (SynthesisManifest): the record of finished work, if any
+
+    Returns
+        {str: str}: the path of each written variant, by variant name
+    """
 
-                # gTTS only saves as mp3, so convert to wav afterwards
-                sound = AudioSegment.from_mp3(file_name)
-                sound.export(os.path.basename(file_name) + '.wav', format='wav')
+    file_prefix = job.file_prefix()
+    render_key, variant_keys = pyttsx3_keys(job, plan)
+    missing = set(variant_keys)
+    if manifest is not None:
+        done = manifest.done_keys(variant_keys.values())
+        missing = {name for name, key in variant_keys.items() if key not in done}
+        if not missing:
+            return {}
+
+    render_file = manifest.cached_render(render_key) if manifest is not None else None
+    if render_file is None:
+        render_file = manifest.cache_path(render_key) if manifest is not None else file_prefix + '-render.wav'
+        os.makedirs(os.path.dirname(render_file), exist_ok=True)
+        engine.setProperty('voice', job.voice_id)
+        engine.setProperty('rate', job.rate)
+        engine.save_to_file(job.spoken_move, render_file)
+        engine.runAndWait()
+        if manifest is not None:
+            manifest.record_render(render_key, 'pyttsx3', job.spoken_move, render_file,
+                                   {'voice': job.voice_id, 'rate': job.rate})
+
+    samples, sample_rate = load_render(render_file)
+    if manifest is None:
+        os.remove(render_file)
+    # seeding from the render keeps the noise of every variant reproducible
+    paths = write_variants(file_prefix, samples, sample_rate, plan, seed=int(render_key[:8], 16), names=missing)
+    if manifest is not None:
+        with manifest.transaction():
+            for name, path in paths.items():
+                manifest.record_output(variant_keys[name], path, render_key,
+                                       {'voice': job.voice_id, 'rate': job.rate, 'variant': name})
+    return paths
 
-        # gTTS has a usage quota currently set at 900 reqs/min
-        # (https://cloud.google.com/speech-to-text/quotas)
-        # Adding brief pauses to avoid exceeding this limit
-        time.sleep(1.0)
 
 def generate_pyttsx3_files():
     """
     Generates and saves audio files for all enumerated chess moves
     using the pyttsx3 engine. Parameters of the engine are varied to
-    produce a large number files per move.
+    produce a large number files per move, and each render is further
+    augmented in memory according to pyttsx3_augmentation. Work recorded
+    in the manifest by an earlier run is skipped.
     """
 
     engine = pyttsx3.init()
-    voices = engine.getProperty('voices')
-    rates: List[int] = list(range(200, 301, 10))
-    pitches: List[int] = list(range(-4, 5, 1))
+    voice_ids = [voice.id for voice in engine.getProperty('voices')]
 
-    for move_index in range(0, len(all_voice_moves)):
-        move = all_voice_moves[move_index]
-        for voice in voices:
-            for rate in rates:
-                for pitch in pitches:
-                    engine.setProperty('voice', voice.id)
-                    engine.setProperty('rate', rate)
+    with SynthesisManifest(move_files_directory) as manifest:
+        for job in pyttsx3_jobs(voice_ids):
+            render_pyttsx3_job(engine, job, pyttsx3_augmentation, manifest)
 
-                    file_name = os.path.basename(voice.id)
-                    file_name += '-rate-' + str(rate)
-                    file_name += '-pitch-' + str(pitch)
-                    file_name += '.wav'
-                    file_name = os.path.join(move_files_directory, all_text_moves[move_index], file_name)
 
-                    if not os.path.isdir(os.path.join(move_files_directory, all_text_moves[move_index])):
-                        os.mkdir(os.path.join(move_files_directory, all_text_moves[move_index]))
+def pyttsx3_jobs(voice_ids: List[str]) -> Iterator[SynthesisJob]:
+    """
+    Lazily enumerates the (move, voice, rate) job space of the pyttsx3
+    generator.
+    """
 
-                    engine.save_to_file(move, file_name)
+    for move_id, text_move, move in get_move_vocabulary():
+        for voice_id in voice_ids:
+            for rate in pyttsx3_rates:
+                yield SynthesisJob(text_move, move, voice_id, rate)
 
-                    engine.runAndWait()
 
-                    change_pitch(file_name, file_name, pitch)
+def _pyttsx3_worker(worker_id: int, jobs: multiprocessing.Queue, progress: multiprocessing.Queue,
+                    stop_event: multiprocessing.Event, plan: AugmentationPlan, dataset_dir: str):
+    """
+    Renders jobs from the job queue with this worker's own pyttsx3 engine
+    until a None job arrives or the stop event is set. Every finished job is
+    reported as a (worker id, succeeded) pair on the progress queue.
+    """
+
+    # the parent process decides how to handle Ctrl-C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    engine = pyttsx3.init()
+    manifest = SynthesisManifest(dataset_dir)
+
+    while not stop_event.is_set():
+        try:
+            job = jobs.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if job is None:
+            break
+
+        try:
+            render_pyttsx3_job(engine, job, plan, manifest)
+            progress.put((worker_id, True))
+        except Exception as error:
+            print('Worker ' + str(worker_id) + ' failed on ' + job.file_prefix() + ': ' + str(error))
+            progress.put((worker_id, False))
+    manifest.close()
+
+
+def generate_pyttsx3_files_parallel(workers: Optional[int] = None, queue_size: int = 0,
+                                    report_interval: float = 10.0):
+    """
+    Generates the same files as generate_pyttsx3_files, spread over a pool of
+    processes with one pyttsx3 engine each. Jobs are handed out through a
+    bounded queue, so the job space is never materialized and faster workers
+    simply take more jobs. Ctrl-C stops every worker after its current job.
+
+    Parameters
+        workers (int): the number of worker processes, the core count if None
+        queue_size (int): the most jobs waiting to be picked up, four per
+            worker if 0
+        report_interval (float): seconds between progress reports
+    """
+
+    workers = workers or os.cpu_count() or 1
+    queue_size = queue_size or 4 * workers
+    voice_ids = [voice.id for voice in pyttsx3.init().getProperty('voices')]
+
+    # TTS drivers do not survive a fork, so workers start from a fresh interpreter
+    context = multiprocessing.get_context('spawn')
+    jobs = context.Queue(maxsize=queue_size)
+    progress = context.Queue()
+    stop_event = context.Event()
+    processes = [context.Process(target=_pyttsx3_worker, daemon=True,
+                                 args=(worker_id, jobs, progress, stop_event, pyttsx3_augmentation,
+                                       move_files_directory))
+                 for worker_id in range(workers)]
+    for process in processes:
+        process.start()
+
+    completed: Dict[int, int] = {worker_id: 0 for worker_id in range(workers)}
+    failed: Dict[int, int] = {worker_id: 0 for worker_id in range(workers)}
+    start = time.monotonic()
+    next_report = start + report_interval
+
+    def drain_progress():
+        nonlocal next_report
+        while True:
+            try:
+                worker_id, succeeded = progress.get_nowait()
+            except queue.Empty:
+                break
+            completed[worker_id] += succeeded
+            failed[worker_id] += not succeeded
+        if time.monotonic() >= next_report:
+            next_report += report_interval
+            total = sum(completed.values())
+            print('{} renders in {:.0f} s ({:.1f}/s), {} failed; per worker: {}'.format(
+                total, time.monotonic() - start, total / (time.monotonic() - start),
+                sum(failed.values()), completed))
+
+    def put_job(job: Optional[SynthesisJob]):
+        # a full queue nobody is left to empty would block forever, such as
+        # when every worker failed to start its engine
+        while True:
+            try:
+                jobs.put(job, timeout=0.5)
+                return
+            except queue.Full:
+                drain_progress()
+                if not any(process.is_alive() for process in processes):
+                    raise RuntimeError('Every pyttsx3 worker has exited, ' + str(sum(completed.values())) +
+                                       ' renders completed')
+
+    manifest = SynthesisManifest(move_files_directory)
+    skipped = 0
+    finished = False
+    try:
+        for job in pyttsx3_jobs(voice_ids):
+            # finished jobs never reach the workers
+            variant_keys = pyttsx3_keys(job, pyttsx3_augmentation)[1]
+            if len(manifest.done_keys(variant_keys.values())) == len(variant_keys):
+                skipped += 1
+                continue
+            put_job(job)
+        for _ in processes:
+            put_job(None)
+        # every worker exits once it takes its None job, but cannot while its
+        # progress reports are unread
+        while any(process.is_alive() for process in processes):
+            drain_progress()
+            time.sleep(0.1)
+        finished = True
+    except KeyboardInterrupt:
+        print('Cancelling, waiting for running renders to finish...')
+    finally:
+        if not finished:
+            # stopped workers exit after their current job; one stuck in a
+            # render is abandoned after 30 s
+            stop_event.set()
+            jobs.cancel_join_thread()
+            deadline = time.monotonic() + 30.0
+            while any(process.is_alive() for process in processes) and time.monotonic() < deadline:
+                drain_progress()
+                time.sleep(0.1)
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+        for process in processes:
+            process.join()
+        next_report = time.monotonic()
+        drain_progress()
+        manifest.close()
+        print(str(skipped) + ' renders were already complete')
 
 
 def generate_polly_files():
     """
     Generates and saves audio files for all enumerated chess moves
-    using the pyttsx3 engine. Parameters of the engine are varied to
-    produce a large number files per move.
+    using Amazon Polly. Requests are sent concurrently through a pooled
+    client at the Polly quota, skipping files recorded in the manifest by
+    an earlier run.
 
         ------------------- WARNING -------------------
     Amazon Polly operates on a pay-per system which can involve charges
@@ -119,54 +314,16 @@ def generate_polly_files():
     within your usage limits before starting conversions.
     """
 
-    session = boto3.Session(profile_name='adminuser')
-    engine = boto3.client('polly', 'us-east-1')
-
     voices = ['Geraint']
-    moves = ['hello world']
-
-    try:
+    concurrency = 16
 
-        for move_index in range(0, len(all_voice_moves)):
-            move = all_voice_moves[move_index]
-            for voice in voices:
-
-                        file_name = os.path.basename(voice)
-                        file_name += '.mp3'
-                        file_name = os.path.join(move_files_directory, all_text_moves[move_index], file_name)
-
-                        if not os.path.isdir(os.path.join(move_files_directory, all_text_moves[move_index])):
-                            os.mkdir(os.path.join(move_files_directory, all_text_moves[move_index]))
-
-                        response = engine.synthesize_speech(Text=move, OutputFormat="mp3",
-                            VoiceId=voice)
-                        
-                        # Access the audio stream from the response
-                        if "AudioStream" in response:
-                            # Note: Closing the stream is important because the service throttles on the
-                            # number of parallel connections. Here we are using contextlib.closing to
-                            # ensure the close method of the stream object will be called automatically
-                            # at the end of the with statement's scope.
-                                with closing(response["AudioStream"]) as stream:
-                                    output = file_name
-
-                                try:
-                                    # Open a file for writing the output as a binary stream
-                                    with open(output, "wb") as file:
-                                        file.write(stream.read())
-                                except IOError as error:
-                                    # Could not write to file, exit gracefully
-                                    print(error)
-                                    sys.exit(-1)
-
-                        else:
-                            # The response didn't contain audio data, exit gracefully
-                            print("Could not stream audio")
-                            sys.exit(-1)
-
-    except (BotoCoreError, ClientError) as error:
-        print(error)
-        sys.exit(-1)
+    with SynthesisManifest(move_files_directory) as manifest:
+        for voice in voices:
+            requests = (SynthesisRequest(move, os.path.join(move_files_directory, text_move, voice + '.wav'),
+                                         synthesis_key('polly', move, voice=voice), {'voice': voice})
+                        for move_id, text_move, move in get_move_vocabulary())
+            print(synthesize_all(PollyProvider(voice, max_connections=concurrency), requests,
+                                 concurrency=concurrency, manifest=manifest))
 
 
 if __name__ == "__main__":
@@ -174,4 +331,14 @@ if __name__ == "__main__":
     if not os.path.isdir(move_files_directory):
         os.mkdir(move_files_directory)
 
-    generate_pyttsx3_files()
\ No newline at end of file
+    # pass --gtts or --polly to use a cloud engine, or --parallel [workers]
+    # to spread the pyttsx3 renders over several processes
+    if '--gtts' in sys.argv:
+        generate_gtts_files()
+    elif '--polly' in sys.argv:
+        generate_polly_files()
+    elif '--parallel' in sys.argv:
+        arguments = sys.argv[sys.argv.index('--parallel') + 1:]
+        generate_pyttsx3_files_parallel(int(arguments[0]) if arguments and arguments[0].isdigit() else None)
+    else:
+        generate_pyttsx3_files()
\ No newline at end of file